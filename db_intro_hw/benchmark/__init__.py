@@ -0,0 +1,24 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, Tuple
+
+
+class Index(ABC):
+    """Common interface of the benchmarked index structures over integer keys"""
+    name = "index"
+
+    @abstractmethod
+    def insert(self, key: int, data: Any = None) -> None:
+        ...
+
+    @abstractmethod
+    def find(self, key: int) -> Any:
+        """Returns data stored under the key, raises an exception when the key is missing"""
+        ...
+
+    def insert_many(self, items: Iterable[Tuple[int, Any]]) -> None:
+        for key, data in items:
+            self.insert(key, data)
+
+    def stats(self) -> Dict[str, float]:
+        """Structural statistics, like load factor or tree height"""
+        return {}
@@ -0,0 +1,172 @@
+from bisect import bisect_left
+from dataclasses import asdict
+from typing import Any, Callable, Dict, Iterable, Tuple
+
+from db_intro_hw.benchmark import Index
+from db_intro_hw.hw2 import Record
+from db_intro_hw.hw2.cormack import Cormack
+from db_intro_hw.hw2.fagin import Fagin, Page as FaginPage
+from db_intro_hw.hw2.larson_kajla import LarsonKajla, Page as LarsonKajlaPage
+from db_intro_hw.hw2.linear_hashing import LinearHashing, Page as LinearHashingPage
+from db_intro_hw.hw3.b_tree import BStarTree, NonRedundantBTree, RedundantBTree
+
+
+class CormackIndex(Index):
+    name = "cormack"
+
+    def __init__(self):
+        self.table = Cormack()
+        self.n = 0
+
+    def insert(self, key: int, data: Any = None) -> None:
+        self.table.insert(Record(key, data))
+        self.n += 1
+
+    def find(self, key: int) -> Any:
+        rec = self.table.lookup(key)
+        if rec is None:
+            raise Exception(f"No record with key {key} found!")
+        return rec.data
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "directory_size": self.table.directory_size,
+            "primary_file_used": self.table.free_space_ptr,
+            "load_factor": self.n / max(1, self.table.free_space_ptr),
+        }
+
+
+class FaginIndex(Index):
+    name = "fagin"
+
+    def __init__(self):
+        self.table = Fagin()
+
+    def insert(self, key: int, data: Any = None) -> None:
+        self.table.insert(Record(key, data))
+
+    def insert_many(self, items: Iterable[Tuple[int, Any]]) -> None:
+        self.table.insert_many(Record(key, data) for key, data in items)
+
+    def find(self, key: int) -> Any:
+        return self.table.find(key).data
+
+    def stats(self) -> Dict[str, float]:
+        pages = {id(p): p for p in self.table.pointers}.values()
+        return {
+            "global_depth": self.table.global_depth,
+            "directory_size": len(self.table.pointers),
+            "pages": len(pages),
+            "load_factor": sum(len(p.data) for p in pages) / (len(pages) * FaginPage.PAGE_SIZE),
+        }
+
+
+class LarsonKajlaIndex(Index):
+    name = "larson_kajla"
+
+    def __init__(self):
+        self.table = LarsonKajla()
+        self.n = 0
+
+    def insert(self, key: int, data: Any = None) -> None:
+        self.table.insert(Record(key, data))
+        self.n += 1
+
+    def find(self, key: int) -> Any:
+        return self.table.find(key).data
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "pages": self.table.n_pages,
+            "load_factor": self.n / (self.table.n_pages * LarsonKajlaPage.PAGE_SIZE),
+            "avg_probes": self.table.table.avg_probes,
+        }
+
+
+class LinearHashingIndex(Index):
+    name = "linear_hashing"
+
+    def __init__(self):
+        self.table = LinearHashing()
+        self.n = 0
+
+    def insert(self, key: int, data: Any = None) -> None:
+        self.table.insert(Record(key, data))
+        self.n += 1
+
+    def find(self, key: int) -> Any:
+        return self.table.find(key).data
+
+    def stats(self) -> Dict[str, float]:
+        chains = [len(b.page_chain) for b in self.table.buckets]
+        return {
+            "buckets": len(chains),
+            "m": self.table.m,
+            "p": self.table.p,
+            "pages": sum(chains),
+            "max_chain_length": max(chains),
+            "avg_chain_length": sum(chains) / len(chains),
+            "load_factor": self.n / (len(chains) * LinearHashingPage.PAGE_SIZE),
+        }
+
+
+class TreeIndex(Index):
+    """Adapter for the in-memory non-redundant B-trees, which only store keys"""
+    tree_factory: Callable[[], NonRedundantBTree]
+
+    def __init__(self):
+        self.tree = self.tree_factory()
+
+    def insert(self, key: int, data: Any = None) -> None:
+        self.tree.insert(key)
+
+    def find(self, key: int) -> Any:
+        node = self.tree.find(key)
+        idx = bisect_left(node.keys, key)
+        if idx == len(node.keys) or node.keys[idx] != key:
+            raise Exception(f"No record with key {key} found!")
+        return key
+
+    def stats(self) -> Dict[str, float]:
+        return asdict(self.tree.stats())
+
+
+class NonRedundantBTreeIndex(TreeIndex):
+    name = "b_tree"
+    tree_factory = NonRedundantBTree
+
+
+class BStarTreeIndex(TreeIndex):
+    name = "b_star_tree"
+    tree_factory = BStarTree
+
+
+class RedundantBTreeIndex(Index):
+    """Adapter for the B+-tree, which keeps the data in its leaves"""
+    name = "redundant_b_tree"
+
+    def __init__(self):
+        self.tree = RedundantBTree()
+
+    def insert(self, key: int, data: Any = None) -> None:
+        self.tree.insert(key, data)
+
+    def find(self, key: int) -> Any:
+        return self.tree.lookup(key)
+
+    def stats(self) -> Dict[str, float]:
+        return asdict(self.tree.stats())
+
+
+INDEXES = {
+    cls.name: cls
+    for cls in [
+        CormackIndex,
+        FaginIndex,
+        LarsonKajlaIndex,
+        LinearHashingIndex,
+        NonRedundantBTreeIndex,
+        BStarTreeIndex,
+        RedundantBTreeIndex,
+    ]
+}
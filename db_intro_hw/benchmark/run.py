@@ -0,0 +1,136 @@
+"""Cross-structure benchmark of the hash and tree indexes.
+
+Usage: python -m db_intro_hw.benchmark.run [--indexes ...] [--workloads ...] [--sizes ...] [--output results.json]
+
+For every (index, workload, size) combination, the keys are inserted one by one with per-operation timing,
+then the lookup keys are searched for. Peak memory is measured by a second build through insert_many under tracemalloc.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+from db_intro_hw.benchmark import Index
+from db_intro_hw.benchmark.indexes import INDEXES
+from db_intro_hw.benchmark.workloads import GENERATORS, Workload, make_workload
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+def percentile(sorted_values: List[int], q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def timed_ops(op, keys: List[int], deadline_ns: int) -> Dict[str, float]:
+    """Calls op(key) for every key, returns throughput and latency percentiles in microseconds"""
+    latencies = []
+    clock = time.perf_counter_ns
+    start = clock()
+    for i, key in enumerate(keys):
+        t0 = clock()
+        op(key)
+        t1 = clock()
+        latencies.append(t1 - t0)
+
+        if t1 > deadline_ns:
+            raise BudgetExceeded(f"time budget exceeded after {i + 1} operations")
+
+    elapsed = (clock() - start) / 1e9
+    latencies.sort()
+    return {
+        "ops_per_s": len(keys) / elapsed if elapsed > 0 else float("inf"),
+        "p50_us": percentile(latencies, 0.50) / 1000,
+        "p99_us": percentile(latencies, 0.99) / 1000,
+    }
+
+
+def peak_memory(index_cls, workload: Workload) -> Dict[str, float]:
+    """Builds the index once more through insert_many and reports the peak of traced allocations"""
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        index = index_cls()
+        index.insert_many((k, None) for k in workload.insert_keys)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"peak_memory_bytes": peak, "bulk_insert_ops_per_s": len(workload.insert_keys) / elapsed}
+
+
+def run_one(index_cls, workload: Workload, budget_s: float, measure_memory: bool) -> Dict[str, Any]:
+    result: Dict[str, Any] = {
+        "index": index_cls.name,
+        "workload": workload.name,
+        "n": len(workload.insert_keys),
+    }
+
+    try:
+        deadline = time.perf_counter_ns() + int(budget_s * 1e9)
+        index: Index = index_cls()
+        result["insert"] = timed_ops(index.insert, workload.insert_keys, deadline)
+        result["lookup"] = timed_ops(index.find, workload.lookup_keys, deadline)
+        result["structure"] = index.stats()
+        if measure_memory:
+            result.update(peak_memory(index_cls, workload))
+    except BudgetExceeded as e:
+        result["error"] = str(e)
+    except Exception as e:
+        # some structures have a fixed capacity and simply fail on bigger inputs
+        result["error"] = f"{type(e).__name__}: {e}"
+
+    return result
+
+
+def format_row(r: Dict[str, Any]) -> str:
+    head = f"{r['index']:<18}{r['workload']:<13}{r['n']:>10}"
+    if "error" in r:
+        return f"{head}  {r['error']}"
+    ins, look = r["insert"], r["lookup"]
+    return (f"{head}{ins['ops_per_s']:>12.0f}{ins['p50_us']:>9.1f}{ins['p99_us']:>9.1f}"
+            f"{look['ops_per_s']:>12.0f}{look['p50_us']:>9.1f}{look['p99_us']:>9.1f}"
+            f"{r.get('peak_memory_bytes', 0) / 2**20:>10.1f}")
+
+
+def main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--indexes", nargs="+", choices=sorted(INDEXES), default=sorted(INDEXES))
+    parser.add_argument("--workloads", nargs="+", choices=sorted(GENERATORS), default=sorted(GENERATORS))
+    parser.add_argument("--sizes", nargs="+", type=lambda s: int(float(s)), default=[1000, 10_000, 100_000],
+                        help="numbers of keys, between 1e3 and 1e7")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--budget", type=float, default=60.0, help="time budget in seconds for one build + lookups")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc build")
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args(argv)
+
+    print(f"{'index':<18}{'workload':<13}{'n':>10}{'ins op/s':>12}{'p50 us':>9}{'p99 us':>9}"
+          f"{'find op/s':>12}{'p50 us':>9}{'p99 us':>9}{'peak MiB':>10}")
+
+    results = []
+    for n in args.sizes:
+        for workload_name in args.workloads:
+            workload = make_workload(workload_name, n, args.seed)
+            for index_name in args.indexes:
+                r = run_one(INDEXES[index_name], workload, args.budget, not args.no_memory)
+                print(format_row(r), flush=True)
+                results.append(r)
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "results": results,
+        }, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,69 @@
+import random
+from dataclasses import dataclass
+from typing import Callable, Dict, List
+
+
+# upper bound of the key space of the uniform workload
+KEY_SPACE = 2**40
+
+# adversarial keys share this many zero low bits, which is exactly what Fagin and linear hashing route on
+ADVERSARIAL_SHIFT = 8
+
+# lookups are capped, so that the biggest workloads don't spend most of the time in lookups
+MAX_LOOKUPS = 100_000
+
+
+@dataclass
+class Workload:
+    name: str
+    # distinct keys in insertion order
+    insert_keys: List[int]
+    # keys to look up, all of them have been inserted
+    lookup_keys: List[int]
+
+
+def uniform(n: int, rnd: random.Random) -> List[int]:
+    return rnd.sample(range(KEY_SPACE), n)
+
+
+def sequential(n: int, rnd: random.Random) -> List[int]:
+    return list(range(n))
+
+
+def zipf(n: int, rnd: random.Random) -> List[int]:
+    """Distinct keys drawn from a Zipf (s=1) distribution over [1, n^2], most of them are small and close together"""
+    domain = max(n, 10) ** 2
+    keys: Dict[int, None] = {}
+    while len(keys) < n:
+        # inverse of the continuous CDF ln(k) / ln(domain)
+        keys[int(domain ** rnd.random())] = None
+    return list(keys)
+
+
+def adversarial(n: int, rnd: random.Random) -> List[int]:
+    """Distinct keys, whose low ADVERSARIAL_SHIFT bits are all zero"""
+    keys = [i << ADVERSARIAL_SHIFT for i in range(n)]
+    rnd.shuffle(keys)
+    return keys
+
+
+GENERATORS: Dict[str, Callable[[int, random.Random], List[int]]] = {
+    "uniform": uniform,
+    "sequential": sequential,
+    "zipf": zipf,
+    "adversarial": adversarial,
+}
+
+
+def make_workload(name: str, n: int, seed: int = 0) -> Workload:
+    rnd = random.Random(seed)
+    keys = GENERATORS[name](n, rnd)
+    n_lookups = min(n, MAX_LOOKUPS)
+
+    if name == "zipf":
+        # skewed lookups as well - the i-th inserted key is looked up with probability ~ 1/i
+        lookups = [keys[int(n ** rnd.random()) - 1] for _ in range(n_lookups)]
+    else:
+        lookups = rnd.sample(keys, n_lookups)
+
+    return Workload(name, keys, lookups)
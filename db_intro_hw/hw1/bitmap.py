@@ -0,0 +1,252 @@
+from __future__ import annotations
+from array import array
+from bisect import bisect_left
+from typing import Callable, Dict, Hashable, Iterable, Iterator, List, Union
+
+from db_intro_hw.hw1 import PersonRecord
+
+
+# roaring-style layout: record ids are split by their high 16 bits into chunks of 2^16 ids,
+# every chunk is stored in its own container
+CHUNK_BITS = 16
+CHUNK_SIZE = 1 << CHUNK_BITS
+CHUNK_BYTES = CHUNK_SIZE // 8
+
+# sparse chunks are sorted arrays of the low 16 bits, chunks with more ids than this are bitsets,
+# at this point both take the same 8 KiB
+ARRAY_MAX = 4096
+
+# a container is either array('H') of sorted low bits or a bytearray with one bit per id of the chunk,
+# the bitsets are turned into Python ints for the logical operations
+Container = Union[array, bytearray]
+
+
+def to_bits(c: Container) -> int:
+    if isinstance(c, bytearray):
+        return int.from_bytes(c, "little")
+    buf = bytearray(CHUNK_BYTES)
+    for v in c:
+        buf[v >> 3] |= 1 << (v & 7)
+    return int.from_bytes(buf, "little")
+
+
+def to_array(c: Container) -> array:
+    if isinstance(c, array):
+        return c
+    out = array("H")
+    buf = c
+    for byte_idx in range(CHUNK_BYTES):
+        byte = buf[byte_idx]
+        if byte:
+            base = byte_idx << 3
+            for bit in range(8):
+                if byte >> bit & 1:
+                    out.append(base | bit)
+    return out
+
+
+def popcount(c: Container) -> int:
+    if isinstance(c, bytearray):
+        return bin(to_bits(c)).count("1")
+    return len(c)
+
+
+def from_bits(bits: int) -> Container:
+    """Container of the bitset, in the smaller of the two representations"""
+    c = bytearray(bits.to_bytes(CHUNK_BYTES, "little"))
+    return to_array(c) if bin(bits).count("1") <= ARRAY_MAX else c
+
+
+class Bitmap:
+    """Compressed set of record ids"""
+
+    def __init__(self):
+        # high bits -> container, empty containers are never stored
+        self.containers: Dict[int, Container] = {}
+
+    def add(self, rid: int) -> None:
+        high, low = rid >> CHUNK_BITS, rid & (CHUNK_SIZE - 1)
+        c = self.containers.get(high)
+        if c is None:
+            self.containers[high] = array("H", [low])
+        elif isinstance(c, bytearray):
+            c[low >> 3] |= 1 << (low & 7)
+        else:
+            # appending ids in increasing order is the common case
+            if not c or c[-1] < low:
+                c.append(low)
+            else:
+                idx = bisect_left(c, low)
+                if idx < len(c) and c[idx] == low:
+                    return
+                c.insert(idx, low)
+            if len(c) > ARRAY_MAX:
+                self.containers[high] = bytearray(to_bits(c).to_bytes(CHUNK_BYTES, "little"))
+
+    def __contains__(self, rid: int) -> bool:
+        c = self.containers.get(rid >> CHUNK_BITS)
+        if c is None:
+            return False
+        low = rid & (CHUNK_SIZE - 1)
+        if isinstance(c, bytearray):
+            return bool(c[low >> 3] >> (low & 7) & 1)
+        idx = bisect_left(c, low)
+        return idx < len(c) and c[idx] == low
+
+    def __len__(self) -> int:
+        return sum(popcount(c) for c in self.containers.values())
+
+    def count(self) -> int:
+        return len(self)
+
+    def __iter__(self) -> Iterator[int]:
+        """Record ids in increasing order"""
+        for high in sorted(self.containers):
+            c = self.containers[high]
+            base = high << CHUNK_BITS
+            for low in to_array(c):
+                yield base | low
+
+    def __and__(self, other: Bitmap) -> Bitmap:
+        result = Bitmap()
+        for high in self.containers.keys() & other.containers.keys():
+            a, b = self.containers[high], other.containers[high]
+            if isinstance(a, array) and isinstance(b, array):
+                c: Container = array("H", sorted(set(a).intersection(b)))
+            else:
+                c = from_bits(to_bits(a) & to_bits(b))
+            if len(c):
+                result.containers[high] = c
+        return result
+
+    def __or__(self, other: Bitmap) -> Bitmap:
+        result = Bitmap()
+        for high in self.containers.keys() | other.containers.keys():
+            a, b = self.containers.get(high), other.containers.get(high)
+            if a is None:
+                assert b is not None
+                result.containers[high] = b[:]
+            elif b is None:
+                result.containers[high] = a[:]
+            elif isinstance(a, array) and isinstance(b, array) and len(a) + len(b) <= ARRAY_MAX:
+                result.containers[high] = array("H", sorted(set(a).union(b)))
+            else:
+                result.containers[high] = from_bits(to_bits(a) | to_bits(b))
+        return result
+
+    def __sub__(self, other: Bitmap) -> Bitmap:
+        result = Bitmap()
+        for high, a in self.containers.items():
+            b = other.containers.get(high)
+            if b is None:
+                c = a[:]
+            else:
+                c = from_bits(to_bits(a) & ~to_bits(b))
+            if len(c):
+                result.containers[high] = c
+        return result
+
+    def complement(self, n: int) -> Bitmap:
+        """Record ids in [0, n), which are not in the bitmap"""
+        result = Bitmap()
+        for high in range((n + CHUNK_SIZE - 1) >> CHUNK_BITS):
+            # ids of this chunk, which are smaller than n
+            n_ids = min(CHUNK_SIZE, n - (high << CHUNK_BITS))
+            full = (1 << n_ids) - 1
+            c = self.containers.get(high)
+            bits = full if c is None else full & ~to_bits(c)
+            if bits:
+                result.containers[high] = from_bits(bits)
+        return result
+
+    def size_bytes(self) -> int:
+        """Payload size of the containers"""
+        return sum(CHUNK_BYTES if isinstance(c, bytearray) else 2 * len(c) for c in self.containers.values())
+
+    def __repr__(self):
+        return f"Bitmap - {len(self)} ids in {len(self.containers)} containers"
+
+
+def age_bucket(width: int = 10) -> Callable[[PersonRecord], Hashable]:
+    return lambda rec: rec.age // width
+
+
+def first_letter(rec: PersonRecord) -> Hashable:
+    return rec.name[:1]
+
+
+class BitmapIndex:
+    """One bitmap per value of a categorical attribute. Record ids are positions of the records,
+    i.e. the n-th appended record has id n, as in the primary file."""
+
+    def __init__(self, attribute: Callable[[PersonRecord], Hashable]):
+        self.attribute = attribute
+        self.bitmaps: Dict[Hashable, Bitmap] = {}
+        self.n_records = 0
+
+    def append(self, rec: PersonRecord) -> int:
+        rid = self.n_records
+        value = self.attribute(rec)
+        bitmap = self.bitmaps.get(value)
+        if bitmap is None:
+            bitmap = self.bitmaps[value] = Bitmap()
+        bitmap.add(rid)
+        self.n_records += 1
+        return rid
+
+    def extend(self, records: Iterable[PersonRecord]) -> None:
+        for rec in records:
+            self.append(rec)
+
+    def eq(self, value: Hashable) -> Bitmap:
+        return self.bitmaps.get(value, Bitmap())
+
+    def any_of(self, values: Iterable[Hashable]) -> Bitmap:
+        result = Bitmap()
+        for value in values:
+            result = result | self.eq(value)
+        return result
+
+    def not_(self, bitmap: Bitmap) -> Bitmap:
+        return bitmap.complement(self.n_records)
+
+    def values(self) -> List[Hashable]:
+        return list(self.bitmaps)
+
+    def size_bytes(self) -> int:
+        return sum(b.size_bytes() for b in self.bitmaps.values())
+
+
+if __name__ == "__main__":
+    import time
+
+    from db_intro_hw.hw1 import DATA_RECORDS
+    from db_intro_hw.hw1.generator import Distribution, PersonGenerator
+
+    by_decade = BitmapIndex(age_bucket(10))
+    by_letter = BitmapIndex(first_letter)
+    for rec in DATA_RECORDS:
+        by_decade.append(rec)
+        by_letter.append(rec)
+
+    print("people in their 20s or 30s, whose names don't start with 'P':")
+    for rid in (by_decade.any_of([2, 3]) & by_letter.not_(by_letter.eq("P"))):
+        print(DATA_RECORDS[rid])
+
+    n = 5_000_000
+    gen = PersonGenerator(n, ages=Distribution("zipf", 100))
+    by_decade = BitmapIndex(age_bucket(10))
+    by_letter = BitmapIndex(first_letter)
+    start = time.perf_counter()
+    for rec in gen:
+        by_decade.append(rec)
+        by_letter.append(rec)
+    print(f"\nindexed {n} records in {time.perf_counter() - start:.1f} s, "
+          f"bitmaps take {(by_decade.size_bytes() + by_letter.size_bytes()) / 2**20:.1f} MiB")
+
+    start = time.perf_counter()
+    result = by_decade.eq(0) & by_letter.any_of(["M", "P"])
+    print(f"children under 10 named M* or P*: {result.count()} in {(time.perf_counter() - start) * 1000:.1f} ms")
+    start = time.perf_counter()
+    result = by_decade.not_(by_decade.any_of([0, 1]))
+    print(f"older than 19: {result.count()} in {(time.perf_counter() - start) * 1000:.1f} ms")
@@ -0,0 +1,168 @@
+"""Seeded, lazily generated PersonRecord datasets of any size.
+
+Usage: python -m db_intro_hw.hw1.generator N OUTPUT [--format binary|csv] [--ids sequential|shuffled]
+                                             [--ages uniform|zipf|duplicates] [--names uniform|zipf|duplicates] [--seed S]
+"""
+from __future__ import annotations
+import argparse
+import csv
+import random
+from dataclasses import dataclass
+from itertools import accumulate, islice
+from math import gcd
+from typing import Iterator, List, Optional
+
+from db_intro_hw.hw1 import DATA_RECORDS, PersonRecord
+from db_intro_hw.hw1.primary_file import NAME_SIZE, PrimaryFileWriter
+
+
+# records are produced this many at a time, so that the samplers run in batches
+BATCH_SIZE = 4096
+
+BASE_NAMES = [rec.name for rec in DATA_RECORDS] + [
+    "Tomas", "Eva", "Jana", "Martin", "Hana", "Lukas", "Tereza", "David", "Anna", "Jakub",
+    "Lenka", "Ondrej", "Klara", "Michal", "Petra", "Vojtech",
+]
+
+
+def name_for(idx: int) -> str:
+    """idx-th name of the name domain, names beyond the base list get a numeric suffix"""
+    base, suffix = divmod(idx, len(BASE_NAMES))
+    name = BASE_NAMES[suffix] + (str(base) if base else "")
+    assert len(name) <= NAME_SIZE, f"Name domain too big, '{name}' doesn't fit into the record"
+    return name
+
+
+@dataclass
+class Distribution:
+    """Distribution of attribute values over [0, cardinality)
+
+    kind:
+        uniform - every value equally likely
+        zipf - value v is drawn with probability ~ 1 / (v + 1)^skew
+        duplicates - 'hot_fraction' of the records share 'hot_values' values, the rest is uniform
+    """
+    kind: str = "uniform"
+    cardinality: int = 100
+    skew: float = 1.0
+    hot_values: int = 3
+    hot_fraction: float = 0.9
+
+    def __post_init__(self):
+        if self.kind not in ("uniform", "zipf", "duplicates"):
+            raise Exception(f"Unknown distribution {self.kind}")
+        if self.cardinality < 1:
+            raise Exception("Cardinality must be positive")
+
+        self.cum_weights: List[float] = []
+        if self.kind == "zipf":
+            self.cum_weights = list(accumulate(1 / (v + 1) ** self.skew for v in range(self.cardinality)))
+
+    def sample(self, rnd: random.Random, k: int) -> List[int]:
+        if self.kind == "zipf":
+            return rnd.choices(range(self.cardinality), cum_weights=self.cum_weights, k=k)
+        if self.kind == "duplicates":
+            hot = min(self.hot_values, self.cardinality)
+            return [rnd.randrange(hot) if rnd.random() < self.hot_fraction else rnd.randrange(self.cardinality)
+                    for _ in range(k)]
+        return [rnd.randrange(self.cardinality) for _ in range(k)]
+
+
+class PersonGenerator:
+    """Yields 'n' PersonRecords lazily, only one batch is held in memory.
+    Iterating twice yields the same records, they depend on the seed only.
+
+    ids are either sequential (0, 1, ..., n-1) or shuffled - a pseudo-random permutation of the same range,
+    computed per record, so there's no list of n ids either."""
+
+    def __init__(self, n: int, seed: int = 0, ids: str = "sequential",
+                 names: Optional[Distribution] = None, ages: Optional[Distribution] = None):
+        if ids not in ("sequential", "shuffled"):
+            raise Exception(f"Unknown id order {ids}")
+        names = names if names is not None else Distribution(cardinality=len(BASE_NAMES))
+        ages = ages if ages is not None else Distribution(cardinality=100)
+        if ages.cardinality > 256:
+            raise Exception("Ages must fit into one byte")
+
+        self.n = n
+        self.seed = seed
+        self.ids = ids
+        self.names = names
+        self.ages = ages
+
+        # i -> (a * i + c) mod n is a permutation of range(n), if a and n are coprime
+        rnd = random.Random(seed)
+        self.perm_a = rnd.randrange(1, max(n, 2))
+        while gcd(self.perm_a, n) != 1:
+            self.perm_a += 1
+        self.perm_c = rnd.randrange(max(n, 1))
+
+    def __len__(self) -> int:
+        return self.n
+
+    def record_id(self, i: int) -> int:
+        if self.ids == "sequential":
+            return i
+        return (self.perm_a * i + self.perm_c) % self.n
+
+    def __iter__(self) -> Iterator[PersonRecord]:
+        for batch in self.chunks(BATCH_SIZE):
+            yield from batch
+
+    def chunks(self, size: int) -> Iterator[List[PersonRecord]]:
+        """Yields the records in lists of 'size' records (the last one may be shorter)"""
+        rnd = random.Random(self.seed + 1)
+        # names are built once per distinct value
+        names = [name_for(v) for v in range(self.names.cardinality)]
+
+        for start in range(0, self.n, size):
+            k = min(size, self.n - start)
+            name_idx = self.names.sample(rnd, k)
+            ages = self.ages.sample(rnd, k)
+            yield [PersonRecord(self.record_id(start + j), names[name_idx[j]], ages[j]) for j in range(k)]
+
+    def write_binary(self, path: str) -> None:
+        with PrimaryFileWriter(path) as writer:
+            writer.extend(self)
+
+    def write_csv(self, path: str) -> None:
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["id", "name", "age"])
+            for batch in self.chunks(BATCH_SIZE):
+                writer.writerows((rec.id, rec.name, rec.age) for rec in batch)
+
+
+def read_csv(path: str) -> Iterator[PersonRecord]:
+    """Reads records written by PersonGenerator.write_csv lazily"""
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        next(reader)
+        for rec_id, name, age in reader:
+            yield PersonRecord(int(rec_id), name, int(age))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates a synthetic PersonRecord dataset")
+    parser.add_argument("n", type=lambda s: int(float(s)), help="number of records, e.g. 5e6")
+    parser.add_argument("output")
+    parser.add_argument("--format", choices=["binary", "csv"], default="binary")
+    parser.add_argument("--ids", choices=["sequential", "shuffled"], default="sequential")
+    parser.add_argument("--ages", choices=["uniform", "zipf", "duplicates"], default="uniform")
+    parser.add_argument("--names", choices=["uniform", "zipf", "duplicates"], default="uniform")
+    parser.add_argument("--name-cardinality", type=int, default=len(BASE_NAMES))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    gen = PersonGenerator(args.n, args.seed, args.ids,
+                          names=Distribution(args.names, args.name_cardinality),
+                          ages=Distribution(args.ages, 100))
+    for rec in islice(gen, 5):
+        print(rec)
+    print("...")
+
+    if args.format == "binary":
+        gen.write_binary(args.output)
+    else:
+        gen.write_csv(args.output)
+    print(f"{args.n} records written to {args.output}")
@@ -0,0 +1,201 @@
+"""Index tables of HW1 over the binary primary file.
+
+PrimaryIndex - sparse, one entry (the first id) per data block, the primary file must be sorted by id
+SecondaryDirectIndex - dense, (attribute value, record id) for every record
+SecondaryIndirectIndex - dense, (attribute value, primary key) for every record, record ids are found through the primary index
+"""
+from __future__ import annotations
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, Iterable, Iterator, List, Optional, Tuple, Type, TypeVar
+
+from db_intro_hw.hw1.primary_file import RECORDS_PER_BLOCK, PersonRecordView, PrimaryFile
+
+
+class PrimaryIndex:
+    def __init__(self, primary: PrimaryFile):
+        self.primary = primary
+
+        # first id of every data block
+        self.fence = array("Q")
+        last_id = -1
+        for block in range(primary.n_blocks):
+            first_id = primary[block * RECORDS_PER_BLOCK].id
+            if first_id <= last_id:
+                raise Exception("Primary file isn't sorted by id, it can't have a sparse primary index")
+            self.fence.append(first_id)
+            last_id = primary[min(len(primary), (block + 1) * RECORDS_PER_BLOCK) - 1].id
+
+    def block_of(self, rec_id: int) -> int:
+        """The only data block, which can contain the id"""
+        return max(0, bisect_right(self.fence, rec_id) - 1)
+
+    def block_rids(self, block: int) -> range:
+        return range(block * RECORDS_PER_BLOCK, min(len(self.primary), (block + 1) * RECORDS_PER_BLOCK))
+
+    def lookup(self, rec_id: int) -> Optional[int]:
+        """Record id (position in the primary file) of the record with the id, reading one data block"""
+        if not self.fence:
+            return None
+        for rid in self.block_rids(self.block_of(rec_id)):
+            if self.primary[rid].id == rec_id:
+                return rid
+        return None
+
+    def range(self, lo: int, hi: int) -> Iterator[int]:
+        """Record ids of the records with lo <= id <= hi, in the order of ids"""
+        if not self.fence:
+            return
+        rid = self.block_rids(self.block_of(lo)).start
+        while rid < len(self.primary):
+            rec_id = self.primary[rid].id
+            if rec_id > hi:
+                return
+            if rec_id >= lo:
+                yield rid
+            rid += 1
+
+    def count(self, lo: int, hi: int) -> int:
+        """Number of records with lo <= id <= hi. Only the two boundary blocks are read,
+        the blocks between them are known to be within the range from the index alone."""
+        if not self.fence or hi < lo:
+            return 0
+        first, last = self.block_of(lo), self.block_of(hi)
+        if first == last:
+            return sum(1 for rid in self.block_rids(first) if lo <= self.primary[rid].id <= hi)
+
+        total = sum(1 for rid in self.block_rids(first) if self.primary[rid].id >= lo)
+        total += (last - first - 1) * RECORDS_PER_BLOCK
+        total += sum(1 for rid in self.block_rids(last) if self.primary[rid].id <= hi)
+        return total
+
+    def __len__(self) -> int:
+        return len(self.fence)
+
+
+# the concrete index class built by SecondaryIndex.from_sorted_run
+S = TypeVar("S", bound="SecondaryIndex")
+
+
+class SecondaryIndex:
+    """Dense index table of (key, pointer) entries sorted by key, duplicate keys are allowed"""
+
+    def __init__(self, attribute: str):
+        self.attribute = attribute
+        self.keys: List[Any] = []
+        self.pointers = array("Q")
+
+    @classmethod
+    def from_sorted_run(cls: Type[S], attribute: str, run: Iterable[Tuple[Any, int]], *args) -> S:
+        """Builds the index from entries already sorted by key, in one pass"""
+        index = cls(attribute, *args)
+        for key, pointer in run:
+            if index.keys and key < index.keys[-1]:
+                raise Exception(f"Run isn't sorted, {key} follows {index.keys[-1]}")
+            index.keys.append(key)
+            index.pointers.append(pointer)
+        return index
+
+    def bounds(self, lo: Any, hi: Any) -> Tuple[int, int]:
+        return bisect_left(self.keys, lo), bisect_right(self.keys, hi)
+
+    def pointers_in(self, lo: Any, hi: Any) -> Iterator[int]:
+        start, end = self.bounds(lo, hi)
+        for i in range(start, end):
+            yield self.pointers[i]
+
+    def count(self, lo: Any, hi: Optional[Any] = None) -> int:
+        """Number of records with lo <= key <= hi (key == lo if hi is omitted), from the index alone"""
+        start, end = self.bounds(lo, lo if hi is None else hi)
+        return end - start
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+class SecondaryDirectIndex(SecondaryIndex):
+    """Pointers are record ids of the primary file"""
+
+    def __init__(self, attribute: str, primary: PrimaryFile):
+        super().__init__(attribute)
+        self.primary = primary
+
+    @classmethod
+    def build(cls, attribute: str, primary: PrimaryFile) -> SecondaryDirectIndex:
+        run = sorted((getattr(view, attribute), rid) for rid, view in enumerate(primary))
+        return cls.from_sorted_run(attribute, run, primary)
+
+    def lookup(self, key: Any) -> List[PersonRecordView]:
+        return list(self.range(key, key))
+
+    def range(self, lo: Any, hi: Any) -> Iterator[PersonRecordView]:
+        for rid in self.pointers_in(lo, hi):
+            yield self.primary[rid]
+
+
+class SecondaryIndirectIndex(SecondaryIndex):
+    """Pointers are primary keys (ids), the records are reached through the primary index.
+    The index doesn't change, when records move within the primary file."""
+
+    def __init__(self, attribute: str, primary_index: PrimaryIndex):
+        super().__init__(attribute)
+        self.primary_index = primary_index
+
+    @classmethod
+    def build(cls, attribute: str, primary_index: PrimaryIndex) -> SecondaryIndirectIndex:
+        run = sorted((getattr(view, attribute), view.id) for view in primary_index.primary)
+        return cls.from_sorted_run(attribute, run, primary_index)
+
+    def lookup(self, key: Any) -> List[PersonRecordView]:
+        return list(self.range(key, key))
+
+    def range(self, lo: Any, hi: Any) -> Iterator[PersonRecordView]:
+        primary = self.primary_index.primary
+        for rec_id in self.pointers_in(lo, hi):
+            rid = self.primary_index.lookup(rec_id)
+            assert rid is not None, f"Primary index doesn't know id {rec_id}"
+            yield primary[rid]
+
+
+if __name__ == "__main__":
+    import os
+    import tempfile
+    import time
+
+    from db_intro_hw.hw1 import DATA_RECORDS
+    from db_intro_hw.hw1.generator import Distribution, PersonGenerator
+    from db_intro_hw.hw1.primary_file import PrimaryFileWriter
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "persons.dat")
+        with PrimaryFileWriter(path) as writer:
+            writer.extend(DATA_RECORDS)
+
+        with PrimaryFile(path) as primary:
+            by_id = PrimaryIndex(primary)
+            by_name = SecondaryDirectIndex.build("name", primary)
+            by_age = SecondaryIndirectIndex.build("age", by_id)
+
+            rid = by_id.lookup(12)
+            assert rid is not None
+            print(primary[rid])
+            print(*by_name.range("J", "K"), sep="\n")
+            print(f"aged 20-40: {by_age.count(20, 40)}")
+            print(*by_age.range(20, 40), sep="\n")
+
+        n = 1_000_000
+        path = os.path.join(tmp, "big.dat")
+        PersonGenerator(n, ages=Distribution("zipf", 100)).write_binary(path)
+        with PrimaryFile(path) as primary:
+            start = time.perf_counter()
+            by_id = PrimaryIndex(primary)
+            by_age = SecondaryIndirectIndex.build("age", by_id)
+            by_name = SecondaryDirectIndex.build("name", primary)
+            print(f"\nbuilt indexes over {n} records in {time.perf_counter() - start:.1f} s, "
+                  f"primary index has {len(by_id)} entries")
+
+            start = time.perf_counter()
+            assert by_id.count(1000, 500_000) == 499_001
+            print(f"ids 1000-500000: {by_id.count(1000, 500_000)}, aged 30-39: {by_age.count(30, 39)}, "
+                  f"named Marie: {by_name.count('Marie')} in {(time.perf_counter() - start) * 1000:.2f} ms")
+            print(f"oldest: {by_age.lookup(99)[0]}")
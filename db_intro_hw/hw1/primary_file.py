@@ -0,0 +1,209 @@
+from __future__ import annotations
+import mmap
+import os
+import struct
+from typing import Iterable, Iterator
+
+from db_intro_hw.hw1 import PersonRecord
+
+
+# block size from the HW1 problem statement
+BLOCK_SIZE = 4096
+
+# magic, block size, record size, number of records
+FILE_HEADER = struct.Struct("<4sIIQ")
+MAGIC = b"PERS"
+
+# id, length of the name, name padded with zeros, age
+RECORD = struct.Struct("<IB15sB")
+NAME_SIZE = 15
+
+# records never cross a block boundary, the rest of every block stays unused
+RECORDS_PER_BLOCK = BLOCK_SIZE // RECORD.size
+
+
+def record_offset(rid: int) -> int:
+    """Byte offset of the record with the given record id (its position in the file).
+    Block 0 holds the file header, data blocks follow."""
+    block, slot = divmod(rid, RECORDS_PER_BLOCK)
+    return (block + 1) * BLOCK_SIZE + slot * RECORD.size
+
+
+def file_size(n_records: int) -> int:
+    n_blocks = -(-n_records // RECORDS_PER_BLOCK)
+    return (n_blocks + 1) * BLOCK_SIZE
+
+
+class PersonRecordView:
+    """Lightweight read-only view of one record in the primary file. Fields are decoded on access,
+    nothing is copied until then."""
+    __slots__ = ("buf", "offset")
+
+    def __init__(self, buf: memoryview, offset: int):
+        self.buf = buf
+        self.offset = offset
+
+    @property
+    def id(self) -> int:
+        return int.from_bytes(self.buf[self.offset:self.offset + 4], "little")
+
+    @property
+    def name(self) -> str:
+        name_len = self.buf[self.offset + 4]
+        return str(self.buf[self.offset + 5:self.offset + 5 + name_len], "utf-8")
+
+    @property
+    def age(self) -> int:
+        return self.buf[self.offset + 5 + NAME_SIZE]
+
+    def to_record(self) -> PersonRecord:
+        rec_id, name_len, name, age = RECORD.unpack_from(self.buf, self.offset)
+        return PersonRecord(rec_id, name[:name_len].decode("utf-8"), age)
+
+    def __str__(self):
+        return str(self.to_record())
+
+
+class PrimaryFileWriter:
+    """Appends records to a new primary file"""
+
+    def __init__(self, path: str):
+        self.file = open(path, "wb")
+        self.n_records = 0
+        self.block = bytearray(BLOCK_SIZE)
+        self.block_records = 0
+
+        # header is written on close, once the number of records is known
+        self.file.write(bytes(BLOCK_SIZE))
+
+    def append(self, rec: PersonRecord) -> int:
+        """Writes the record and returns its record id"""
+        name = rec.name.encode("utf-8")
+        if len(name) > NAME_SIZE:
+            raise Exception(f"Name '{rec.name}' is longer than {NAME_SIZE} bytes")
+        if not 0 <= rec.age <= 255:
+            raise Exception(f"Age {rec.age} doesn't fit into one byte")
+
+        RECORD.pack_into(self.block, self.block_records * RECORD.size, rec.id, len(name), name, rec.age)
+        self.block_records += 1
+        if self.block_records == RECORDS_PER_BLOCK:
+            self.flush_block()
+
+        self.n_records += 1
+        return self.n_records - 1
+
+    def extend(self, records: Iterable[PersonRecord]) -> None:
+        for rec in records:
+            self.append(rec)
+
+    def flush_block(self) -> None:
+        self.file.write(self.block)
+        self.block = bytearray(BLOCK_SIZE)
+        self.block_records = 0
+
+    def close(self) -> None:
+        if self.block_records > 0:
+            self.flush_block()
+        self.file.seek(0)
+        self.file.write(FILE_HEADER.pack(MAGIC, BLOCK_SIZE, RECORD.size, self.n_records))
+        self.file.close()
+
+    def __enter__(self) -> PrimaryFileWriter:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class PrimaryFile:
+    """Read-only primary file accessed through mmap. Opening reads only the header,
+    the OS pages in blocks as the records are accessed."""
+
+    def __init__(self, path: str):
+        self.file = open(path, "rb")
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buf = memoryview(self.mm)
+
+        magic, block_size, record_size, self.n_records = FILE_HEADER.unpack_from(self.buf, 0)
+        if magic != MAGIC:
+            raise Exception(f"{path} is not a primary file")
+        if block_size != BLOCK_SIZE or record_size != RECORD.size:
+            raise Exception(f"{path} has incompatible layout: block size {block_size}, record size {record_size}")
+
+    @property
+    def n_blocks(self) -> int:
+        return len(self.mm) // BLOCK_SIZE - 1
+
+    def __len__(self) -> int:
+        return self.n_records
+
+    def __getitem__(self, rid: int) -> PersonRecordView:
+        if not 0 <= rid < self.n_records:
+            raise IndexError(f"Record id {rid} out of range")
+        return PersonRecordView(self.buf, record_offset(rid))
+
+    def __iter__(self) -> Iterator[PersonRecordView]:
+        for rid in range(self.n_records):
+            yield PersonRecordView(self.buf, record_offset(rid))
+
+    def scan(self) -> Iterator[PersonRecord]:
+        """Decodes every record, block by block, without creating views"""
+        for block in range(self.n_blocks):
+            start = (block + 1) * BLOCK_SIZE
+            n = min(RECORDS_PER_BLOCK, self.n_records - block * RECORDS_PER_BLOCK)
+            for rec_id, name_len, name, age in RECORD.iter_unpack(self.buf[start:start + n * RECORD.size]):
+                yield PersonRecord(rec_id, name[:name_len].decode("utf-8"), age)
+
+    def close(self) -> None:
+        self.buf.release()
+        self.mm.close()
+        self.file.close()
+
+    def __enter__(self) -> PrimaryFile:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+if __name__ == "__main__":
+    import random
+    import tempfile
+    import time
+
+    from db_intro_hw.hw1 import DATA_RECORDS
+    from db_intro_hw.hw2 import Record
+    from db_intro_hw.hw2.fagin import Fagin
+
+    print(f"record size: {RECORD.size} B, {RECORDS_PER_BLOCK} records per block")
+    print(f"5M records take {file_size(5_000_000) // BLOCK_SIZE} blocks, {file_size(5_000_000) / 2**20:.1f} MiB")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "persons.dat")
+        with PrimaryFileWriter(path) as writer:
+            writer.extend(DATA_RECORDS)
+
+        with PrimaryFile(path) as primary:
+            # hash index on ids, which points to record ids in the primary file instead of holding the records
+            index = Fagin()
+            for rid, view in enumerate(primary):
+                index.insert(Record(view.id, rid))
+            print(primary[index.find(7).data])
+            assert [view.to_record() for view in primary] == list(DATA_RECORDS)
+
+        n = 1_000_000
+        path = os.path.join(tmp, "big.dat")
+        names = [rec.name for rec in DATA_RECORDS]
+        start = time.perf_counter()
+        with PrimaryFileWriter(path) as writer:
+            for i in range(n):
+                writer.append(PersonRecord(i, random.choice(names), random.randrange(100)))
+        print(f"\nwrote {n} records in {time.perf_counter() - start:.2f} s")
+
+        start = time.perf_counter()
+        with PrimaryFile(path) as primary:
+            opened = time.perf_counter()
+            total_age = sum(view.age for view in primary)
+            scanned = time.perf_counter()
+            print(f"opened in {(opened - start) * 1000:.2f} ms, scanned ages of {len(primary)} records in {scanned - opened:.2f} s,"
+                  f" average age {total_age / n:.1f}")
@@ -0,0 +1,596 @@
+"""Cost-based choice of access paths for predicates over the primary file.
+
+Costs are block reads, computed as in HW1: an index table of n blocks is binary searched in ceil(log2(n)) + 1 reads,
+a hash bucket costs its chain length, a B+-tree its height plus the leaves spanned, and fetching k random records
+out of N data blocks reads N * (1 - (1 - 1/N)^k) distinct blocks (Cardenas). Selectivities come from TableStats.
+"""
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from array import array
+from collections import Counter
+from dataclasses import dataclass, field
+from math import ceil, log2
+from operator import attrgetter
+from typing import Any, Dict, List, Optional, Tuple
+
+from db_intro_hw.hw1 import PersonRecord
+from db_intro_hw.hw1.bitmap import Bitmap, BitmapIndex
+from db_intro_hw.hw1.index_tables import PrimaryIndex, SecondaryDirectIndex, SecondaryIndex, SecondaryIndirectIndex
+from db_intro_hw.hw1.primary_file import BLOCK_SIZE, NAME_SIZE, RECORDS_PER_BLOCK, PersonRecordView, PrimaryFile
+from db_intro_hw.hw2 import AccessStats, Record
+from db_intro_hw.hw2.linear_hashing import LinearHashing
+from db_intro_hw.hw3.b_tree import Leaf, RedundantBTree
+
+
+# sizes of index entries on disk - an int key or a name, and an 8-byte pointer
+INT_SIZE = 8
+POINTER_SIZE = 8
+
+# columns with more distinct values than this keep only min/max and are treated as unique keys
+MAX_TRACKED_VALUES = 4096
+
+
+def entry_size(attribute: str) -> int:
+    return (NAME_SIZE if attribute == "name" else INT_SIZE) + POINTER_SIZE
+
+
+def blocks_for(n_entries: float, size: int) -> int:
+    return ceil(n_entries * size / BLOCK_SIZE)
+
+
+def search_reads(n_blocks: int) -> int:
+    """Reads of a binary search over a sorted file of n blocks"""
+    return ceil(log2(n_blocks)) + 1 if n_blocks > 1 else 1
+
+
+def cardenas(n_blocks: int, k: float) -> float:
+    """Expected number of distinct blocks among k records spread uniformly over n blocks"""
+    if n_blocks == 0:
+        return 0.0
+    return n_blocks * (1 - (1 - 1 / n_blocks) ** k)
+
+
+def distinct_blocks(rids: Bitmap) -> int:
+    return len({rid // RECORDS_PER_BLOCK for rid in rids})
+
+
+# --- predicates ---
+
+@dataclass(frozen=True)
+class Eq:
+    attribute: str
+    value: Any
+
+    def matches(self, rec: Any) -> bool:
+        return getattr(rec, self.attribute) == self.value
+
+    def __str__(self):
+        return f"{self.attribute} = {self.value!r}"
+
+
+@dataclass(frozen=True)
+class Range:
+    """lo <= attribute <= hi"""
+    attribute: str
+    lo: Any
+    hi: Any
+
+    def matches(self, rec: Any) -> bool:
+        return self.lo <= getattr(rec, self.attribute) <= self.hi
+
+    def __str__(self):
+        return f"{self.lo!r} <= {self.attribute} <= {self.hi!r}"
+
+
+@dataclass(frozen=True)
+class In:
+    attribute: str
+    values: Tuple[Any, ...]
+
+    def matches(self, rec: Any) -> bool:
+        return getattr(rec, self.attribute) in self.values
+
+    def __str__(self):
+        return f"{self.attribute} IN ({', '.join(map(repr, self.values))})"
+
+
+class And:
+    def __init__(self, *predicates):
+        self.predicates: Tuple[Any, ...] = predicates
+
+    def matches(self, rec: Any) -> bool:
+        return all(p.matches(rec) for p in self.predicates)
+
+    def __repr__(self):
+        return " AND ".join(map(str, self.predicates))
+
+
+def conjuncts(predicate: Any) -> List[Any]:
+    if isinstance(predicate, And):
+        return [c for p in predicate.predicates for c in conjuncts(p)]
+    return [predicate]
+
+
+# --- statistics ---
+
+class ColumnStats:
+    def __init__(self):
+        self.n = 0
+        self.lo: Any = None
+        self.hi: Any = None
+        # value -> number of records, dropped once the column has too many distinct values
+        self.counts: Optional[Counter] = Counter()
+
+    def add(self, value: Any) -> None:
+        self.n += 1
+        self.lo = value if self.lo is None else min(self.lo, value)
+        self.hi = value if self.hi is None else max(self.hi, value)
+        if self.counts is not None:
+            self.counts[value] += 1
+            if len(self.counts) > MAX_TRACKED_VALUES:
+                self.counts = None
+
+    def selectivity(self, predicate: Any) -> float:
+        if self.n == 0:
+            return 0.0
+
+        if self.counts is not None:
+            if isinstance(predicate, Eq):
+                matching = self.counts.get(predicate.value, 0)
+            elif isinstance(predicate, In):
+                matching = sum(self.counts.get(v, 0) for v in set(predicate.values))
+            else:
+                matching = sum(c for v, c in self.counts.items() if predicate.lo <= v <= predicate.hi)
+            return matching / self.n
+
+        # untracked column, every value is assumed to be unique
+        if isinstance(predicate, Eq):
+            return 1 / self.n
+        if isinstance(predicate, In):
+            return min(1.0, len(set(predicate.values)) / self.n)
+        if isinstance(self.lo, int):
+            lo, hi = max(predicate.lo, self.lo), min(predicate.hi, self.hi)
+            return max(0, hi - lo + 1) / (self.hi - self.lo + 1)
+        return 1 / 3
+
+
+class TableStats:
+    """Per-column statistics of the primary file, kept up to date by add()"""
+
+    ATTRIBUTES = ("id", "name", "age")
+
+    def __init__(self):
+        self.n_records = 0
+        self.columns: Dict[str, ColumnStats] = {a: ColumnStats() for a in self.ATTRIBUTES}
+
+    @classmethod
+    def build(cls, primary: PrimaryFile) -> TableStats:
+        stats = cls()
+        for rec in primary.scan():
+            stats.add(rec)
+        return stats
+
+    def add(self, rec: PersonRecord) -> None:
+        self.n_records += 1
+        for attribute, column in self.columns.items():
+            column.add(getattr(rec, attribute))
+
+    @property
+    def n_blocks(self) -> int:
+        return ceil(self.n_records / RECORDS_PER_BLOCK)
+
+    def rows(self, predicate: Any) -> float:
+        return self.n_records * self.columns[predicate.attribute].selectivity(predicate)
+
+
+# --- access paths ---
+
+class AccessPath(ABC):
+    """Way of turning one predicate on one attribute into the set of matching record ids"""
+    name = "path"
+    # a clustered path reads the data blocks of its records itself, they need no separate fetch
+    clustered = False
+
+    def __init__(self, attribute: str):
+        self.attribute = attribute
+
+    def supports(self, predicate: Any) -> bool:
+        return predicate.attribute == self.attribute and isinstance(predicate, (Eq, In, Range))
+
+    @abstractmethod
+    def estimate(self, predicate: Any, stats: TableStats) -> float:
+        """Estimated block reads of execute()"""
+
+    @abstractmethod
+    def execute(self, predicate: Any) -> Tuple[Bitmap, int]:
+        """Matching record ids and the number of blocks actually read"""
+
+    def __repr__(self):
+        return f"{self.name}({self.attribute})"
+
+
+class PrimaryIndexPath(AccessPath):
+    name = "primary index"
+    clustered = True
+
+    def __init__(self, index: PrimaryIndex):
+        super().__init__("id")
+        self.index = index
+
+    @property
+    def search(self) -> int:
+        return search_reads(blocks_for(len(self.index), INT_SIZE + POINTER_SIZE))
+
+    def estimate(self, predicate: Any, stats: TableStats) -> float:
+        if isinstance(predicate, Eq):
+            return self.search + 1
+        if isinstance(predicate, In):
+            return len(set(predicate.values)) * (self.search + 1)
+        return self.search + ceil(stats.rows(predicate) / RECORDS_PER_BLOCK) + 1
+
+    def execute(self, predicate: Any) -> Tuple[Bitmap, int]:
+        result = Bitmap()
+        if isinstance(predicate, Range):
+            for rid in self.index.range(predicate.lo, predicate.hi):
+                result.add(rid)
+            # the first block is read even if nothing matches
+            return result, self.search + max(1, distinct_blocks(result))
+
+        values = [predicate.value] if isinstance(predicate, Eq) else sorted(set(predicate.values))
+        for value in values:
+            found = self.index.lookup(value)
+            if found is not None:
+                result.add(found)
+        return result, len(values) * (self.search + 1)
+
+
+class IndexTablePath(AccessPath):
+    """Secondary index table, direct pointers lead to the record ids, indirect ones through the primary index"""
+
+    def __init__(self, index: SecondaryIndex, primary_index: Optional[PrimaryIndex] = None):
+        super().__init__(index.attribute)
+        self.index = index
+        self.primary_index = primary_index
+        self.name = "secondary indirect index" if isinstance(index, SecondaryIndirectIndex) else "secondary direct index"
+
+    @property
+    def search(self) -> int:
+        return search_reads(blocks_for(len(self.index), entry_size(self.attribute)))
+
+    def per_pointer(self) -> int:
+        """Reads needed to turn one pointer into a record id"""
+        if isinstance(self.index, SecondaryIndirectIndex):
+            return search_reads(blocks_for(len(self.index.primary_index), INT_SIZE + POINTER_SIZE)) + 1
+        return 0
+
+    def estimate(self, predicate: Any, stats: TableStats) -> float:
+        n_searches = len(set(predicate.values)) if isinstance(predicate, In) else 1
+        rows = stats.rows(predicate)
+        return n_searches * self.search + blocks_for(rows, entry_size(self.attribute)) + rows * self.per_pointer()
+
+    def execute(self, predicate: Any) -> Tuple[Bitmap, int]:
+        if isinstance(predicate, Range):
+            bounds = [(predicate.lo, predicate.hi)]
+        else:
+            bounds = [(v, v) for v in ([predicate.value] if isinstance(predicate, Eq) else sorted(set(predicate.values)))]
+
+        result = Bitmap()
+        reads = 0
+        n_pointers = 0
+        for lo, hi in bounds:
+            reads += self.search
+            for pointer in self.index.pointers_in(lo, hi):
+                n_pointers += 1
+                if isinstance(self.index, SecondaryIndirectIndex):
+                    rid = self.index.primary_index.lookup(pointer)
+                    assert rid is not None, f"Primary index doesn't know id {pointer}"
+                    pointer = rid
+                result.add(pointer)
+        reads += blocks_for(n_pointers, entry_size(self.attribute)) + n_pointers * self.per_pointer()
+        return result, reads
+
+
+class RidListPath(AccessPath):
+    """Base of the hw2/hw3 structures, which map an attribute value to an array of record ids.
+    Long rid lists take blocks of their own."""
+
+    @staticmethod
+    def rid_groups(primary: PrimaryFile, attribute: str) -> Dict[Any, array]:
+        groups: Dict[Any, array] = {}
+        get = attrgetter(attribute)
+        for rid, view in enumerate(primary):
+            value = get(view)
+            rids = groups.get(value)
+            if rids is None:
+                rids = groups[value] = array("Q")
+            rids.append(rid)
+        return groups
+
+    @staticmethod
+    def rid_list_reads(n_rids: float) -> int:
+        # the first block of the rid list is stored with the key
+        return max(0, blocks_for(n_rids, POINTER_SIZE) - 1)
+
+
+class HashPath(RidListPath):
+    name = "linear hashing"
+
+    def __init__(self, primary: PrimaryFile, attribute: str):
+        super().__init__(attribute)
+        self.stats = AccessStats()
+        self.table = LinearHashing(max_load=0.8, stats=self.stats)
+        for value, rids in self.rid_groups(primary, attribute).items():
+            self.table.insert(Record(value, rids))
+
+    def supports(self, predicate: Any) -> bool:
+        return predicate.attribute == self.attribute and isinstance(predicate, (Eq, In))
+
+    def bucket_reads(self) -> float:
+        """Average length of the page chain of a bucket"""
+        n_pages = sum(len(b.page_chain) for b in self.table.buckets)
+        return n_pages / len(self.table.buckets)
+
+    def estimate(self, predicate: Any, stats: TableStats) -> float:
+        n_keys = 1 if isinstance(predicate, Eq) else len(set(predicate.values))
+        # rid lists are estimated per key, assuming equally frequent values
+        return n_keys * (self.bucket_reads() + self.rid_list_reads(stats.rows(predicate) / n_keys))
+
+    def execute(self, predicate: Any) -> Tuple[Bitmap, int]:
+        values = [predicate.value] if isinstance(predicate, Eq) else sorted(set(predicate.values))
+        before = self.stats.primary_reads + self.stats.overflow_reads
+
+        result = Bitmap()
+        rid_reads = 0
+        for value in values:
+            bucket = self.table.buckets[self.table.h(value)]
+            if value not in bucket.locations:
+                # the whole chain has to be read to find out the key isn't there
+                rid_reads += len(bucket.page_chain)
+                continue
+            rids = self.table.find(value).data
+            rid_reads += self.rid_list_reads(len(rids))
+            for rid in rids:
+                result.add(rid)
+
+        return result, self.stats.primary_reads + self.stats.overflow_reads - before + rid_reads
+
+
+class BTreePath(RidListPath):
+    name = "B+-tree"
+
+    def __init__(self, primary: PrimaryFile, attribute: str, arity: int = 64):
+        super().__init__(attribute)
+        self.arity = arity
+        self.tree = RedundantBTree(arity)
+        for value, rids in sorted(self.rid_groups(primary, attribute).items()):
+            self.tree.insert(value, rids)
+        self.height = self.tree.stats().height
+
+    def estimate(self, predicate: Any, stats: TableStats) -> float:
+        rows = stats.rows(predicate)
+        if isinstance(predicate, Range):
+            column = stats.columns[self.attribute]
+            n_keys = rows if column.counts is None else sum(1 for v in column.counts if predicate.lo <= v <= predicate.hi)
+            # leaves are about 3/4 full after random inserts
+            leaves = ceil(n_keys / (0.75 * (self.arity - 1))) if n_keys else 1
+            return self.height - 1 + leaves + self.rid_list_reads(rows) + max(0, n_keys - 1)
+
+        n_keys = 1 if isinstance(predicate, Eq) else len(set(predicate.values))
+        return n_keys * (self.height + self.rid_list_reads(rows / n_keys))
+
+    def execute(self, predicate: Any) -> Tuple[Bitmap, int]:
+        if isinstance(predicate, Range):
+            bounds = [(predicate.lo, predicate.hi)]
+        else:
+            bounds = [(v, v) for v in ([predicate.value] if isinstance(predicate, Eq) else sorted(set(predicate.values)))]
+
+        result = Bitmap()
+        reads = 0
+        for lo, hi in bounds:
+            leaf: Optional[Leaf] = self.tree.find(lo)
+            reads += self.height
+            n_keys = 0
+            while leaf is not None:
+                for key, rids in zip(leaf.keys, leaf.records):
+                    if key > hi:
+                        leaf = None
+                        break
+                    if key >= lo:
+                        n_keys += 1
+                        reads += self.rid_list_reads(len(rids))
+                        for rid in rids:
+                            result.add(rid)
+                else:
+                    leaf = leaf.next_leaf
+                    if leaf is not None:
+                        reads += 1
+            # every rid list after the first one starts in a block of its own
+            reads += max(0, n_keys - 1)
+        return result, reads
+
+
+class BitmapPath(AccessPath):
+    name = "bitmap"
+
+    def __init__(self, index: BitmapIndex, attribute: str):
+        super().__init__(attribute)
+        self.index = index
+
+    def values(self, predicate: Any) -> List[Any]:
+        if isinstance(predicate, Eq):
+            return [predicate.value]
+        if isinstance(predicate, In):
+            return list(set(predicate.values))
+        return [v for v in self.index.values() if predicate.lo <= v <= predicate.hi]
+
+    def estimate(self, predicate: Any, stats: TableStats) -> float:
+        # the bitmaps themselves are the statistics - their sizes are known without reading them
+        return sum(max(1, blocks_for(self.index.eq(v).size_bytes(), 1)) for v in self.values(predicate))
+
+    def execute(self, predicate: Any) -> Tuple[Bitmap, int]:
+        values = self.values(predicate)
+        reads = sum(max(1, blocks_for(self.index.eq(v).size_bytes(), 1)) for v in values)
+        return self.index.any_of(values), reads
+
+
+# --- planning ---
+
+@dataclass
+class Step:
+    path: AccessPath
+    predicate: Any
+    estimate: float
+    rows: float
+    measured: Optional[int] = None
+    actual_rows: Optional[int] = None
+
+
+@dataclass
+class Plan:
+    """Either a full scan (no steps) or the intersection of index results followed by a fetch of the records"""
+    predicate: Any
+    steps: List[Step]
+    rows: float
+    fetch_estimate: float
+    fetch_measured: Optional[int] = None
+    result_rows: Optional[int] = None
+    records: List[PersonRecordView] = field(default_factory=list)
+
+    @property
+    def estimate(self) -> float:
+        return sum(s.estimate for s in self.steps) + self.fetch_estimate
+
+    @property
+    def measured(self) -> Optional[int]:
+        if self.fetch_measured is None:
+            return None
+        # steps are measured before the fetch
+        return sum(s.measured for s in self.steps if s.measured is not None) + self.fetch_measured
+
+
+class Table:
+    """Primary file with its statistics and the access paths built over it"""
+
+    def __init__(self, primary: PrimaryFile, stats: Optional[TableStats] = None):
+        self.primary = primary
+        self.stats = stats if stats is not None else TableStats.build(primary)
+        self.paths: List[AccessPath] = []
+
+    def add_path(self, path: AccessPath) -> None:
+        self.paths.append(path)
+
+    def plan(self, predicate: Any) -> Plan:
+        # the conjuncts are assumed to be independent
+        rows = float(self.stats.n_records)
+        for c in conjuncts(predicate):
+            rows *= self.stats.columns[c.attribute].selectivity(c)
+        scan = Plan(predicate, [], rows, self.stats.n_blocks)
+
+        # the cheapest path for every conjunct, that has one
+        steps = []
+        for c in conjuncts(predicate):
+            candidates = [(p.estimate(c, self.stats), p) for p in self.paths if p.supports(c)]
+            if candidates:
+                cost, path = min(candidates, key=lambda cp: cp[0])
+                steps.append(Step(path, c, cost, self.stats.rows(c)))
+        steps.sort(key=lambda s: s.rows)
+
+        # intersect the most selective steps while the saved fetches outweigh the extra index reads
+        best = scan
+        used: List[Step] = []
+        rows = float(self.stats.n_records)
+        for step in steps:
+            used = used + [step]
+            rows *= step.rows / self.stats.n_records if self.stats.n_records else 0
+            # the intersection is a subset of a clustered step's records, which have been read already
+            fetch = 0 if any(s.path.clustered for s in used) else cardenas(self.stats.n_blocks, rows)
+            plan = Plan(predicate, used, rows, fetch)
+            if plan.estimate < best.estimate:
+                best = plan
+        return best
+
+    def execute(self, plan: Plan) -> List[PersonRecordView]:
+        if not plan.steps:
+            plan.records = [view for view in self.primary if plan.predicate.matches(view)]
+            plan.fetch_measured = self.primary.n_blocks
+        else:
+            rids: Optional[Bitmap] = None
+            for step in plan.steps:
+                step_rids, step.measured = step.path.execute(step.predicate)
+                step.actual_rows = len(step_rids)
+                rids = step_rids if rids is None else rids & step_rids
+            assert rids is not None
+
+            # the remaining conjuncts are checked on the fetched records
+            plan.fetch_measured = 0 if any(s.path.clustered for s in plan.steps) else distinct_blocks(rids)
+            plan.records = [view for view in map(self.primary.__getitem__, rids) if plan.predicate.matches(view)]
+
+        plan.result_rows = len(plan.records)
+        return plan.records
+
+    def query(self, predicate: Any) -> List[PersonRecordView]:
+        return self.execute(self.plan(predicate))
+
+    def explain(self, predicate: Any, analyze: bool = True) -> str:
+        """Chosen plan with the estimated block reads and rows, with analyze also the measured ones"""
+        plan = self.plan(predicate)
+        if analyze:
+            self.execute(plan)
+
+        def fmt(value: Optional[float]) -> str:
+            return "-" if value is None else f"{value:.0f}"
+
+        lines = [f"{predicate}", f"{'step':<50}{'est. reads':>12}{'reads':>10}{'est. rows':>12}{'rows':>10}"]
+        for step in plan.steps:
+            lines.append(f"{f'{step.path} {step.predicate}':<50.50}{fmt(step.estimate):>12}{fmt(step.measured):>10}"
+                         f"{fmt(step.rows):>12}{fmt(step.actual_rows):>10}")
+        fetch = "full scan" if not plan.steps else ("fetch intersection" if len(plan.steps) > 1 else "fetch")
+        lines.append(f"{fetch:<50}{fmt(plan.fetch_estimate):>12}{fmt(plan.fetch_measured):>10}"
+                     f"{fmt(plan.rows):>12}{fmt(plan.result_rows):>10}")
+        lines.append(f"{'total':<50}{fmt(plan.estimate):>12}{fmt(plan.measured):>10}")
+        return "\n".join(lines)
+
+
+def default_table(primary: PrimaryFile) -> Table:
+    """Table with the primary index, a direct index and a bitmap on name, and linear hashing,
+    a B+-tree and an indirect index on age"""
+    table = Table(primary)
+    primary_index = PrimaryIndex(primary)
+    table.add_path(PrimaryIndexPath(primary_index))
+
+    table.add_path(IndexTablePath(SecondaryDirectIndex.build("name", primary)))
+    by_name = BitmapIndex(attrgetter("name"))
+    by_name.extend(primary.scan())
+    table.add_path(BitmapPath(by_name, "name"))
+
+    table.add_path(HashPath(primary, "age"))
+    table.add_path(BTreePath(primary, "age"))
+    table.add_path(IndexTablePath(SecondaryIndirectIndex.build("age", primary_index), primary_index))
+    return table
+
+
+if __name__ == "__main__":
+    import os
+    import tempfile
+
+    from db_intro_hw.hw1.generator import Distribution, PersonGenerator
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "persons.dat")
+        PersonGenerator(200_000, names=Distribution("zipf", 1000), ages=Distribution("zipf", 100)).write_binary(path)
+
+        with PrimaryFile(path) as primary:
+            table = default_table(primary)
+            print(f"{table.stats.n_records} records in {table.stats.n_blocks} blocks\n")
+
+            for predicate in [
+                Eq("id", 4242),
+                Range("id", 1000, 3000),
+                Eq("name", "Ivan3"),
+                In("name", ("Marie", "Jan")),
+                Eq("age", 0),
+                Range("age", 90, 99),
+                And(Eq("name", "Marie"), Range("age", 50, 99)),
+                And(Range("id", 0, 100_000), Eq("age", 42), In("name", ("Petr", "Pavel", "Olga"))),
+            ]:
+                print(table.explain(predicate), end="\n\n")
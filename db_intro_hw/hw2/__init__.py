@@ -1,7 +1,22 @@
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, Callable, Optional
 
 @dataclass
 class Record:
     key: int
-    data: Any
\ No newline at end of file
+    data: Any
+
+
+@dataclass
+class AccessStats:
+    """Counters of simulated page accesses and structural changes of a hashing structure"""
+    primary_reads: int = 0
+    overflow_reads: int = 0
+    splits: int = 0
+    merges: int = 0
+    directory_doublings: int = 0
+    record_moves: int = 0
+
+
+# optional callback receiving human-readable trace messages, e.g. 'print'
+Trace = Optional[Callable[[str], None]]
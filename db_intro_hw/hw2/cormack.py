@@ -1,5 +1,8 @@
-from typing import Any, Iterator, List, Tuple
-from db_intro_hw.hw2 import Record
+from bisect import bisect_left, insort
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Iterator, List, Optional, Tuple
+from db_intro_hw.hw2 import AccessStats, Record, Trace
+from db_intro_hw.hw2.hashing import HashFn, identity
 from dataclasses import dataclass
 
 
@@ -14,38 +17,147 @@ def h(k: int):
 
 
 
+# the same bucket contents come back after compaction or re-insertion, so found parameters are remembered
+PERFECT_HASH_CACHE_SIZE = 4096
+
+# after trying all useful shifts for r slots, r grows by r // R_GROWTH (at least by one)
+# smaller values find a perfect function sooner, but waste more of the primary file
+R_GROWTH = 64
+
+
+@lru_cache(maxsize=PERFECT_HASH_CACHE_SIZE)
+def perfect_hash_params(keys: FrozenSet[int], r_growth: int = R_GROWTH) -> Tuple[int, int]:
+    """Finds (i, r), such that (key >> i) % r are distinct for all the keys.
+
+    r starts at the number of keys. For every r, only shifts i with (max_key >> i) >= r are tried, because once
+    all shifted keys are smaller than r, shifting further only merges them. A candidate is rejected on the first
+    collision, which for a bad candidate comes after about sqrt(r) keys instead of all of them.
+    The search always ends, since for r bigger than twice the largest absolute key value, i = 0 is perfect."""
+    key_list = list(keys)
+    max_key = max(abs(k) for k in key_list)
+
+    r = len(key_list)
+    while True:
+        i = 0
+        while True:
+            seen = set()
+            for k in key_list:
+                h = (k >> i) % r
+                if h in seen:
+                    break
+                seen.add(h)
+            else:
+                return i, r
+
+            if (max_key >> i) < r:
+                break
+            i += 1
+
+        r += max(1, r // r_growth)
+
+
 @dataclass
 class Bucket:
     i: int
     r: int
     p: int
 
+
+class FreeList:
+    """Size-segregated free list of released primary file regions.
+
+    Allocation takes the smallest free region that is big enough, the unused rest of it is released again.
+    Neighbouring regions are never coalesced, fragmentation is dealt with by Cormack.compact()."""
+
+    def __init__(self):
+        # region size -> starts of free regions of that size
+        self.regions: Dict[int, List[int]] = {}
+        # sorted sizes that have at least one free region
+        self.sizes: List[int] = []
+        self.free_slots = 0
+
+    def release(self, start: int, size: int) -> None:
+        if size == 0:
+            return
+        if size not in self.regions:
+            self.regions[size] = []
+            insort(self.sizes, size)
+        self.regions[size].append(start)
+        self.free_slots += size
+
+    def allocate(self, size: int) -> Optional[int]:
+        """Returns start of a free region of 'size' slots or None, when there is no region big enough"""
+        idx = bisect_left(self.sizes, size)
+        if idx == len(self.sizes):
+            return None
+
+        region_size = self.sizes[idx]
+        starts = self.regions[region_size]
+        start = starts.pop()
+        if not starts:
+            del self.regions[region_size]
+            del self.sizes[idx]
+        self.free_slots -= region_size
+
+        self.release(start + size, region_size - size)
+        return start
+
+    def clear(self) -> None:
+        self.regions.clear()
+        self.sizes.clear()
+        self.free_slots = 0
+
+
 class Cormack:
-    def __init__(self, directory_size=7, primary_file_size=100):
+    def __init__(self, directory_size=7, primary_file_size=100, max_bucket_load: float = 4.0,
+                 compact_threshold: float = 0.5, r_growth: int = R_GROWTH, stats: Optional[AccessStats] = None, trace: Trace = None,
+                 hash_fn: HashFn = identity):
+        """
+        max_bucket_load - the directory is resized and all buckets rehashed, once there are
+                          more records per directory entry on average
+        compact_threshold - the primary file is compacted, once this fraction of its used part is free
+        r_growth - see perfect_hash_params()
+        hash_fn - keys are replaced by hash_fn(key) both in the directory and in the perfect hashing functions
+        """
         self.directory_size = directory_size
         self.primary_file_size = primary_file_size
+        self.max_bucket_load = max_bucket_load
+        self.compact_threshold = compact_threshold
+        self.r_growth = r_growth
+        self.hash_fn = hash_fn
         
-        self.directory: List[Bucket] = [None] * DIRECTORY_SIZE
-        self.primary_file: List[Record] = [None] * PRIM_FILE_SIZE
+        self.directory: List[Optional[Bucket]] = [None] * directory_size
+        self.primary_file: List[Optional[Record]] = [None] * primary_file_size
 
         # Ptr to primary file, after which there is free space
-        # we don't reuse space for simplicity
         self.free_space_ptr = 0
+        # released regions before free_space_ptr, reused by later allocations
+        self.free_list = FreeList()
+
+        self.n_records = 0
+
+        # opt-in instrumentation, both are None by default and cost nothing then
+        self.stats = stats
+        self.trace = trace
 
     def h(self, key: int) -> int:
         """Returns position of data record with key 'k' within the directory"""
-        return key % self.directory_size
+        return self.hash_fn(key) % self.directory_size
 
     def h_i(self, k: int, i: int, r: int) -> int:
         return (k >> i) % r
 
     def get_records_in_bucket(self, dir_pos: int) -> Iterator[Record]:
         bucket = self.directory[dir_pos]
+        assert bucket is not None
 
         for r_i in range(bucket.r):
             ptr = r_i + bucket.p
-            if self.primary_file[ptr] is not None:
-                yield self.primary_file[ptr]
+            if self.stats is not None:
+                self.stats.primary_reads += 1
+            rec = self.primary_file[ptr]
+            if rec is not None:
+                yield rec
     
     
     # def insert_into_primary_file(self, records: List[PrimaryFileRecord], offset: int):
@@ -54,31 +166,57 @@ class Cormack:
         
     def find_perfect_hashing_fn(self, records: List[Record]) -> Tuple[int, int]:
         """Finds (i,r), such that h_i(record.key, i, r) don't collide"""
+        keys = frozenset(self.hash_fn(rec.key) for rec in records)
+        if len(keys) < len(records):
+            raise Exception("Cannot perfect-hash records with duplicate keys or key hashes")
 
-        # always start with r == number of records to perfect-hash
-        r = len(records)
-        i = 0
-
-        while True:
-            hashes = [self.h_i(rec.key, i, r)  for rec in records]
-            unique_vals = set(hashes)
-            if len(unique_vals) == len(records):
-                # we found the right i,r
-                return (i, r)
-            elif hashes.count(0) > 1:
-                # no need to bit-shift further
-                r += 1
-                i = 0
-            else:
-                # collision, but we can try to bit-shift more
-                i += 1
+        return perfect_hash_params(keys, self.r_growth)
     
     def get_primary_file_ptr(self, key: int) -> int:
         bucket = self.directory[self.h(key)]
-        return self.h_i(key, bucket.i, bucket.r) + bucket.p
-
-    def lookup(self, key: int) -> Record:
-        return self.primary_file[self.get_primary_file_ptr(key)]
+        assert bucket is not None
+        return self.h_i(self.hash_fn(key), bucket.i, bucket.r) + bucket.p
+
+    def lookup(self, key: int) -> Optional[Record]:
+        """The record of the key, None if there is none - the slot of a missing key may hold a different record"""
+        if self.directory[self.h(key)] is None:
+            return None
+        if self.stats is not None:
+            self.stats.primary_reads += 1
+        rec = self.primary_file[self.get_primary_file_ptr(key)]
+        return rec if rec is not None and rec.key == key else None
+
+    def allocate(self, size: int) -> int:
+        """Returns start of a free region of 'size' slots in the primary file, growing the file when needed"""
+        start = self.free_list.allocate(size)
+        if start is not None:
+            return start
+
+        start = self.free_space_ptr
+        self.free_space_ptr += size
+        if self.free_space_ptr > len(self.primary_file):
+            # grow the primary file at least twice, so that growing is amortized O(1) per slot
+            new_size = max(2 * len(self.primary_file), self.free_space_ptr)
+            self.primary_file.extend([None] * (new_size - len(self.primary_file)))
+            self.primary_file_size = new_size
+        return start
+
+    def release(self, start: int, size: int) -> None:
+        self.primary_file[start:start + size] = [None] * size
+        self.free_list.release(start, size)
+
+    def place_bucket(self, dir_pos: int, records: List[Record]) -> None:
+        """Finds perfect hashing function for the records and writes them into a newly allocated region.
+        The function is found before anything changes, so when it raises, the table stays as it was."""
+        i, r = self.find_perfect_hashing_fn(records)
+        bucket = Bucket(i, r, self.allocate(r))
+        self.directory[dir_pos] = bucket
+
+        for rec in records:
+            new_pos = self.get_primary_file_ptr(rec.key)
+            if self.trace is not None:
+                self.trace(f"re-inserting key {rec.key} at {new_pos}")
+            self.primary_file[new_pos] = rec
 
     def insert(self, record: Record) -> None:
         """inserts data record into primary file based on it's hash key"""
@@ -89,37 +227,100 @@ class Cormack:
         # if the bucket is empty
         if bucket is None:
             # There is no collision and we can happily insert the datarecord
-            print(f"inserting {record} into free bucket")
-            self.directory[dir_pos] = Bucket(0, 1, self.free_space_ptr)
-            self.primary_file[self.free_space_ptr] = record
-
-            assert self.free_space_ptr == self.get_primary_file_ptr(record.key)
-
-            self.free_space_ptr += 1
-
-
-        elif self.get_primary_file_ptr(record.key) is None:
-            # there is still free space we can use
+            if self.trace is not None:
+                self.trace(f"inserting {record} into free bucket")
+            new_bucket = Bucket(0, 1, self.allocate(1))
+            self.directory[dir_pos] = new_bucket
+            self.primary_file[new_bucket.p] = record
 
+        else:
             new_pos = self.get_primary_file_ptr(record.key)
-            print(f"inserting {record.key} to free space in a bucket at {new_pos}")
-            self.primary_file[new_pos] = record
+            occupant = self.primary_file[new_pos]
 
+            if occupant is None:
+                # there is still free space we can use
+                if self.trace is not None:
+                    self.trace(f"inserting {record.key} to free space in a bucket at {new_pos}")
+                self.primary_file[new_pos] = record
 
+            elif occupant.key == record.key:
+                # the bucket's function is perfect, so the key could only have been stored in this slot
+                raise Exception(f"Cannot insert {record.key}, it's already been inserted")
 
-        else:
-            records_to_insert = [record] + list(self.get_records_in_bucket(dir_pos))
-            print("Collision, reinserting records:", records_to_insert)
-
-            bucket.i, bucket.r = self.find_perfect_hashing_fn(records_to_insert)
-            bucket.p = self.free_space_ptr
-
-            for rec in records_to_insert:
-                new_pos = self.get_primary_file_ptr(rec.key)
-                print(f"re-inserting key {rec.key} at {new_pos}")
-                self.primary_file[new_pos] = rec
-            
-            self.free_space_ptr += bucket.r
+            else:
+                records_to_insert = [record] + list(self.get_records_in_bucket(dir_pos))
+                if self.trace is not None:
+                    self.trace(f"Collision, reinserting records: {records_to_insert}")
+                if self.stats is not None:
+                    self.stats.record_moves += len(records_to_insert) - 1
+
+                # the old region is released only once the records are in the new one, if no perfect function
+                # is found (distinct keys with the same hash), the bucket stays untouched
+                self.place_bucket(dir_pos, records_to_insert)
+                self.release(bucket.p, bucket.r)
+
+        self.n_records += 1
+
+        if self.n_records > self.max_bucket_load * self.directory_size:
+            self.resize_directory(2 * self.directory_size + 1)
+        elif self.free_list.free_slots > self.compact_threshold * self.free_space_ptr:
+            self.compact()
+
+    def compact(self) -> None:
+        """Moves all bucket regions to the beginning of the primary file, so that there are no holes between them.
+        Regions only move towards the beginning in the order of their position, so it's done in place."""
+        if self.trace is not None:
+            self.trace(f"Compacting primary file, {self.free_list.free_slots} of {self.free_space_ptr} slots are free")
+
+        ptr = 0
+        for bucket in sorted((b for b in self.directory if b is not None), key=lambda b: b.p):
+            if bucket.p != ptr:
+                self.primary_file[ptr:ptr + bucket.r] = self.primary_file[bucket.p:bucket.p + bucket.r]
+                if self.stats is not None:
+                    self.stats.record_moves += bucket.r
+                bucket.p = ptr
+            ptr += bucket.r
+
+        self.primary_file[ptr:self.free_space_ptr] = [None] * (self.free_space_ptr - ptr)
+        self.free_space_ptr = ptr
+        self.free_list.clear()
+
+    def resize_directory(self, new_size: int) -> None:
+        """Rehashes all records into a directory of 'new_size' buckets and a new primary file"""
+        if self.trace is not None:
+            self.trace(f"Resizing directory from {self.directory_size} to {new_size}")
+        if self.stats is not None:
+            self.stats.directory_doublings += 1
+            self.stats.record_moves += self.n_records
+
+        new_buckets: List[List[Record]] = [[] for _ in range(new_size)]
+        for rec in self.primary_file[:self.free_space_ptr]:
+            if rec is not None:
+                new_buckets[self.hash_fn(rec.key) % new_size].append(rec)
+
+        # the new directory and file are built aside and swapped in, once every bucket has been placed
+        directory: List[Optional[Bucket]] = [None] * new_size
+        placed: List[Tuple[Bucket, List[Record]]] = []
+        ptr = 0
+        for dir_pos, records in enumerate(new_buckets):
+            if records:
+                i, r = self.find_perfect_hashing_fn(records)
+                bucket = Bucket(i, r, ptr)
+                directory[dir_pos] = bucket
+                placed.append((bucket, records))
+                ptr += r
+
+        primary_file: List[Optional[Record]] = [None] * max(len(self.primary_file), ptr)
+        for bucket, records in placed:
+            for rec in records:
+                primary_file[self.h_i(self.hash_fn(rec.key), bucket.i, bucket.r) + bucket.p] = rec
+
+        self.directory_size = new_size
+        self.directory = directory
+        self.primary_file = primary_file
+        self.primary_file_size = len(primary_file)
+        self.free_space_ptr = ptr
+        self.free_list.clear()
 
 
 if __name__ == "__main__":
@@ -127,7 +328,8 @@ if __name__ == "__main__":
     print("Records to insert:\n", "\n".join(list(map(str, DATA_RECORDS))))
     print()
     
-    cormack = Cormack()
+    stats = AccessStats()
+    cormack = Cormack(stats=stats, trace=print)
     # Test inserting all records by "age" key
 
     print("Inserting data records...")
@@ -138,4 +340,8 @@ if __name__ == "__main__":
     print("\n\nRecords lookup:")
     for rec in DATA_RECORDS:
         print(f"Searching for age={rec.age}")
-        print(cormack.lookup(rec.age).data)
\ No newline at end of file
+        found = cormack.lookup(rec.age)
+        assert found is not None
+        print(found.data)
+
+    print(f"\n{stats}")
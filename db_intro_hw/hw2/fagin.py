@@ -1,8 +1,13 @@
-from typing import List, Any
-from db_intro_hw.hw2 import Record
+from typing import Iterable, List, Any, Optional
+from db_intro_hw.hw2 import AccessStats, Record, Trace
+from db_intro_hw.hw2.hashing import HashFn, identity
 from db_intro_hw.hw1 import DATA_RECORDS
 
 
+# the directory never grows beyond 2**MAX_GLOBAL_DEPTH slots, records needing more bits to be told apart are rejected
+MAX_GLOBAL_DEPTH = 32
+
+
 def LSB(n: int, k: int):
     """return first k least-significant bits"""
     return (2**k - 1) & n
@@ -26,8 +31,7 @@ class Page:
 
     def find(self, key: int) -> Record:
         # just linear-scan through the page, which would be loaded into primary memory, so it would be cheap
-        # TODO: what about collisions?
-
+        # records with colliding hashes share the page, they are told apart by their keys
         for rec in self.data:
             if key == rec.key:
                 return rec
@@ -35,67 +39,106 @@ class Page:
 
 
 class Fagin:
-    def __init__(self):
+    def __init__(self, stats: Optional[AccessStats] = None, trace: Trace = None, hash_fn: HashFn = identity):
         # we start with only one pointer
         self.global_depth = 0
 
         # to an empty page
         self.pointers = [Page(0)]
+
+        # the directory is indexed by the low bits of hash_fn(key)
+        self.hash_fn = hash_fn
+
+        # opt-in instrumentation, both are None by default and cost nothing then
+        self.stats = stats
+        self.trace = trace
     
 
     def split(self, index: int) -> None:
         old_page = self.pointers[index]
-        new_depth = old_page.local_depth + 1
-        p1, p2 = Page(new_depth), Page(new_depth)
-
-
-        # update pointers that point to the old_page
-        for i in range(len(self.pointers)):
-            if id(self.pointers[i]) == id(old_page):
-                if i & (2**old_page.local_depth) == 0:
-                    self.pointers[i] = p1
-                else:
-                    self.pointers[i] = p2
+        local_depth = old_page.local_depth
+        p1, p2 = Page(local_depth + 1), Page(local_depth + 1)
+
+        if self.stats is not None:
+            self.stats.splits += 1
+            self.stats.record_moves += len(old_page.data)
+        if self.trace is not None:
+            self.trace(f"Splitting page with local_depth={local_depth} at index {index}")
+
+        # the old page is pointed to by every slot, whose lowest 'local_depth' bits match,
+        # that is every (2**local_depth)-th slot starting at 'start'. The next bit decides between p1 and p2.
+        bit = 2**local_depth
+        start = index & (bit - 1)
+        n_slots = len(self.pointers) // (2 * bit)
+        self.pointers[start::2 * bit] = [p1] * n_slots
+        self.pointers[start + bit::2 * bit] = [p2] * n_slots
+
+        # distribute the records directly, they all fit, since they've fit into the old page
+        for rec in old_page.data:
+            if self.get_hash(rec.key) & bit == 0:
+                p1.insert(rec)
+            else:
+                p2.insert(rec)
 
+    def double_directory(self) -> None:
+        """Increases global depth, the new upper half of the directory points to the same pages as the lower half"""
+        self.pointers.extend(self.pointers)
+        self.global_depth += 1
 
-        # re-insert the records back in the hashtable
-        self.insert(old_page.data)
+        if self.stats is not None:
+            self.stats.directory_doublings += 1
+        if self.trace is not None:
+            self.trace(f"Doubling the directory, global_depth={self.global_depth}")
 
 
     def find(self, key: int) -> Record:
         page = self.pointers[self.get_hash(key)]
+        if self.stats is not None:
+            self.stats.primary_reads += 1
         return page.find(key)
 
     
-    def insert(self, records: List[Record]) -> None:
-        for rec in records:
-
-            h = self.get_hash(rec.key)
+    def insert(self, record: Record) -> None:
+        # each split or doubling makes room for the record or brings it closer to it, so just try again
+        while True:
+            h = self.get_hash(record.key)
 
             page = self.pointers[h]
-            if page.full:
-                if page.local_depth < self.global_depth:
-                    # split the page
-                    self.split(h)
-
-                    # and try again
-                    self.insert([rec])
-
-                else:
-                    # increase global depth and copy references
-                    self.pointers = self.pointers + self.pointers
-                    self.global_depth += 1
-
-                    # try again
-                    self.insert([rec])
-
+            if self.stats is not None:
+                self.stats.primary_reads += 1
+
+            if not page.full:
+                page.insert(record)
+                return
+
+            if page.local_depth < self.global_depth:
+                self.split(h)
+            elif self.required_depth(page, record) > MAX_GLOBAL_DEPTH:
+                raise Exception(f"Cannot insert key {record.key}, more than {Page.PAGE_SIZE} records share "
+                                f"the lowest {MAX_GLOBAL_DEPTH} bits of its hash")
             else:
-                page.insert(rec)
+                self.double_directory()
+
+    def required_depth(self, page: Page, record: Record) -> float:
+        """Global depth, at which the full page splits so that the record fits - one more than the number
+        of low hash bits it shares with the page's records, infinite if all of their hashes are equal to its hash"""
+        h = self.hash_fn(record.key)
+        # lowest bit, in which the hash of some record of the page differs from h
+        diff = 0
+        for rec in page.data:
+            d = self.hash_fn(rec.key) ^ h
+            diff |= d & -d
+        # it's enough for one record to leave the record's page
+        return (diff & -diff).bit_length() if diff else float("inf")
+
+    def insert_many(self, records: Iterable[Record]) -> None:
+        for rec in records:
+            self.insert(rec)
 
 
     def get_hash(self, key: int) -> int:
         # first 'global_depth' least significant bits
-        return LSB(key, self.global_depth)
+        return LSB(self.hash_fn(key), self.global_depth)
 
 
 if __name__ == "__main__":
@@ -105,13 +148,16 @@ if __name__ == "__main__":
     print()
 
 
-    fagin = Fagin()
+    stats = AccessStats()
+    fagin = Fagin(stats=stats, trace=print)
     print("Inserting data records...")
     for rec in DATA_RECORDS:
         print("Inserting: ", rec)
-        fagin.insert([Record(rec.age, rec)])
+        fagin.insert(Record(rec.age, rec))
 
     print("\n\nRecords lookup:")
     for rec in DATA_RECORDS:
         print(f"Searching for age={rec.age}")
-        print(fagin.find(rec.age).data)
\ No newline at end of file
+        print(fagin.find(rec.age).data)
+
+    print(f"\n{stats}")
@@ -0,0 +1,155 @@
+"""Hash functions for the hw2 tables and diagnostics of how evenly they spread a sample of keys.
+
+Every table routes a key by the hash modulo its size or by the lowest bits of the hash. The default 'identity'
+uses integer keys as they are, which is fine for random keys, but keys sharing their low bits (ages, multiples
+of a page size, ids with a type tag in the low bits) all land in the same few buckets. The mixers spread every bit
+of the key over the low bits of the hash. String keys (e.g. PersonRecord.name) are turned into integers first.
+
+Usage: python -m db_intro_hw.hw2.hashing [n_keys]
+"""
+from collections import Counter
+from dataclasses import dataclass
+from hashlib import blake2b
+from math import ceil
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+# takes a key, returns a non-negative integer, the tables take it modulo their size or its low bits.
+# It must be injective on integer keys (all of the HASH_FUNCTIONS are, for keys below 2**64) - distinct keys
+# with equal hashes can't be separated by any directory depth in Fagin or by any perfect hash in Cormack
+HashFn = Callable[[Any], int]
+
+MASK64 = 2**64 - 1
+# 2**64 / golden ratio, odd
+FIBONACCI_MULTIPLIER = 0x9E3779B97F4A7C15
+
+
+def key_to_int(key: Any) -> int:
+    """Integers stay as they are, strings and bytes are hashed into 64 bits.
+    Python's hash() is not used for them, it's randomized per process (PYTHONHASHSEED)."""
+    if isinstance(key, int):
+        return key
+    if isinstance(key, str):
+        key = key.encode()
+    if isinstance(key, bytes):
+        return int.from_bytes(blake2b(key, digest_size=8).digest(), "little")
+    raise Exception(f"Cannot hash key {key!r} of type {type(key).__name__}")
+
+
+def identity(key: Any) -> int:
+    """The key itself, the behaviour of the tables before hash functions were pluggable"""
+    return key if type(key) is int else key_to_int(key)
+
+
+def fibonacci(key: Any) -> int:
+    """Multiplicative hashing. The low bits of a product only depend on the low bits of the key,
+    so the upper half of the 64-bit product is folded into the lower half, which the tables route by.
+    Both steps are invertible, distinct 64-bit keys keep distinct hashes."""
+    x = (key_to_int(key) * FIBONACCI_MULTIPLIER) & MASK64
+    return x ^ (x >> 32)
+
+
+def splitmix64(key: Any) -> int:
+    """Finalizer of the SplitMix64 generator, every bit of the 64-bit key affects every bit of the hash"""
+    z = (key_to_int(key) + FIBONACCI_MULTIPLIER) & MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK64
+    return z ^ (z >> 31)
+
+
+HASH_FUNCTIONS: Dict[str, HashFn] = {
+    "identity": identity,
+    "fibonacci": fibonacci,
+    "splitmix64": splitmix64,
+}
+
+
+# depth reported for keys, whose hashes can't be told apart by any number of low bits
+MAX_DEPTH = 64
+
+
+@dataclass
+class SkewReport:
+    """How a sample of keys spreads over n_buckets buckets of page_size records"""
+    n_keys: int
+    n_buckets: int
+    page_size: int
+    # bucket occupancy -> number of buckets with it
+    histogram: Dict[int, int]
+    # the most records in one bucket
+    max_bucket: int
+    # pages of the longest chain (LinearHashing with one primary page per bucket)
+    worst_chain: int
+    # low bits of the hash needed, so that no page_size + 1 keys share them (the global depth Fagin grows to),
+    # None when more than page_size keys have the same hash. Fagin rejects such keys, and also keys needing
+    # a depth beyond its MAX_GLOBAL_DEPTH
+    directory_depth: Optional[int]
+
+    @property
+    def empty_buckets(self) -> int:
+        return self.histogram.get(0, 0)
+
+    @property
+    def overflowing_buckets(self) -> int:
+        return sum(count for occupancy, count in self.histogram.items() if occupancy > self.page_size)
+
+    def __str__(self):
+        depth = self.directory_depth if self.directory_depth is not None else "inf"
+        hist = ", ".join(f"{occupancy}: {count}" for occupancy, count in sorted(self.histogram.items()))
+        return (f"{self.n_keys} keys in {self.n_buckets} buckets: max bucket {self.max_bucket}, "
+                f"worst chain {self.worst_chain} pages, {self.empty_buckets} empty, "
+                f"{self.overflowing_buckets} overflowing, directory depth {depth}\n    occupancy histogram {{{hist}}}")
+
+
+def directory_depth(hashes: List[int], page_size: int) -> Optional[int]:
+    for depth in range(MAX_DEPTH + 1):
+        mask = 2**depth - 1
+        if max(Counter(h & mask for h in hashes).values(), default=0) <= page_size:
+            return depth
+    return None
+
+
+def diagnose(keys: Iterable[Any], hash_fn: HashFn = identity, n_buckets: Optional[int] = None,
+             page_size: int = 3) -> SkewReport:
+    """Spreads the keys over n_buckets buckets (by default as many, as a table at load factor 1 would have)
+    and reports their occupancy. For a power of two n_buckets, hash modulo n_buckets are its low bits,
+    which is how Fagin and LinearHashing route keys."""
+    hashes = [hash_fn(k) for k in keys]
+    if n_buckets is None:
+        n_buckets = max(1, ceil(len(hashes) / page_size))
+
+    occupancy = Counter(h % n_buckets for h in hashes)
+    histogram = Counter(occupancy.values())
+    if len(occupancy) < n_buckets:
+        histogram[0] = n_buckets - len(occupancy)
+    max_bucket = max(occupancy.values(), default=0)
+
+    return SkewReport(len(hashes), n_buckets, page_size, dict(histogram), max_bucket,
+                      max(1, ceil(max_bucket / page_size)), directory_depth(hashes, page_size))
+
+
+def compare(keys: Iterable[Any], n_buckets: Optional[int] = None, page_size: int = 3,
+            hash_functions: Optional[Dict[str, HashFn]] = None) -> Dict[str, SkewReport]:
+    keys = list(keys)
+    hash_functions = hash_functions if hash_functions is not None else HASH_FUNCTIONS
+    return {name: diagnose(keys, fn, n_buckets, page_size) for name, fn in hash_functions.items()}
+
+
+if __name__ == "__main__":
+    import random
+    import sys
+    from db_intro_hw.hw1.generator import name_for
+
+    n = int(float(sys.argv[1])) if len(sys.argv) > 1 else 10_000
+    rnd = random.Random(0)
+    samples: Dict[str, List[Any]] = {
+        "random ids": rnd.sample(range(2**40), n),
+        "sequential ids": list(range(n)),
+        "ids * 1024": [i * 1024 for i in range(n)],
+        "names": [name_for(i) for i in range(n)],
+    }
+    for sample_name, keys in samples.items():
+        # a power of two, so that the buckets are the low bits of the hash
+        n_buckets = 2**max(0, ceil(n / 3) - 1).bit_length()
+        print(f"\n{sample_name}")
+        for name, report in compare(keys, n_buckets).items():
+            print(f"  {name:<11} {report}")
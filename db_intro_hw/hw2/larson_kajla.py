@@ -1,13 +1,25 @@
-from db_intro_hw.hw2 import Record
-from typing import Tuple, List, Optional
+from db_intro_hw.hw2 import AccessStats, Record, Trace
+from db_intro_hw.hw2.hashing import HashFn, identity
+from array import array
+from bisect import bisect_right
+from typing import Dict, Tuple, List, Optional
 
 
 
-def is_prime(x: int) -> bool:
-    for div in range(2, int(x ** 0.5) + 2):
-        if x % div == 0:
-            return False
-    return True
+# table sizes, every prime is the smallest one bigger than twice the previous one
+PRIME_SCHEDULE = [
+    5, 11, 23, 47, 97, 197, 397, 797, 1597, 3203, 6421, 12853, 25717, 51437, 102877, 205759, 411527,
+    823117, 1646237, 3292489, 6584983, 13169977, 26339969, 52679969, 105359939, 210719881, 421439783,
+    842879579, 1685759167, 3371518343,
+]
+
+
+def next_table_size(n_pages: int) -> int:
+    """Smallest scheduled prime bigger than n_pages"""
+    idx = bisect_right(PRIME_SCHEDULE, n_pages)
+    if idx == len(PRIME_SCHEDULE):
+        raise Exception(f"No scheduled table size bigger than {n_pages}")
+    return PRIME_SCHEDULE[idx]
 
 
 SIGNATURE_PRIME = 7
@@ -15,20 +27,18 @@ def compute_signature(key: int, i: int) -> int:
     return (key >> i) % SIGNATURE_PRIME
 
 
+# initial separator of every page, bigger than any signature, so the page accepts everything
+MAX_SEPARATOR = SIGNATURE_PRIME
+
+
 class Page:
     PAGE_SIZE = 4
     def __init__(self) -> None:
-
-        # page separator
-        # this would be stored in our primary memory
-        # but for simplicity we keep it in the same 'Page' class
-        self.separator = 2**32
-
-        # list of records and their signatures
-        self.records: List[Tuple[Record, int]] = []
+        # records together with their signature and probe number 'i', with which they were placed into this page
+        self.records: List[Tuple[Record, int, int]] = []
     
     def find(self, key: int) -> Optional[Record]:
-        for r, _ in self.records:
+        for r, _, _ in self.records:
             if r.key == key:
                 return r
 
@@ -40,83 +50,289 @@ class Page:
         return len(self.records) == Page.PAGE_SIZE
 
 
-    def insert(self, record: Record, signature: int) -> None:
+    def insert(self, record: Record, signature: int, i: int) -> None:
         assert not self.full
-        assert signature < self.separator
-        self.records.append((record, signature))
-
+        self.records.append((record, signature, i))
 
 
-class LarsonKajla:
 
-    def __init__(self, n_pages = 5):
-        assert is_prime(n_pages)
+class Table:
+    """One Larson-Kajla table of a fixed prime number of pages"""
 
+    def __init__(self, n_pages: int, max_probes: int, hash_fn: HashFn = identity):
         self.n_pages = n_pages
+        # probe sequences and signatures are computed from hash_fn(key)
+        self.hash_fn = hash_fn
+        # records are never placed further than this along their probe sequence
+        self.max_probes = min(n_pages, max_probes)
         self.pages: List[Page] = [Page() for i in range(n_pages)]
 
+        # page separators, one byte per page, kept in primary memory
+        # a record with signature s may only be stored in a page, whose separator is bigger than s
+        self.separators = array("B", [MAX_SEPARATOR] * n_pages)
 
-    def h(self, key: int, i: int) -> int:
-        return (key + i) % self.n_pages
+        self.n_records = 0
+        # sum of (i + 1) over the stored records, that is the number of probes their insertion took
+        self.total_probes = 0
 
-    def find(self, key: int) -> Record:
-        # we don't know the value of i, so we must just try all of them in the worst case:
-        for i in range(0, self.n_pages):
-            page = self.pages[self.h(key, i)]
-            r = page.find(key)
-            if r is not None:
-                return r
-            print(f"Lookup of {key}, i={i} failed. Trying with {i+1}")
-        raise Exception(f"Record with key {key} not found!")
+    @property
+    def load_factor(self) -> float:
+        return self.n_records / (self.n_pages * Page.PAGE_SIZE)
 
-    def insert(self, record: Record) -> None:
+    @property
+    def avg_probes(self) -> float:
+        return self.total_probes / self.n_records if self.n_records else 0.0
+
+    def h(self, hashed: int, i: int) -> int:
+        return (hashed + i) % self.n_pages
+
+    def locate(self, key: int) -> Optional[int]:
+        """Index of the only page, which can contain the key, computed from the separators alone"""
+        hashed = self.hash_fn(key)
+        for i in range(self.max_probes):
+            page_idx = self.h(hashed, i)
+            if compute_signature(hashed, i) < self.separators[page_idx]:
+                return page_idx
+        return None
 
-        # Insert list of records one by one
-        # Each record is tied to parameter 'i', which is to be tried next for it's insertion"""
+    def find_in_page(self, page_idx: int, key: int, stats: Optional[AccessStats]) -> Optional[Record]:
+        if stats is not None:
+            stats.primary_reads += 1
+        return self.pages[page_idx].find(key)
+
+    def find_many(self, keys: List[int], stats: Optional[AccessStats]) -> List[Record]:
+        """Looks up all the keys, reading every involved page only once"""
+        by_page: Dict[int, List[int]] = {}
+        for idx, key in enumerate(keys):
+            page_idx = self.locate(key)
+            if page_idx is None:
+                raise Exception(f"Record with key {key} not found!")
+            by_page.setdefault(page_idx, []).append(idx)
+
+        results: List[Optional[Record]] = [None] * len(keys)
+        for page_idx, indices in by_page.items():
+            if stats is not None:
+                stats.primary_reads += 1
+
+            page_records = {r.key: r for r, _, _ in self.pages[page_idx].records}
+            for idx in indices:
+                r = page_records.get(keys[idx])
+                if r is None:
+                    raise Exception(f"Record with key {keys[idx]} not found!")
+                results[idx] = r
+
+        # every key has been found by now, the filter only narrows the type
+        return [r for r in results if r is not None]
+
+    def take_page(self, page_idx: int) -> List[Record]:
+        """Removes and returns all records of the page, its separator stays as it is"""
+        page = self.pages[page_idx]
+        records = [r for r, _, _ in page.records]
+        for _, _, i in page.records:
+            self.total_probes -= i + 1
+        self.n_records -= len(records)
+        page.records = []
+        return records
+
+    def place(self, page: Page, record: Record, sig: int, i: int) -> None:
+        page.insert(record, sig, i)
+        self.n_records += 1
+        self.total_probes += i + 1
+
+    def insert(self, record: Record, stats: Optional[AccessStats] = None, trace: Trace = None) -> List[Record]:
+        """Inserts the record, possibly moving other records further along their probe sequences.
+        Returns records, which ran out of probes and didn't fit anywhere (the table is too full for them)."""
+
+        # Each record is tied to parameter 'i', which is to be tried next for it's insertion
         records_with_iters: List[Tuple[Record, int]] = [(record, 0)]
+        homeless: List[Record] = []
 
         while len(records_with_iters) > 0:
 
-            print("Records to insert:")
-            print("\n".join([str(r.key)+ ", i=" + str(i) for r, i in records_with_iters]))
+            if trace is not None:
+                trace("Records to insert:\n" + "\n".join([str(r.key)+ ", i=" + str(i) for r, i in records_with_iters]))
 
 
             current, i = records_with_iters.pop()
-            assert i < self.n_pages
+            if i >= self.max_probes:
+                homeless.append(current)
+                continue
 
-            page_idx = self.h(current.key, i)
-            sig = compute_signature(current.key, i)
+            hashed = self.hash_fn(current.key)
+            page_idx = self.h(hashed, i)
+            sig = compute_signature(hashed, i)
+            separator = self.separators[page_idx]
 
-            print(f"Trying to insert {current.key} with i={i}, sig={sig} to page {page_idx}")
+            if trace is not None:
+                trace(f"Trying to insert {current.key} with i={i}, sig={sig} to page {page_idx}")
 
-            page = self.pages[page_idx]
             # we first check the signature with the separator, and only then we fetch the record from secondary memory
-            if sig < page.separator:
-                print(f"signature fits - {sig} < {page.separator}")
-                # Let's pretend that only now we're fetching the page 
-                if page.full:
-                    print(f"but the page is full. It's separator is {page.separator}")
-                    # lower the page separator
-                    page.separator = max([s for r, s in page.records])
-                    print(f"Lowering in to {page.separator}")
-
-                    # this is naive version of LarsonKajla, where we just take out all the records and re-insert them all again 
-                    records_with_iters += [(r, 0) for r, _ in page.records] + [(current, i)]
-                    page.records = []
-                    
-                else:
-                    page.insert(current, sig)
-            else:
+            if sig >= separator:
                 # let's increase the iteration
                 records_with_iters.append((current, i+1))
-                
+                continue
+
+            if trace is not None:
+                trace(f"signature fits - {sig} < {separator}")
+            # Let's pretend that only now we're fetching the page 
+            if stats is not None:
+                stats.primary_reads += 1
+
+            page = self.pages[page_idx]
+            if not page.full:
+                self.place(page, current, sig, i)
+                continue
+
+            # the page is full, lower its separator to the highest signature among its records and the new one,
+            # records reaching the new separator leave the page and continue with their next probe
+            new_separator = max(sig, max(s for _, s, _ in page.records))
+            self.separators[page_idx] = new_separator
+            if trace is not None:
+                trace(f"but the page is full. Lowering its separator from {separator} to {new_separator}")
+
+            staying = [entry for entry in page.records if entry[1] < new_separator]
+            moving = [(r, r_i + 1) for r, s, r_i in page.records if s >= new_separator]
+            self.n_records -= len(moving)
+            # the moving records were placed with i = next_i - 1, so their insertion took next_i probes
+            self.total_probes -= sum(next_i for _, next_i in moving)
+            page.records = staying
+
+            if stats is not None:
+                stats.splits += 1
+                stats.record_moves += len(moving)
+
+            records_with_iters += moving
+            if sig < new_separator:
+                self.place(page, current, sig, i)
+            else:
+                records_with_iters.append((current, i + 1))
+
+        return homeless
+
+
+class LarsonKajla:
+    """Larson-Kajla hashing, which grows to the next scheduled prime number of pages,
+    once the load factor or the average number of probes per record crosses its threshold.
+
+    A record, that would need more than 'max_probes' probes, also makes the table grow, this bounds the cost
+    of every insert and lookup. Growing is incremental: a new table is allocated and every following insert moves 'migrate_pages'
+    pages of the old table into it. Until all pages are moved, lookups consult both tables."""
+
+    def __init__(self, n_pages = 5, max_load: float = 0.6, max_avg_probes: float = 2.0, max_probes: int = 16,
+                 migrate_pages: int = 2, stats: Optional[AccessStats] = None, trace: Trace = None,
+                 hash_fn: HashFn = identity):
+        assert n_pages in PRIME_SCHEDULE, f"n_pages must be one of the scheduled primes {PRIME_SCHEDULE[:8]}..."
+        assert migrate_pages > 0
+
+        self.max_load = max_load
+        self.max_avg_probes = max_avg_probes
+        self.max_probes = max_probes
+        self.migrate_pages = migrate_pages
+        self.hash_fn = hash_fn
+
+        # all inserts go to 'table', 'old' is the table being migrated from, if any
+        self.table = Table(n_pages, max_probes, hash_fn)
+        self.old: Optional[Table] = None
+        # pages of 'old' before this index have already been moved into 'table'
+        self.migrate_ptr = 0
+
+        # opt-in instrumentation, both are None by default and cost nothing then
+        self.stats = stats
+        self.trace = trace
+
+    @property
+    def n_pages(self) -> int:
+        return self.table.n_pages
+
+    @property
+    def n_records(self) -> int:
+        return self.table.n_records + (self.old.n_records if self.old is not None else 0)
+
+    @property
+    def migrating(self) -> bool:
+        return self.old is not None
+
+    def find(self, key: int) -> Record:
+        if self.old is not None:
+            page_idx = self.old.locate(key)
+            if page_idx is not None and page_idx >= self.migrate_ptr:
+                r = self.old.find_in_page(page_idx, key, self.stats)
+                if r is not None:
+                    return r
+
+        # the separators tell us the page, so there is exactly one page access
+        page_idx = self.table.locate(key)
+        if page_idx is not None:
+            r = self.table.find_in_page(page_idx, key, self.stats)
+            if r is not None:
+                return r
+        raise Exception(f"Record with key {key} not found!")
+
+    def find_many(self, keys: List[int]) -> List[Record]:
+        """Looks up all the keys, reading every involved page only once (one by one during migration)"""
+        if self.old is not None:
+            return [self.find(key) for key in keys]
+        return self.table.find_many(keys, self.stats)
+
+    def insert(self, record: Record) -> None:
+        homeless = self.table.insert(record, self.stats, self.trace)
+
+        if self.old is not None:
+            homeless += self.migrate(self.migrate_pages)
+
+        if homeless or self.table.load_factor > self.max_load or self.table.avg_probes > self.max_avg_probes:
+            self.grow(homeless)
+
+    def grow(self, homeless: List[Record]) -> None:
+        """Starts migration into a bigger table, 'homeless' records are inserted into it right away"""
+        while True:
+            if self.old is not None:
+                # the previous migration must end first
+                homeless += self.migrate(self.old.n_pages)
+
+            if self.trace is not None:
+                self.trace(f"Growing from {self.table.n_pages} to {next_table_size(self.table.n_pages)} pages")
+            if self.stats is not None:
+                self.stats.directory_doublings += 1
+
+            self.old = self.table
+            self.table = Table(next_table_size(self.old.n_pages), self.max_probes, self.hash_fn)
+            self.migrate_ptr = 0
+
+            still_homeless = []
+            for rec in homeless:
+                still_homeless += self.table.insert(rec, self.stats, self.trace)
+            if not still_homeless:
+                return
+            homeless = still_homeless
+
+    def migrate(self, n_pages: int) -> List[Record]:
+        """Moves next 'n_pages' pages of the old table into the new one, returns records, which didn't fit"""
+        assert self.old is not None
+
+        end = min(self.migrate_ptr + n_pages, self.old.n_pages)
+        homeless = []
+        for page_idx in range(self.migrate_ptr, end):
+            records = self.old.take_page(page_idx)
+            if self.stats is not None:
+                self.stats.record_moves += len(records)
+            for rec in records:
+                homeless += self.table.insert(rec, self.stats, self.trace)
+        self.migrate_ptr = end
+
+        if self.migrate_ptr == self.old.n_pages:
+            self.old = None
+
+        return homeless
+
 
 if __name__ == "__main__":
     from db_intro_hw.hw1 import DATA_RECORDS, print_records
     print("Records to insert:\n", "\n".join(list(map(str, DATA_RECORDS))))
     print()
     
-    lk = LarsonKajla()
+    stats = AccessStats()
+    lk = LarsonKajla(stats=stats, trace=print)
     # Test inserting all records by "age" key
 
     print("Inserting data records...")
@@ -127,4 +343,8 @@ if __name__ == "__main__":
     print("\n\nRecords lookup:")
     for rec in DATA_RECORDS:
         print(f"Searching for age={rec.age}")
-        print(lk.find(rec.age).data)
\ No newline at end of file
+        print(lk.find(rec.age).data)
+
+    print(f"\n{stats}")
+
+    assert [r.data for r in lk.find_many([rec.age for rec in DATA_RECORDS])] == list(DATA_RECORDS)
@@ -1,6 +1,9 @@
-from typing import List, Any, Iterator
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import ContextManager, Dict, List, Any, Iterator, Optional, Tuple
 from dataclasses import dataclass
-from db_intro_hw.hw2 import Record
+from db_intro_hw.hw2 import AccessStats, Record, Trace
+from db_intro_hw.hw2.hashing import HashFn, identity
 from db_intro_hw.hw1 import DATA_RECORDS
 
 
@@ -33,28 +36,78 @@ class Bucket:
     def __init__(self):
         self.page_chain: List[Page] = [Page()]
 
+        # key -> index of the page in the chain, which holds the record
+        # this is kept in primary memory, so that find and delete access only one page of the chain
+        self.locations: Dict[int, int] = {}
 
-    def insert(self, record: Record) -> bool:
-        """Inserts record into bucket and returns True when bucket overflows"""
 
+    def insert(self, record: Record, stats: Optional[AccessStats] = None) -> bool:
+        """Inserts record into bucket and returns True when bucket overflows"""
+        if stats is not None:
+            # only the last page of the chain is accessed
+            if len(self.page_chain) == 1:
+                stats.primary_reads += 1
+            else:
+                stats.overflow_reads += 1
+
+        overflow = False
         if self.page_chain[-1].full:
             # generate new overflow page
             self.page_chain.append(Page())
-            self.page_chain[-1].data.append(record)
-            return True
-        else:
-            self.page_chain[-1].data.append(record)
-            return False
+            overflow = True
+
+        self.page_chain[-1].data.append(record)
+        self.locations[record.key] = len(self.page_chain) - 1
+        return overflow
         
 
-    def find(self, key: int) -> Record:
-        for page in self.page_chain:
-            for rec in page.data:
-                if rec.key == key:
-                    return rec
+    def page_for(self, key: int, stats: Optional[AccessStats] = None) -> int:
+        """Index of the page holding the key, counting the one page access"""
+        page_idx = self.locations.get(key)
+        if page_idx is None:
+            raise Exception(f"No record with key {key} found!")
+
+        if stats is not None:
+            if page_idx == 0:
+                stats.primary_reads += 1
+            else:
+                stats.overflow_reads += 1
+        return page_idx
+
+    def find(self, key: int, stats: Optional[AccessStats] = None) -> Record:
+        for rec in self.page_chain[self.page_for(key, stats)].data:
+            if rec.key == key:
+                return rec
 
         raise Exception(f"No record with key {key} found!")
 
+    def delete(self, key: int, stats: Optional[AccessStats] = None) -> Record:
+        """Removes the record, the hole is filled with the last record of the chain, so the chain never has gaps"""
+        page_idx = self.page_for(key, stats)
+        del self.locations[key]
+
+        page = self.page_chain[page_idx]
+        rec_idx = next(i for i, rec in enumerate(page.data) if rec.key == key)
+        record = page.data[rec_idx]
+
+        last_page = self.page_chain[-1]
+        if stats is not None and last_page is not page:
+            stats.overflow_reads += 1
+
+        last = last_page.data.pop()
+        if last is not record:
+            page.data[rec_idx] = last
+            self.locations[last.key] = page_idx
+
+        # drop the emptied overflow page
+        if not last_page.data and len(self.page_chain) > 1:
+            self.page_chain.pop()
+
+        return record
+
+    def __len__(self) -> int:
+        return len(self.locations)
+
     def get_all(self) -> Iterator[Record]:
         for page in self.page_chain:
             for rec in page.data:
@@ -73,31 +126,113 @@ class Bucket:
 
 
 class LinearHashing:
+    """Linear hashing with one of two split policies:
+        - max_load is None: split whenever an insert creates an overflow page (the textbook variant)
+        - otherwise: split while the load factor records / (buckets * PAGE_SIZE) is above max_load
+    When min_load is set, delete merges the last split bucket back while the load factor is below min_load.
 
-    def __init__(self):
-        # defines domains of h1 and h2
-        self.m = 1
-        self.p = 0
+    With thread_safe=True, find, insert and delete may be called from several threads. Every bucket has its own lock,
+    so operations on different buckets go ahead in parallel, splits and merges are serialized by one more lock.
+    (m, p) is published as one tuple. An operation locks the bucket the key hashes to and then checks, that the lock
+    it holds is still the lock of that bucket (a merge drops it, a later split creates a new one at the same index)
+    and that the key still hashes there. Otherwise a split or merge got in between and it tries again.
+
+    Keys are expected to be unique."""
+
+    def __init__(self, max_load: Optional[float] = None, min_load: Optional[float] = None,
+                 stats: Optional[AccessStats] = None, trace: Trace = None, thread_safe: bool = False,
+                 hash_fn: HashFn = identity):
+        assert max_load is None or max_load > 0
+        assert min_load is None or max_load is None or min_load < max_load
+
+        self.max_load = max_load
+        self.min_load = min_load
+        # h1 and h2 take hash_fn(key) modulo the number of buckets
+        self.hash_fn = hash_fn
+
+        # (m, p) define domains of h1 and h2, they are always replaced together
+        self.mp: Tuple[int, int] = (1, 0)
 
-        self.buckets = [Bucket()]
+        # there are always 2**m + p buckets
+        self.buckets = [Bucket() for _ in range(2**self.m)]
+        self.n_records = 0
+
+        # one lock per bucket, and a lock for n_records, splits and merges
+        self.locks: Optional[List[threading.Lock]] = [threading.Lock() for _ in self.buckets] if thread_safe else None
+        self.structure_lock: ContextManager = threading.Lock() if thread_safe else nullcontext()
+
+        # opt-in instrumentation, both are None by default and cost nothing then
+        self.stats = stats
+        self.trace = trace
+
+    @property
+    def m(self) -> int:
+        return self.mp[0]
+
+    @property
+    def p(self) -> int:
+        return self.mp[1]
 
     def h1(self, key: int) -> int:
-        return key % (2**self.m)
+        return self.hash_fn(key) % (2**self.m)
 
     def h2(self, key: int) -> int:
-        return key % (2**(self.m + 1))
+        return self.hash_fn(key) % (2**(self.m + 1))
 
     def h(self, key: int) -> int:
-        hash_val = self.h1(key)
-        if hash_val < self.p:
-            return self.h2(key)
+        # m and p are read at once, they can't come from two different states
+        m, p = self.mp
+        hashed = self.hash_fn(key)
+        hash_val = hashed % (2**m)
+        if hash_val < p:
+            return hashed % (2**(m + 1))
         return hash_val
 
     def inc_p(self):
-        self.p += 1
-        if self.p % (2**self.m) == 0:
-            self.p = 0
-            self.m += 1
+        m, p = self.mp
+        p += 1
+        if p % (2**m) == 0:
+            p = 0
+            m += 1
+        self.mp = (m, p)
+
+    def dec_p(self):
+        m, p = self.mp
+        if p == 0:
+            m -= 1
+            p = 2**m
+        self.mp = (m, p - 1)
+
+    def bucket_lock(self, idx: int) -> ContextManager:
+        return self.locks[idx] if self.locks is not None else nullcontext()
+
+    def locked_bucket(self, key: int) -> ContextManager[int]:
+        """Index of the bucket of the key, in thread-safe mode the bucket stays locked until the block ends"""
+        if self.locks is None:
+            # the generator based context manager is only paid for in thread-safe mode
+            return nullcontext(self.h(key))
+        return self.lock_bucket(key)
+
+    @contextmanager
+    def lock_bucket(self, key: int) -> Iterator[int]:
+        assert self.locks is not None, "only used in thread-safe mode"
+        while True:
+            idx = self.h(key)
+            try:
+                lock = self.locks[idx]
+            except IndexError:
+                # the bucket has just been merged away
+                continue
+            with lock:
+                # a merge pops the lock of the bucket and a later split appends a new one at the same index,
+                # so it's not enough, that the key still hashes to idx - the lock must still be the bucket's lock
+                if idx < len(self.locks) and self.locks[idx] is lock and self.h(key) == idx:
+                    yield idx
+                    return
+
+    @property
+    def load_factor(self) -> float:
+        return self.n_records / (len(self.buckets) * Page.PAGE_SIZE)
 
     def __repr__(self):
         s = [f"Hashtable state: p={self.p}, m={self.m}"]
@@ -108,36 +243,95 @@ class LinearHashing:
 
 
     def split(self):
-        records_to_reinsert = list(self.buckets[self.p].get_all())
-        print("Reinserting following records:", records_to_reinsert)
-
-        self.buckets[self.p] = Bucket()
-        self.inc_p()
-
-        for rec in records_to_reinsert:
-            self.insert(rec)
+        """Splits bucket p into itself and a new bucket p + 2**m according to h2"""
+        new_idx = self.p + 2**self.m
+        assert new_idx == len(self.buckets)
+
+        p = self.p
+        with self.bucket_lock(p):
+            old = self.buckets[p]
+            stay, move = Bucket(), Bucket()
+            for rec in old.get_all():
+                if self.h2(rec.key) == new_idx:
+                    move.insert(rec)
+                else:
+                    stay.insert(rec)
+
+            if self.stats is not None:
+                self.stats.splits += 1
+                self.stats.record_moves += len(move)
+            if self.trace is not None:
+                self.trace(f"Splitting bucket {p}, moving {len(move)} records to bucket {new_idx}")
+
+            # the moved records are in the new bucket before any key hashes there,
+            # and the old bucket keeps all of them until the new (m, p) is published
+            self.buckets.append(move)
+            if self.locks is not None:
+                self.locks.append(threading.Lock())
+            self.inc_p()
+            self.buckets[p] = stay
+
+    def merge(self):
+        """Inverse of split, the last bucket is merged back into the bucket it was split from"""
+        m, p = self.mp
+        dst_idx = p - 1 if p > 0 else 2**(m - 1) - 1
+        src_idx = len(self.buckets) - 1
+
+        with self.bucket_lock(dst_idx), self.bucket_lock(src_idx):
+            src = self.buckets[src_idx]
+            dst = self.buckets[dst_idx]
+
+            # the records are in both buckets, until the old (m, p) stops being used
+            for rec in src.get_all():
+                dst.insert(rec)
+            self.dec_p()
+            self.buckets.pop()
+            if self.locks is not None:
+                self.locks.pop()
+
+        if self.stats is not None:
+            self.stats.merges += 1
+            self.stats.record_moves += len(src)
+        if self.trace is not None:
+            self.trace(f"Merging bucket {src_idx} back into bucket {dst_idx}")
     
     def insert(self, record: Record):
-        print("State before insert:")
-        print(str(self))
+        if self.trace is not None:
+            self.trace(f"State before insert:\n{self}")
 
-        bucket_idx = self.h(record.key)
-        if len(self.buckets) <= bucket_idx:
-            for i in range(bucket_idx - len(self.buckets) + 1):
-                self.buckets.append(Bucket())
-        
-        overflow = self.buckets[bucket_idx].insert(record)
+        with self.locked_bucket(record.key) as bucket_idx:
+            overflow = self.buckets[bucket_idx].insert(record, self.stats)
 
-        # overflow triggers bucket splitting
-        if overflow:
-            print(f"Overflow of bucket {bucket_idx} triggerd split!")
-            self.split()
-        
+        with self.structure_lock:
+            self.n_records += 1
+
+            if self.max_load is None:
+                # overflow triggers bucket splitting
+                if overflow:
+                    if self.trace is not None:
+                        self.trace(f"Overflow of bucket {bucket_idx} triggerd split!")
+                    self.split()
+            else:
+                while self.load_factor > self.max_load:
+                    self.split()
+
+    def delete(self, key: int) -> Record:
+        with self.locked_bucket(key) as bucket_idx:
+            record = self.buckets[bucket_idx].delete(key, self.stats)
+
+        with self.structure_lock:
+            self.n_records -= 1
 
+            if self.min_load is not None:
+                # never shrink below the initial 2 buckets
+                while len(self.buckets) > 2 and self.load_factor < self.min_load:
+                    self.merge()
 
+        return record
 
     def find(self, key: int) -> Record:
-        return self.buckets[self.h(key)].find(key)
+        with self.locked_bucket(key) as bucket_idx:
+            return self.buckets[bucket_idx].find(key, self.stats)
 
 
 if __name__ == "__main__":
@@ -147,7 +341,8 @@ if __name__ == "__main__":
     print()
 
 
-    lin_hashing = LinearHashing()
+    stats = AccessStats()
+    lin_hashing = LinearHashing(stats=stats, trace=print)
     print("Inserting data records...")
 
     for rec in DATA_RECORDS:
@@ -159,4 +354,40 @@ if __name__ == "__main__":
     print("\n\nRecords lookup:")
     for rec in DATA_RECORDS:
         print(f"Searching for age={rec.age}")
-        print(lin_hashing.find(rec.age).data)
\ No newline at end of file
+        print(lin_hashing.find(rec.age).data)
+
+    print(f"\n{stats}")
+
+
+    print("\n\nLoad-factor controlled table, deleting half of the records...")
+    lh = LinearHashing(max_load=0.8, min_load=0.4)
+    for rec in DATA_RECORDS:
+        lh.insert(Record(rec.age, rec))
+    print(f"{len(lh.buckets)} buckets, load factor {lh.load_factor:.2f}")
+
+    for rec in DATA_RECORDS[::2]:
+        lh.delete(rec.age)
+    for rec in DATA_RECORDS[1::2]:
+        assert lh.find(rec.age).data == rec
+    print(f"{len(lh.buckets)} buckets, load factor {lh.load_factor:.2f}")
+
+
+    print("\n\nThread-safe table, 4 threads inserting while 4 threads look up the records...")
+    import random
+    from concurrent.futures import ThreadPoolExecutor
+
+    ts = LinearHashing(max_load=0.8, thread_safe=True)
+    keys = random.sample(range(10**9), 20_000)
+    for k in keys[:1000]:
+        ts.insert(Record(k, k))
+
+    def lookups(_) -> int:
+        return sum(1 for _ in range(5) for k in keys[:1000] if ts.find(k).data == k)
+
+    with ThreadPoolExecutor(8) as pool:
+        inserts = [pool.submit(lambda part: [ts.insert(Record(k, k)) for k in part], keys[1000 + i::4]) for i in range(4)]
+        found = list(pool.map(lookups, range(4)))
+        for f in inserts:
+            f.result()
+    print(f"lookups found {found} records during {len(ts.buckets) - 2} splits")
+    assert all(ts.find(k).data == k for k in keys)
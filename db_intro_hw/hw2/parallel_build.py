@@ -0,0 +1,185 @@
+"""Bulk build of Fagin and LinearHashing tables in several processes.
+
+Both structures route a key by the low bits of its hash, so the records are partitioned by the lowest 'bits' bits
+of hash_fn(key),
+every partition is built in its own process and the parts are merged into one table:
+    - Fagin: slot s of the merged directory takes the page of partition s & (2**bits - 1),
+      which the part's own directory has for s. Pages keep at least 'bits' as their local depth.
+    - LinearHashing: (m, p) is computed up front from the number of records and the load factor, bucket i
+      gets records of partition i & (2**bits - 1) only, so every part fills its own subset of the bucket array.
+"""
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from math import ceil, log2
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Type, TypeVar, Union, cast
+
+from db_intro_hw.hw2 import Record
+from db_intro_hw.hw2.fagin import Fagin, Page as FaginPage
+from db_intro_hw.hw2.hashing import HashFn, identity
+from db_intro_hw.hw2.linear_hashing import Bucket, LinearHashing, Page as LinearHashingPage
+
+
+# load factor of LinearHashing tables, which don't set max_load themselves
+DEFAULT_LOAD = 0.75
+
+T = TypeVar("T")
+
+
+def partition(records: Iterable[Record], bits: int, hash_fn: HashFn = identity) -> List[List[Record]]:
+    parts: List[List[Record]] = [[] for _ in range(2**bits)]
+    mask = 2**bits - 1
+    for rec in records:
+        parts[hash_fn(rec.key) & mask].append(rec)
+    return parts
+
+
+def build_fagin_part(records: List[Record], hash_fn: HashFn) -> Fagin:
+    table = Fagin(hash_fn=hash_fn)
+    table.insert_many(records)
+    return table
+
+
+def merge_fagin(parts: List[Fagin], bits: int, hash_fn: HashFn = identity) -> Fagin:
+    table = Fagin(hash_fn=hash_fn)
+    table.global_depth = max([bits] + [part.global_depth for part in parts])
+
+    step = 2**bits
+    slots: List[Optional[FaginPage]] = [None] * 2**table.global_depth
+    for j, part in enumerate(parts):
+        # the part's directory repeated up to the global depth has the page of slot s at index s
+        pointers = part.pointers * 2**(table.global_depth - part.global_depth)
+        slots[j::step] = pointers[j::step]
+        # a page of a part, which hasn't grown its directory yet, is only shared by the slots of the partition
+        for page in {id(page): page for page in pointers[j::step]}.values():
+            page.local_depth = max(page.local_depth, bits)
+    # every slot belongs to exactly one partition, so none is left empty
+    table.pointers = cast(List[FaginPage], slots)
+    return table
+
+
+def linear_hashing_state(n_records: int, load: float) -> Tuple[int, int]:
+    """(m, p) of a table with enough buckets to hold the records at the load factor"""
+    n_buckets = max(2, ceil(n_records / (LinearHashingPage.PAGE_SIZE * load)))
+    m = int(log2(n_buckets))
+    return m, n_buckets - 2**m
+
+
+def build_linear_hashing_part(records: List[Record], mp: Tuple[int, int], first: int, step: int,
+                              hash_fn: HashFn) -> Dict[int, Bucket]:
+    """Buckets first, first + step, first + 2 * step, ... of a table in state (m, p)"""
+    table = LinearHashing(hash_fn=hash_fn)
+    table.mp = mp
+    buckets = {idx: Bucket() for idx in range(first, 2**mp[0] + mp[1], step)}
+    for rec in records:
+        buckets[table.h(rec.key)].insert(rec)
+    return buckets
+
+
+def run_parts(fn: Callable[..., T], workers: int, *args: Sequence[Any]) -> List[T]:
+    """fn applied to the zipped args, in a pool of 'workers' processes. With one worker, or on a single core,
+    where the processes would only take turns, the parts are built one after another in this process."""
+    if workers == 1 or os.cpu_count() == 1:
+        return list(map(fn, *args))
+    with ProcessPoolExecutor(workers) as pool:
+        return list(pool.map(fn, *args))
+
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+
+def parallel_build_fagin(records: Iterable[Record], workers: Optional[int] = None, **kwargs) -> Fagin:
+    """Builds a Fagin table (constructed with kwargs) from the records in a pool of 'workers' processes.
+    Keys are expected to be unique, a hash_fn must be picklable."""
+    workers = workers if workers is not None else default_workers()
+    # a power of two partitions, at least one per worker
+    bits = max(0, ceil(log2(workers)))
+    hash_fn = kwargs.get("hash_fn", identity)
+
+    parts = partition(records, bits, hash_fn)
+    tables = run_parts(build_fagin_part, workers, parts, [hash_fn] * len(parts))
+    table = merge_fagin(tables, bits, hash_fn)
+    table.stats, table.trace = kwargs.get("stats"), kwargs.get("trace")
+    return table
+
+
+def parallel_build_linear_hashing(records: Iterable[Record], workers: Optional[int] = None,
+                                  **kwargs) -> LinearHashing:
+    """Builds a LinearHashing table (constructed with kwargs) from the records in a pool of 'workers' processes.
+    Keys are expected to be unique, a hash_fn must be picklable."""
+    workers = workers if workers is not None else default_workers()
+    records = list(records)
+    hash_fn = kwargs.get("hash_fn", identity)
+
+    table = LinearHashing(**kwargs)
+    mp = linear_hashing_state(len(records), table.max_load if table.max_load is not None else DEFAULT_LOAD)
+    # a power of two partitions, at least one per worker, but bucket i only holds keys with the same low m bits
+    # as i, so there can't be more than 2**m partitions
+    bits = min(max(0, ceil(log2(workers))), mp[0])
+    parts = partition(records, bits, hash_fn)
+
+    step = 2**bits
+    n = len(parts)
+    built = run_parts(build_linear_hashing_part, workers, parts, [mp] * n, range(n), [step] * n, [hash_fn] * n)
+    buckets: List[Optional[Bucket]] = [None] * (2**mp[0] + mp[1])
+    for part_buckets in built:
+        for idx, bucket in part_buckets.items():
+            buckets[idx] = bucket
+    # part j builds buckets j, j + step, ..., together they build all of them
+    table.buckets = cast(List[Bucket], buckets)
+
+    table.mp = mp
+    table.n_records = len(records)
+    if table.locks is not None:
+        table.locks = [threading.Lock() for _ in table.buckets]
+    return table
+
+
+def parallel_build(records: Iterable[Record], workers: Optional[int] = None, cls: Type = Fagin,
+                   **kwargs) -> Union[Fagin, LinearHashing]:
+    """Builds a Fagin or LinearHashing table (given by 'cls', constructed with kwargs) from the records
+    in a pool of 'workers' processes"""
+    if cls is Fagin:
+        return parallel_build_fagin(records, workers, **kwargs)
+    if cls is LinearHashing:
+        return parallel_build_linear_hashing(records, workers, **kwargs)
+    raise Exception(f"parallel_build supports Fagin and LinearHashing, not {cls.__name__}")
+
+
+if __name__ == "__main__":
+    import random
+    import sys
+    import time
+
+    # Usage: python -m db_intro_hw.hw2.parallel_build [n_records] [max_workers]
+    n = int(float(sys.argv[1])) if len(sys.argv) > 1 else 200_000
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else default_workers()
+    worker_counts = [w for w in [1, 2, 4, 8] if w <= max_workers]
+    keys = random.sample(range(2**40), n)
+    records = [Record(k, None) for k in keys]
+    print(f"{os.cpu_count()} cores, {n} records")
+
+    start = time.perf_counter()
+    fagin = Fagin()
+    for rec in records:
+        fagin.insert(rec)
+    print(f"\n{'Fagin':<14} sequential insert   {time.perf_counter() - start:6.2f} s")
+    for workers in worker_counts:
+        start = time.perf_counter()
+        fagin = parallel_build_fagin(records, workers)
+        elapsed = time.perf_counter() - start
+        assert all(fagin.find(k).key == k for k in keys[:10_000])
+        print(f"{'Fagin':<14} parallel, {workers} workers {elapsed:6.2f} s")
+
+    start = time.perf_counter()
+    linear = LinearHashing(max_load=0.8)
+    for rec in records:
+        linear.insert(rec)
+    print(f"\n{'LinearHashing':<14} sequential insert   {time.perf_counter() - start:6.2f} s")
+    for workers in worker_counts:
+        start = time.perf_counter()
+        linear = parallel_build_linear_hashing(records, workers, max_load=0.8)
+        elapsed = time.perf_counter() - start
+        assert all(linear.find(k).key == k for k in keys[:10_000])
+        print(f"{'LinearHashing':<14} parallel, {workers} workers {elapsed:6.2f} s")
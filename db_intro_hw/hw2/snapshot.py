@@ -0,0 +1,432 @@
+"""Binary snapshots of built hash tables, reopened read-only through mmap.
+
+    save_snapshot(table, path) writes a Fagin, LinearHashing, LarsonKajla or Cormack table,
+    open_snapshot(path) returns a snapshot, which answers lookups the same way the table would.
+
+The file starts with a common header, a header of the structure, its arrays (directory, bucket starts, separators)
+and then its pages as fixed-size blocks: a record count followed by PAGE_SIZE (key, data) slots.
+Opening reads only the headers, a page is decoded when a lookup touches it for the first time and cached.
+
+Keys and data have to be integers, which is what an index pointing to record ids in the primary file stores.
+The hash function is stored by its name in HASH_FUNCTIONS, custom functions can't be saved.
+"""
+from __future__ import annotations
+import mmap
+import struct
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Tuple, Type, Union
+
+from db_intro_hw.hw2 import Record
+from db_intro_hw.hw2.cormack import Cormack
+from db_intro_hw.hw2.fagin import LSB, Fagin, Page as FaginPage
+from db_intro_hw.hw2.hashing import HASH_FUNCTIONS, HashFn
+from db_intro_hw.hw2.larson_kajla import LarsonKajla, compute_signature
+from db_intro_hw.hw2.linear_hashing import LinearHashing
+
+# magic, structure kind, hash function name, page size, number of records
+SNAPSHOT_HEADER = struct.Struct("<4sB16sIQ")
+MAGIC = b"HSNP"
+
+FAGIN, LINEAR_HASHING, LARSON_KAJLA, CORMACK = 1, 2, 3, 4
+
+# global depth, number of pages
+FAGIN_HEADER = struct.Struct("<II")
+# m, p, number of pages
+LINEAR_HASHING_HEADER = struct.Struct("<III")
+# number of tables (2 during migration, the new one first), migrate_ptr
+LARSON_KAJLA_HEADER = struct.Struct("<II")
+# number of pages, max_probes
+LARSON_KAJLA_TABLE = struct.Struct("<II")
+# directory size, number of primary file slots
+CORMACK_HEADER = struct.Struct("<II")
+# i, r, p of a directory bucket, r = 0 for an empty one
+CORMACK_BUCKET = struct.Struct("<III")
+
+# every page block starts with its record count
+PAGE_HEADER = struct.Struct("<Q")
+RECORD = struct.Struct("<qq")
+U32 = struct.Struct("<I")
+
+
+def block_size(page_size: int) -> int:
+    return PAGE_HEADER.size + page_size * RECORD.size
+
+
+def hash_fn_name(hash_fn: HashFn) -> str:
+    for name, fn in HASH_FUNCTIONS.items():
+        if fn is hash_fn:
+            return name
+    raise Exception(f"Only hash functions from HASH_FUNCTIONS can be saved, not {hash_fn}")
+
+
+class SnapshotWriter:
+    """Writes the parts of a snapshot one after another, arrays and page blocks start at multiples of 8 bytes"""
+
+    def __init__(self, path: str, kind: int, hash_fn: HashFn, page_size: int, n_records: int):
+        self.file = open(path, "wb")
+        self.page_size = page_size
+        self.file.write(SNAPSHOT_HEADER.pack(MAGIC, kind, hash_fn_name(hash_fn).encode(), page_size, n_records))
+
+    def write(self, data: bytes) -> None:
+        self.file.write(data)
+
+    def write_array(self, data: bytes) -> None:
+        self.align()
+        self.file.write(data)
+
+    def write_u32s(self, values: List[int]) -> None:
+        self.write_array(struct.pack(f"<{len(values)}I", *values))
+
+    def write_pages(self, pages: List[List[Record]]) -> None:
+        self.align()
+        empty_slots = bytes(self.page_size * RECORD.size)
+        for records in pages:
+            assert len(records) <= self.page_size
+            block = [PAGE_HEADER.pack(len(records))]
+            for rec in records:
+                if type(rec.key) is not int or type(rec.data) is not int:
+                    raise Exception(f"Snapshots store integer keys and data (e.g. record ids), not {rec}")
+                block.append(RECORD.pack(rec.key, rec.data))
+            block.append(empty_slots[:(self.page_size - len(records)) * RECORD.size])
+            self.file.write(b"".join(block))
+
+    def align(self) -> None:
+        self.file.write(bytes(-self.file.tell() % 8))
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def save_snapshot(table: Union[Fagin, LinearHashing, LarsonKajla, Cormack], path: str) -> None:
+    if isinstance(table, Fagin):
+        save_fagin(table, path)
+    elif isinstance(table, LinearHashing):
+        save_linear_hashing(table, path)
+    elif isinstance(table, LarsonKajla):
+        save_larson_kajla(table, path)
+    elif isinstance(table, Cormack):
+        save_cormack(table, path)
+    else:
+        raise Exception(f"Cannot save a snapshot of {type(table).__name__}")
+
+
+def save_fagin(table: Fagin, path: str) -> None:
+    # pages in the order of their first slot
+    page_numbers: Dict[int, int] = {}
+    pages: List[FaginPage] = []
+    for page in table.pointers:
+        if id(page) not in page_numbers:
+            page_numbers[id(page)] = len(pages)
+            pages.append(page)
+
+    writer = SnapshotWriter(path, FAGIN, table.hash_fn, pages[0].PAGE_SIZE, sum(len(p.data) for p in pages))
+    writer.write(FAGIN_HEADER.pack(table.global_depth, len(pages)))
+    writer.write_u32s([page_numbers[id(page)] for page in table.pointers])
+    writer.write_array(bytes(page.local_depth for page in pages))
+    writer.write_pages([page.data for page in pages])
+    writer.close()
+
+
+def save_linear_hashing(table: LinearHashing, path: str) -> None:
+    # pages of a bucket's chain are stored next to each other, bucket i has pages bucket_starts[i] .. bucket_starts[i + 1] - 1
+    bucket_starts = [0]
+    pages = []
+    for bucket in table.buckets:
+        pages += [page.data for page in bucket.page_chain]
+        bucket_starts.append(len(pages))
+
+    page_size = table.buckets[0].page_chain[0].PAGE_SIZE
+    writer = SnapshotWriter(path, LINEAR_HASHING, table.hash_fn, page_size, table.n_records)
+    writer.write(LINEAR_HASHING_HEADER.pack(table.m, table.p, len(pages)))
+    writer.write_u32s(bucket_starts)
+    writer.write_pages(pages)
+    writer.close()
+
+
+def save_larson_kajla(table: LarsonKajla, path: str) -> None:
+    tables = [table.table] + ([table.old] if table.old is not None else [])
+    page_size = table.table.pages[0].PAGE_SIZE
+    writer = SnapshotWriter(path, LARSON_KAJLA, table.hash_fn, page_size, table.n_records)
+    writer.write(LARSON_KAJLA_HEADER.pack(len(tables), table.migrate_ptr))
+    for t in tables:
+        writer.align()
+        writer.write(LARSON_KAJLA_TABLE.pack(t.n_pages, t.max_probes))
+        writer.write(t.separators.tobytes())
+        writer.write_pages([[r for r, _, _ in page.records] for page in t.pages])
+    writer.close()
+
+
+def save_cormack(table: Cormack, path: str) -> None:
+    # every primary file slot is a page of one record
+    writer = SnapshotWriter(path, CORMACK, table.hash_fn, 1, table.n_records)
+    writer.write(CORMACK_HEADER.pack(table.directory_size, table.free_space_ptr))
+    writer.write_array(b"".join(CORMACK_BUCKET.pack(b.i, b.r, b.p) if b is not None else CORMACK_BUCKET.pack(0, 0, 0)
+                                for b in table.directory))
+    writer.write_pages([[rec] if rec is not None else [] for rec in table.primary_file[:table.free_space_ptr]])
+    writer.close()
+
+
+class Snapshot(ABC):
+    """Read-only table reopened from a snapshot file. Subclasses read their headers and arrays in __init__."""
+
+    def __init__(self, path: str):
+        self.file = open(path, "rb")
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buf = memoryview(self.mm)
+
+        magic, self.kind, hash_name, self.page_size, self.n_records = SNAPSHOT_HEADER.unpack_from(self.buf, 0)
+        if magic != MAGIC:
+            raise Exception(f"{path} is not a hash table snapshot")
+        self.hash_fn: HashFn = HASH_FUNCTIONS[hash_name.rstrip(b"\0").decode()]
+        self.offset = SNAPSHOT_HEADER.size
+        self.block_size = block_size(self.page_size)
+
+        # offset of a page block -> its decoded records, filled in by lookups
+        self.pages: Dict[int, List[Record]] = {}
+        self.pages_offset = 0
+
+    def read(self, header: struct.Struct) -> Tuple:
+        values = header.unpack_from(self.buf, self.offset)
+        self.offset += header.size
+        return values
+
+    def align(self) -> None:
+        self.offset += -self.offset % 8
+
+    def skip_array(self, n_bytes: int) -> int:
+        """Returns the offset of an array at the current position and moves behind it"""
+        self.align()
+        start = self.offset
+        self.offset += n_bytes
+        return start
+
+    def u32(self, array_offset: int, idx: int) -> int:
+        return U32.unpack_from(self.buf, array_offset + idx * U32.size)[0]
+
+    def skip_pages(self, n_pages: int) -> int:
+        return self.skip_array(n_pages * self.block_size)
+
+    def page(self, page_no: int, pages_offset: Optional[int] = None) -> List[Record]:
+        """Records of the page, decoded on the first access. Pages are numbered from pages_offset,
+        which is given by structures with more than one page region (LarsonKajla)."""
+        start = (pages_offset if pages_offset is not None else self.pages_offset) + page_no * self.block_size
+        records = self.pages.get(start)
+        if records is None:
+            count, = PAGE_HEADER.unpack_from(self.buf, start)
+            data_start = start + PAGE_HEADER.size
+            records = [Record(key, data) for key, data in
+                       RECORD.iter_unpack(self.buf[data_start:data_start + count * RECORD.size])]
+            self.pages[start] = records
+        return records
+
+    @abstractmethod
+    def find(self, key: int) -> Record:
+        """The record of the key, raises an exception if there is none"""
+
+    @property
+    def pages_loaded(self) -> int:
+        return len(self.pages)
+
+    def __len__(self) -> int:
+        return self.n_records
+
+    def close(self) -> None:
+        self.buf.release()
+        self.mm.close()
+        self.file.close()
+
+    def __enter__(self) -> Snapshot:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class FaginSnapshot(Snapshot):
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.global_depth, self.n_pages = self.read(FAGIN_HEADER)
+        self.pointers_offset = self.skip_array(2**self.global_depth * U32.size)
+        self.local_depths_offset = self.skip_array(self.n_pages)
+        self.pages_offset = self.skip_pages(self.n_pages)
+
+    def local_depth(self, page_no: int) -> int:
+        return self.buf[self.local_depths_offset + page_no]
+
+    def find(self, key: int) -> Record:
+        page_no = self.u32(self.pointers_offset, LSB(self.hash_fn(key), self.global_depth))
+        for rec in self.page(page_no):
+            if rec.key == key:
+                return rec
+        raise Exception(f"No record with key={key} found in page with local_depth={self.local_depth(page_no)}")
+
+
+class LinearHashingSnapshot(Snapshot):
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.m, self.p, self.n_pages = self.read(LINEAR_HASHING_HEADER)
+        self.n_buckets = 2**self.m + self.p
+        self.bucket_starts_offset = self.skip_array((self.n_buckets + 1) * U32.size)
+        self.pages_offset = self.skip_pages(self.n_pages)
+
+    def h(self, key: int) -> int:
+        hashed = self.hash_fn(key)
+        hash_val = hashed % (2**self.m)
+        if hash_val < self.p:
+            return hashed % (2**(self.m + 1))
+        return hash_val
+
+    def find(self, key: int) -> Record:
+        idx = self.h(key)
+        # the chain is read page by page, the per-bucket locations of the table aren't stored
+        for page_no in range(self.u32(self.bucket_starts_offset, idx), self.u32(self.bucket_starts_offset, idx + 1)):
+            for rec in self.page(page_no):
+                if rec.key == key:
+                    return rec
+        raise Exception(f"No record with key {key} found!")
+
+
+class LarsonKajlaSnapshot(Snapshot):
+    def __init__(self, path: str):
+        super().__init__(path)
+        n_tables, self.migrate_ptr = self.read(LARSON_KAJLA_HEADER)
+
+        # (n_pages, max_probes, separators offset, pages offset) of the new and the old table
+        self.tables: List[Tuple[int, int, int, int]] = []
+        for _ in range(n_tables):
+            self.align()
+            n_pages, max_probes = self.read(LARSON_KAJLA_TABLE)
+            separators_offset = self.offset
+            self.offset += n_pages
+            self.tables.append((n_pages, max_probes, separators_offset, self.skip_pages(n_pages)))
+
+    def locate(self, table: int, key: int) -> Optional[int]:
+        """Same as Table.locate() of larson_kajla with the separators read from the snapshot"""
+        n_pages, max_probes, separators_offset, _ = self.tables[table]
+        hashed = self.hash_fn(key)
+        for i in range(max_probes):
+            page_idx = (hashed + i) % n_pages
+            if compute_signature(hashed, i) < self.buf[separators_offset + page_idx]:
+                return page_idx
+        return None
+
+    def find_in_page(self, table: int, page_idx: int, key: int) -> Optional[Record]:
+        for rec in self.page(page_idx, self.tables[table][3]):
+            if rec.key == key:
+                return rec
+        return None
+
+    def find(self, key: int) -> Record:
+        if len(self.tables) > 1:
+            page_idx = self.locate(1, key)
+            if page_idx is not None and page_idx >= self.migrate_ptr:
+                r = self.find_in_page(1, page_idx, key)
+                if r is not None:
+                    return r
+
+        page_idx = self.locate(0, key)
+        if page_idx is not None:
+            r = self.find_in_page(0, page_idx, key)
+            if r is not None:
+                return r
+        raise Exception(f"Record with key {key} not found!")
+
+
+class CormackSnapshot(Snapshot):
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.directory_size, self.n_slots = self.read(CORMACK_HEADER)
+        self.directory_offset = self.skip_array(self.directory_size * CORMACK_BUCKET.size)
+        self.pages_offset = self.skip_pages(self.n_slots)
+
+    def lookup(self, key: int) -> Optional[Record]:
+        hashed = self.hash_fn(key)
+        i, r, p = CORMACK_BUCKET.unpack_from(self.buf, self.directory_offset + (hashed % self.directory_size) * CORMACK_BUCKET.size)
+        if r == 0:
+            return None
+        slot = self.page((hashed >> i) % r + p)
+        # the slot of a missing key may hold another key's record
+        return slot[0] if slot and slot[0].key == key else None
+
+    def find(self, key: int) -> Record:
+        """lookup() under the name the other snapshots use"""
+        rec = self.lookup(key)
+        if rec is None:
+            raise Exception(f"Record with key {key} not found!")
+        return rec
+
+
+SNAPSHOT_KINDS: Dict[int, Type[Snapshot]] = {
+    FAGIN: FaginSnapshot,
+    LINEAR_HASHING: LinearHashingSnapshot,
+    LARSON_KAJLA: LarsonKajlaSnapshot,
+    CORMACK: CormackSnapshot,
+}
+
+
+def open_snapshot(path: str) -> Snapshot:
+    with open(path, "rb") as f:
+        header = f.read(SNAPSHOT_HEADER.size)
+    if len(header) < SNAPSHOT_HEADER.size or header[:4] != MAGIC:
+        raise Exception(f"{path} is not a hash table snapshot")
+    kind = SNAPSHOT_HEADER.unpack(header)[1]
+    if kind not in SNAPSHOT_KINDS:
+        raise Exception(f"{path} holds an unknown structure kind {kind}")
+    return SNAPSHOT_KINDS[kind](path)
+
+
+if __name__ == "__main__":
+    import os
+    import random
+    import sys
+    import tempfile
+    import time
+
+    from db_intro_hw.hw2.hashing import splitmix64
+
+    n = int(float(sys.argv[1])) if len(sys.argv) > 1 else 200_000
+    keys = random.sample(range(2**40), n)
+    rids = {k: rid for rid, k in enumerate(keys)}
+    lookups = random.sample(keys, min(n, 1000))
+
+    print(f"{n} records, {len(lookups)} lookups right after opening\n")
+    print(f"{'table':<14}{'build s':>9}{'save s':>9}{'MB':>8}{'open ms':>9}{'lookups ms':>12}{'pages read':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        builds: List[Tuple[str, Callable[[], Union[Fagin, LinearHashing, LarsonKajla, Cormack]]]] = [
+            ("Fagin", lambda: Fagin(hash_fn=splitmix64)),
+            ("LinearHashing", lambda: LinearHashing(max_load=0.8, hash_fn=splitmix64)),
+            ("LarsonKajla", lambda: LarsonKajla(hash_fn=splitmix64)),
+            ("Cormack", lambda: Cormack(hash_fn=splitmix64)),
+        ]
+        for name, make in builds:
+            start = time.perf_counter()
+            table = make()
+            for rid, k in enumerate(keys):
+                table.insert(Record(k, rid))
+            built = time.perf_counter() - start
+
+            path = os.path.join(tmp, f"{name}.snap")
+            start = time.perf_counter()
+            save_snapshot(table, path)
+            saved = time.perf_counter() - start
+
+            start = time.perf_counter()
+            with open_snapshot(path) as snap:
+                opened = time.perf_counter() - start
+                start = time.perf_counter()
+                for k in lookups:
+                    assert snap.find(k).data == rids[k]
+                looked_up = time.perf_counter() - start
+
+                print(f"{name:<14}{built:>9.2f}{saved:>9.2f}{os.path.getsize(path) / 2**20:>8.1f}"
+                      f"{opened * 1000:>9.2f}{looked_up * 1000:>12.2f}{snap.pages_loaded:>12}")
+
+                assert all(snap.find(k).data == rids[k] for k in keys)
+                # keys are sampled below 2**40
+                absent = 2**40
+                try:
+                    snap.find(absent)
+                except Exception:
+                    pass
+                else:
+                    raise Exception(f"{name} snapshot found the absent key {absent}")
@@ -1,14 +1,125 @@
 from __future__ import annotations
-from typing import List, Optional
+from bisect import bisect_left
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
 from abc import ABC, abstractmethod
 
 
+class Validation(IntEnum):
+    """How much of the tree is checked by sanity_checks during tree operations"""
+    # no checks at all, the default
+    OFF = 0
+    # check only the nodes touched by the operation, O(height * arity)
+    LOCAL = 1
+    # check the whole tree before and after every operation, O(n) - only for debugging
+    FULL = 2
+
+
+@dataclass
+class TreeStats:
+    nodes: int
+    height: int
+    keys: int
+    # average ratio of keys in a node to its capacity (arity - 1)
+    avg_fill: float
+
+
 class Tree(ABC):
+    root: Node
+    validation: Validation
 
     @abstractmethod
     def insert(self, key: int) -> None:
         ...
 
+    def check_node(self, node: Optional[Node]) -> None:
+        """Local check of a node touched by the current operation"""
+        if self.validation >= Validation.LOCAL:
+            node_checks(node)
+
+    def check_tree(self) -> None:
+        """Full check of the whole tree"""
+        if self.validation >= Validation.FULL:
+            sanity_checks(self.root)
+
+    def stats(self) -> TreeStats:
+        """Walks the whole tree and reports its shape"""
+        height = 1
+        current = self.root
+        while not current.is_leaf_node():
+            current = current.child(0)
+            height += 1
+
+        nodes, keys, fill = 0, 0, 0.0
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            nodes += 1
+            keys += len(node.keys)
+            fill += len(node.keys) / (node.arity - 1)
+            stack.extend(c for c in node.children if c is not None)
+
+        return TreeStats(nodes, height, keys, fill / nodes)
+
+    def split(self, node: Node) -> Tuple[int, Node]:
+        """Splits an overfilled inner node, 'node' keeps the left half in place, the right half moves to a new sibling.
+        Returns the key that goes one level up together with the new sibling."""
+        middle_idx = len(node.keys) // 2
+        middle_key = node.keys[middle_idx]
+
+        right = Node(node.arity, node.redundant)
+        right.keys = node.keys[middle_idx + 1:]
+        right.children = node.children[middle_idx + 1:]
+
+        del node.keys[middle_idx:]
+        del node.children[middle_idx + 1:]
+
+        # we must also fix parent pointers of the children that moved to the new right sibling
+        for c in right.children:
+            if c is not None:
+                c.parent = right
+
+        return middle_key, right
+
+    def balance(self, node: Node) -> None:
+        if not node.overfilled:
+            self.check_node(node)
+            return
+        
+        # we've got to split
+        middle_key, right = self.split(node)
+
+        if node.parent is None:
+            assert id(node) == id(self.root)
+            # we are splitting a root
+            self.root = Node(node.arity, node.redundant)
+            self.root.keys = [middle_key]
+            self.root.children = [node, right]
+            node.parent, right.parent = self.root, self.root 
+
+            self.check_node(node)
+            self.check_node(right)
+            self.check_node(self.root)
+            return
+
+
+        # We are not in a root
+        p = node.parent
+        right.parent = p
+
+        # index of the middle key in the parent node after pulling it up one level
+        key_p_idx = p.get_key_idx(middle_key)
+
+        # 'node' stays at children[key_p_idx], the new sibling goes right after it
+        p.keys.insert(key_p_idx, middle_key)
+        p.children.insert(key_p_idx + 1, right)
+
+        self.check_node(node)
+        self.check_node(right)
+
+        self.balance(p)
+
 class Node:
     def __init__(self, arity = 4, redundant = False):
         self.arity = arity
@@ -19,23 +130,19 @@ class Node:
 
     def get_subnode(self, query_key: int) -> Optional[Node]:
         """Basically make one step of a find operation"""
-        sanity_checks(self)
-    
-        if len(self.keys) == 0:
-            return self.children[0]
-    
-        if not self.redundant:
-            assert query_key not in self.keys
+        # first key k with query_key <= k, or len(keys) when query_key is the largest
+        # if redundant, query_key isn't contained in self.keys, so that's why we can affort <= comparison even in the non-redundant case
+        return self.children[bisect_left(self.keys, query_key)]
 
-        for i, k in enumerate(self.keys):
-            # if redundant, query_key isn't contained in self.keys, so that's why we can affort <= comparison even in the non-redundant case
-            if query_key <= k:
-                return self.children[i]
-
-        return self.children[-1]
+    def child(self, idx: int) -> Node:
+        """Child of an inner node, which never has None children"""
+        child = self.children[idx]
+        assert child is not None
+        return child
 
     def is_leaf_node(self) -> bool:
-        return all(map(lambda c: c is None, self.children))
+        # children are either all None (leaf) or none of them is
+        return self.children[0] is None
 
     def __repr__(self):
         return f"Node - keys: {self.keys}, is_leaf_node={self.is_leaf_node()}"
@@ -52,19 +159,24 @@ class Node:
 
     def get_key_idx(self, key: int) -> int:
         """Return index into node's key array, where x belongs"""
+        i = bisect_left(self.keys, key)
+        assert i == len(self.keys) or self.keys[i] != key
+        return i
 
-        i = 0
-        while i < len(self.keys):
-            assert self.keys[i] != key
-            if self.keys[i] > key:
-                return i
-            i += 1
 
-        # key is the right-most key in node
-        return i
+class Leaf(Node):
+    """Leaf of a redundant tree, keeps record pointers next to its keys and a link to the next leaf"""
+    def __init__(self, arity = 4):
+        super().__init__(arity, redundant=True)
+        self.records: List[Any] = []
+        self.next_leaf: Optional[Leaf] = None
+
+    def __repr__(self):
+        return f"Leaf - keys: {self.keys}"
 
 
-def sanity_checks(node: Optional[Node]) -> None:
+def node_checks(node: Optional[Node]) -> None:
+    """Checks invariants of a single node and its direct children, without recursing further"""
     if node is None:
         return
     assert len(node.keys) <= node.arity - 1
@@ -80,7 +192,11 @@ def sanity_checks(node: Optional[Node]) -> None:
             assert check_fn(key, subkey) 
 
 
-    subkey_less_than_key = lambda key, subkey: key > subkey
+    # in a redundant tree, the key in an inner node is a copy of the largest key in its left subtree
+    if node.redundant:
+        subkey_less_than_key = lambda key, subkey: key >= subkey
+    else:
+        subkey_less_than_key = lambda key, subkey: key > subkey
     subkey_greater_than_key = lambda key, subkey: key < subkey
 
     for i, key in enumerate(node.keys):
@@ -92,39 +208,127 @@ def sanity_checks(node: Optional[Node]) -> None:
         if left_child is not None:
             assert id(left_child.parent) == id(node)
 
-        sanity_checks(left_child)
-        
-
     # also don't forget the right_child checks
     if len(node.keys) > 0:
         check_child_values(node.keys[-1], node.children[-1], subkey_greater_than_key)
-    
-    sanity_checks(node.children[-1])
+
+    if node.children[-1] is not None:
+        assert id(node.children[-1].parent) == id(node)
+
+    if isinstance(node, Leaf):
+        assert len(node.records) == len(node.keys)
+        if node.next_leaf is not None and len(node.keys) > 0 and len(node.next_leaf.keys) > 0:
+            assert node.keys[-1] < node.next_leaf.keys[0]
+
+
+def sanity_checks(node: Optional[Node]) -> None:
+    """Checks invariants of the whole subtree rooted at 'node'"""
+    if node is None:
+        return
+
+    node_checks(node)
+    for child in node.children:
+        sanity_checks(child)
     
 
 
 
 class NonRedundantBTree(Tree):
-    def __init__(self, root=None):
+    def __init__(self, root=None, validation: Validation = Validation.OFF):
         if root:
             self.root = root
         else:
             self.root: Node = Node()
 
-    
+        self.validation = validation
+
+    @classmethod
+    def bulk_load(cls, sorted_keys: Iterable[int], fill_factor: float = 1.0, arity: int = 4,
+                  validation: Validation = Validation.OFF) -> NonRedundantBTree:
+        """Builds the tree bottom-up from a stream of strictly increasing keys, without any splits.
+
+        The leaf level is built in a single pass over the keys, every inner level is then built
+        from the separators of the level below. Nodes are filled with fill_factor * (arity - 1) keys,
+        only the right-most node on each level is evened out with its left sibling."""
+        assert 0 < fill_factor <= 1
+
+        # minimal number of keys in a non-root node, as guaranteed by splitting in half
+        min_keys = max(1, (arity + 1) // 2 - 1)
+        node_keys = min(arity - 1, max(min_keys, round(fill_factor * (arity - 1))))
+
+        # leaf level, all children are null pointers
+        nodes, separators = cls._build_level(iter(sorted_keys), None, arity, node_keys, min_keys)
+
+        while len(nodes) > 1:
+            nodes, separators = cls._build_level(iter(separators), iter(nodes), arity, node_keys, min_keys)
+
+        tree = cls(nodes[0], validation)
+        tree.check_tree()
+        return tree
+
+    @staticmethod
+    def _build_level(keys: Iterator[int], children: Optional[Iterator[Node]], arity: int,
+                     node_keys: int, min_keys: int) -> Tuple[List[Node], List[int]]:
+        """Packs sorted keys into nodes of one level, returns the nodes and the separators between them"""
+        groups: List[List[int]] = [[]]
+        separators: List[int] = []
+
+        last_key = None
+        for key in keys:
+            assert last_key is None or last_key < key, "bulk_load requires strictly increasing keys"
+            last_key = key
+
+            if len(groups[-1]) == node_keys:
+                # the key separating this node from the next one goes one level up
+                separators.append(key)
+                groups.append([])
+            else:
+                groups[-1].append(key)
+
+        # the right-most node may be under-filled, so we even it out with its left sibling
+        if len(groups) > 1 and len(groups[-1]) < min_keys:
+            last = groups.pop()
+            combined = groups.pop() + [separators.pop()] + last
+
+            if len(combined) <= arity - 1:
+                groups.append(combined)
+            else:
+                middle_idx = len(combined) // 2
+                groups.append(combined[:middle_idx])
+                separators.append(combined[middle_idx])
+                groups.append(combined[middle_idx + 1:])
+
+        nodes = []
+        for group in groups:
+            node = Node(arity)
+            node.keys = group
+            if children is None:
+                node.children = [None] * (len(group) + 1)
+            else:
+                group_children = [next(children) for _ in range(len(group) + 1)]
+                for c in group_children:
+                    c.parent = node
+                node.children = list(group_children)
+            nodes.append(node)
+
+        return nodes, separators
+
     def find(self, key: int) -> Node:
         """If the tree contains the key, return the Node containing it,
             otherwise return leaf-node where the search ended"""
-        sanity_checks(self.root)
+        self.check_tree()
         
         current = self.root 
 
         while True:
-            if key in current.keys:
+            self.check_node(current)
+
+            idx = bisect_left(current.keys, key)
+            if idx < len(current.keys) and current.keys[idx] == key:
                 return current
 
             # key not found yet
-            child = current.get_subnode(key)
+            child = current.children[idx]
             if child is None:
                 # key not found, returning leaf-node where search ended
                 return current
@@ -134,74 +338,207 @@ class NonRedundantBTree(Tree):
 
 
 
+    def insert(self, key: int) -> None:
+        self.check_tree()
+
+        leaf_node = self.find(key)
+        key_idx = bisect_left(leaf_node.keys, key)
+        assert key_idx == len(leaf_node.keys) or leaf_node.keys[key_idx] != key, f"Cannot insert {key}, it's already been inserted into the tree"
+
+        # check that leaf_node is actually a leaf node
+        assert leaf_node.is_leaf_node()
+
+        leaf_node.keys.insert(key_idx, key)
+
+        # We've added new key, so we need to also add a new null pointer to children
+        leaf_node.children.append(None)
+
+        self.balance(leaf_node)
+
+        self.check_tree()
+
+
+
+class BStarTree(NonRedundantBTree):
+    """B*-tree, an overfilled node first gives keys to a non-full sibling through the parent,
+    when both neighbouring siblings are full, two nodes are split into three.
+
+    Every node except the root and nodes created by splitting the root is at least 2/3 full."""
+
+    def redistribute(self, parent: Node, i: int) -> None:
+        """Evens out keys of parent.children[i] and parent.children[i + 1] by rotating them through parent.keys[i]"""
+        left, right = parent.child(i), parent.child(i + 1)
+        keys = left.keys + [parent.keys[i]] + right.keys
+        children = left.children + right.children
+
+        middle_idx = len(keys) // 2
+        left.keys, parent.keys[i], right.keys = keys[:middle_idx], keys[middle_idx], keys[middle_idx + 1:]
+        left.children, right.children = children[:middle_idx + 1], children[middle_idx + 1:]
+
+        for c in left.children:
+            if c is not None:
+                c.parent = left
+        for c in right.children:
+            if c is not None:
+                c.parent = right
+
+        self.check_node(left)
+        self.check_node(right)
+
+    def split_two_to_three(self, parent: Node, i: int) -> None:
+        """Splits parent.children[i] and parent.children[i + 1] into three nodes, adding one key to the parent"""
+        left, right = parent.child(i), parent.child(i + 1)
+        keys = left.keys + [parent.keys[i]] + right.keys
+        children = left.children + right.children
+
+        # two of the keys become separators in the parent, the rest is spread evenly
+        n_keys = len(keys) - 2
+        sizes = [n_keys // 3 + (1 if j < n_keys % 3 else 0) for j in range(3)]
+        sep1_idx = sizes[0]
+        sep2_idx = sizes[0] + 1 + sizes[1]
+
+        middle = Node(left.arity, left.redundant)
+        middle.parent = parent
+
+        left.keys, middle.keys, right.keys = keys[:sep1_idx], keys[sep1_idx + 1:sep2_idx], keys[sep2_idx + 1:]
+        left.children = children[:sep1_idx + 1]
+        middle.children = children[sep1_idx + 1:sep2_idx + 1]
+        right.children = children[sep2_idx + 1:]
+
+        for node in (left, middle, right):
+            for c in node.children:
+                if c is not None:
+                    c.parent = node
+
+        parent.keys[i] = keys[sep1_idx]
+        parent.keys.insert(i + 1, keys[sep2_idx])
+        parent.children.insert(i + 1, middle)
+
+        self.check_node(left)
+        self.check_node(middle)
+        self.check_node(right)
+
     def balance(self, node: Node) -> None:
         if not node.overfilled:
+            self.check_node(node)
             return
-        
-        # we've got to split
-        middle_idx = len(node.keys) // 2
-        middle_key = node.keys[middle_idx]
-
-        child1, child2 = Node(), Node()
-        child1.keys = node.keys[:middle_idx]
-        child1.children = node.children[:middle_idx + 1]
 
-        child2.keys = node.keys[middle_idx + 1:]
-        child2.children = node.children[middle_idx + 1:]
+        p = node.parent
+        if p is None:
+            # the root has no siblings, so it is split in half as in the ordinary B-tree
+            super().balance(node)
+            return
 
-        # we must also fix node's children parent pointers from pointing to 'node' and point them to child1 and child2
-        # because we have just splitted the 'node' and there is no 'node' anymore.
-        for c in filter(lambda c: c is not None, child1.children):
-            c.parent = child1
+        # position of 'node' among parent's children
+        i = bisect_left(p.keys, node.keys[0])
 
-        for c in filter(lambda c: c is not None, child2.children):
-            c.parent = child2
+        if i > 0 and not p.child(i - 1).full:
+            self.redistribute(p, i - 1)
+            self.check_node(p)
+            return
 
-        if node.parent is None:
-            assert id(node) == id(self.root)
-            # we are splitting a root
-            self.root = Node()
-            self.root.keys = [middle_key]
-            self.root.children = [child1, child2]
-            child1.parent, child2.parent = self.root, self.root 
+        if i < len(p.keys) and not p.child(i + 1).full:
+            self.redistribute(p, i)
+            self.check_node(p)
             return
 
+        # both neighbouring siblings are full, split together with one of them
+        if i < len(p.keys):
+            self.split_two_to_three(p, i)
+        else:
+            self.split_two_to_three(p, i - 1)
+
+        self.balance(p)
 
-        # We are not in a root
-        child1.parent, child2.parent = node.parent, node.parent
 
-        
-        p = node.parent
+class RedundantBTree(Tree):
+    """B+-tree, all keys and their records live in the leaves, inner nodes only hold copies of keys for routing.
+    Leaves are linked left-to-right, so range queries descend once and then read the leaves sequentially."""
 
-        # index of the middle key in the parent node after pulling it up one level
-        key_p_idx = p.get_key_idx(middle_key)
+    def __init__(self, arity: int = 4, validation: Validation = Validation.OFF):
+        self.root: Node = Leaf(arity)
+        self.validation = validation
 
-        p.keys = p.keys[:key_p_idx] + [middle_key] + p.keys[key_p_idx:]
-        p.children = p.children[:key_p_idx] + [child1, child2] + p.children[key_p_idx+1:]   # notice we cut-out the pointer to the original unsplitted node
+    def find(self, key: int) -> Leaf:
+        """Return the leaf, which contains the key, or would contain it if it was inserted"""
+        self.check_tree()
 
-        self.balance(p)
+        current = self.root
+        while not current.is_leaf_node():
+            self.check_node(current)
+            child = current.get_subnode(key)
+            assert child is not None
+            current = child
 
+        self.check_node(current)
+        assert isinstance(current, Leaf)
+        return current
+
+    def lookup(self, key: int) -> Any:
+        """Return the record stored under the key"""
+        leaf = self.find(key)
+        idx = bisect_left(leaf.keys, key)
+        if idx < len(leaf.keys) and leaf.keys[idx] == key:
+            return leaf.records[idx]
+
+        raise Exception(f"No record with key {key} found!")
+
+    def scan_from(self, key: int) -> Iterator[Tuple[int, Any]]:
+        """Yield (key, record) pairs with keys >= 'key' in ascending order, following the leaf links.
+        The tree must not be modified while the generator is in use."""
+        first = self.find(key)
+        idx = bisect_left(first.keys, key)
+
+        leaf: Optional[Leaf] = first
+
+        while leaf is not None:
+            for i in range(idx, len(leaf.keys)):
+                yield leaf.keys[i], leaf.records[i]
+            leaf = leaf.next_leaf
+            idx = 0
+
+    def range(self, lo: int, hi: int) -> Iterator[Tuple[int, Any]]:
+        """Yield (key, record) pairs with lo <= key <= hi in ascending order"""
+        for key, record in self.scan_from(lo):
+            if key > hi:
+                return
+            yield key, record
+
+    def split(self, node: Node) -> Tuple[int, Node]:
+        if not isinstance(node, Leaf):
+            return super().split(node)
+
+        # leaf split - the largest key of the left half is copied (not moved) one level up
+        middle_idx = len(node.keys) // 2
 
-    def insert(self, key: int) -> None:
-        sanity_checks(self.root)
+        right = Leaf(node.arity)
+        right.keys = node.keys[middle_idx:]
+        right.records = node.records[middle_idx:]
+        right.children = [None] * (len(right.keys) + 1)
 
-        leaf_node = self.find(key)
-        assert key not in leaf_node.keys, f"Cannot insert {key}, it's already been inserted into the tree"
+        del node.keys[middle_idx:]
+        del node.records[middle_idx:]
+        del node.children[middle_idx + 1:]
 
-        # check that leaf_node is actually a leaf node
-        assert leaf_node.is_leaf_node()
+        right.next_leaf = node.next_leaf
+        node.next_leaf = right
 
-        key_idx = leaf_node.get_key_idx(key)
+        return node.keys[-1], right
 
-        leaf_node.keys = leaf_node.keys[:key_idx] + [key] + leaf_node.keys[key_idx:]
+    def insert(self, key: int, record: Any = None) -> None:
+        self.check_tree()
 
-        # We've added new key, so we need to also add a new null pointer to children
-        leaf_node.children.append(None)
+        leaf = self.find(key)
+        key_idx = bisect_left(leaf.keys, key)
+        assert key_idx == len(leaf.keys) or leaf.keys[key_idx] != key, f"Cannot insert {key}, it's already been inserted into the tree"
 
-        self.balance(leaf_node)
+        leaf.keys.insert(key_idx, key)
+        leaf.records.insert(key_idx, record)
+        leaf.children.append(None)
 
-        sanity_checks(self.root)
+        self.balance(leaf)
 
+        self.check_tree()
 
 
 if __name__ == "__main__":
@@ -225,3 +562,35 @@ if __name__ == "__main__":
 
         if rec.age in found_or_not.keys:
             print(f"key {rec.age} found in {found_or_not}!")
+
+
+    print("\n\nBulk loading the same keys...")
+    bulk_btree = NonRedundantBTree.bulk_load(sorted(set(rec.age for rec in DATA_RECORDS)), validation=Validation.FULL)
+    for rec in DATA_RECORDS:
+        assert rec.age in bulk_btree.find(rec.age).keys
+    print(f"all keys found, root: {bulk_btree.root}")
+
+
+    print("\n\nInserting data records into redundant B-tree...")
+    red_btree = RedundantBTree(validation=Validation.FULL)
+    for rec in DATA_RECORDS:
+        red_btree.insert(rec.age, rec)
+
+    for rec in DATA_RECORDS:
+        assert red_btree.lookup(rec.age) == rec
+
+    print("Records with 20 <= age <= 40:")
+    for age, rec in red_btree.range(20, 40):
+        print(rec)
+
+
+    print("\n\nInserting data records into B*-tree...")
+    b_star_tree = BStarTree(validation=Validation.FULL)
+    for rec in DATA_RECORDS:
+        b_star_tree.insert(rec.age)
+
+    for rec in DATA_RECORDS:
+        assert rec.age in b_star_tree.find(rec.age).keys
+
+    print(f"B-tree:  {non_red_btree.stats()}")
+    print(f"B*-tree: {b_star_tree.stats()}")
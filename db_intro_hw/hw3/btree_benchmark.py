@@ -0,0 +1,70 @@
+"""Measures how insert/find cost of NonRedundantBTree grows with the number of keys.
+
+Usage: python -m db_intro_hw.hw3.btree_benchmark [max_keys] [arity]
+
+The tree is grown continuously and at every power of ten the average insert time
+(over the keys inserted since the previous checkpoint) and the average find time
+(over a random sample of already inserted keys) are reported together with the tree height.
+With logarithmic operations, the per-operation time should grow roughly linearly with the height.
+"""
+import random
+import sys
+import time
+from typing import List
+
+from db_intro_hw.hw3.b_tree import NonRedundantBTree, Node
+
+
+FIND_SAMPLE = 10_000
+
+
+def tree_height(tree: NonRedundantBTree) -> int:
+    height = 1
+    node = tree.root
+    while not node.is_leaf_node():
+        child = node.children[0]
+        assert child is not None
+        node = child
+        height += 1
+    return height
+
+
+def checkpoints(max_keys: int) -> List[int]:
+    points = []
+    n = 1000
+    while n < max_keys:
+        points.append(n)
+        n *= 10
+    points.append(max_keys)
+    return points
+
+
+def run(max_keys: int = 10_000_000, arity: int = 4, seed: int = 0) -> None:
+    rnd = random.Random(seed)
+    keys = list(range(max_keys))
+    rnd.shuffle(keys)
+
+    tree = NonRedundantBTree(Node(arity))
+
+    print(f"{'keys':>10} {'height':>7} {'insert us/op':>13} {'find us/op':>11}")
+    inserted = 0
+    for point in checkpoints(max_keys):
+        start = time.perf_counter()
+        for k in keys[inserted:point]:
+            tree.insert(k)
+        insert_time = (time.perf_counter() - start) / (point - inserted)
+        inserted = point
+
+        sample = rnd.sample(keys[:inserted], min(FIND_SAMPLE, inserted))
+        start = time.perf_counter()
+        for k in sample:
+            tree.find(k)
+        find_time = (time.perf_counter() - start) / len(sample)
+
+        print(f"{inserted:>10} {tree_height(tree):>7} {insert_time * 1e6:>13.2f} {find_time * 1e6:>11.2f}")
+
+
+if __name__ == "__main__":
+    max_keys = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+    arity = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    run(max_keys, arity)
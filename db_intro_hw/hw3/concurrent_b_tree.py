@@ -0,0 +1,205 @@
+from __future__ import annotations
+import threading
+import time
+from bisect import bisect_left
+from typing import List, Optional
+
+
+class LatchedNode:
+    """B-tree node with its own latch and version counter. There are no parent pointers,
+    writers remember the latched path instead.
+
+    The version is odd while a writer is modifying the node, and it grows with every modification."""
+
+    def __init__(self, leaf: bool = True):
+        self.leaf = leaf
+        self.keys: List[int] = []
+        self.children: List[LatchedNode] = []
+        self.latch = threading.Lock()
+        self.version = 0
+
+    def begin_write(self) -> None:
+        self.version += 1
+
+    def end_write(self) -> None:
+        self.version += 1
+
+    def __repr__(self):
+        return f"LatchedNode - keys: {self.keys}, is_leaf_node={self.leaf}"
+
+
+class ConcurrentBTree:
+    """Non-redundant B-tree for parallel readers and writers, synchronized by optimistic lock coupling.
+
+    Readers take no latches at all, so they never block each other or the writers. They remember the version
+    of every node they read and validate it, before moving on to the child and before returning. A changed or odd
+    version means a writer got in the way, and the search restarts from the root.
+
+    Writers latch the path exclusively (crabbing), but release all ancestors as soon as they reach a node,
+    which cannot split by the insert (it has room for one more key) - only the part of the path, which may split,
+    stays latched. The root pointer has a latch of its own, a writer keeps it only while the root itself may split."""
+
+    def __init__(self, arity: int = 4):
+        assert arity >= 3
+        self.arity = arity
+        self.root = LatchedNode(leaf=True)
+        self.root_latch = threading.Lock()
+
+        # searches started again because of a concurrent modification. '+=' isn't atomic across threads,
+        # so it's guarded by a lock, which is only taken on a restart - searches that succeed take no latches
+        self.restarts = 0
+        self.restarts_lock = threading.Lock()
+
+    def safe(self, node: LatchedNode) -> bool:
+        """Inserting one key below the node can't split it"""
+        return len(node.keys) < self.arity - 1
+
+    def find(self, key: int) -> bool:
+        while True:
+            try:
+                found = self.optimistic_find(key)
+            except IndexError:
+                # we have read a node in the middle of a split
+                found = None
+            if found is not None:
+                return found
+
+            with self.restarts_lock:
+                self.restarts += 1
+            # let the writer finish
+            time.sleep(0)
+
+    def optimistic_find(self, key: int) -> Optional[bool]:
+        """Search without latches, returns None if it has to be restarted"""
+        node = self.root
+        version = node.version
+        if version & 1 or node is not self.root:
+            return None
+
+        while True:
+            idx = bisect_left(node.keys, key)
+            found = idx < len(node.keys) and node.keys[idx] == key
+            if found or node.leaf:
+                return found if node.version == version else None
+
+            child = node.children[idx]
+            child_version = child.version
+            # the child is only valid, if the parent didn't change while we were reading it
+            if node.version != version or child_version & 1:
+                return None
+            node, version = child, child_version
+
+    def __contains__(self, key: int) -> bool:
+        return self.find(key)
+
+    def insert(self, key: int) -> None:
+        # exclusively latched nodes, which may still split, from the top down
+        path: List[LatchedNode] = []
+        root_latched = True
+        self.root_latch.acquire()
+        node = self.root
+        node.latch.acquire()
+
+        try:
+            while True:
+                if self.safe(node):
+                    # nothing above this node can change any more
+                    for ancestor in path:
+                        ancestor.latch.release()
+                    path = []
+                    if root_latched:
+                        self.root_latch.release()
+                        root_latched = False
+                path.append(node)
+
+                idx = bisect_left(node.keys, key)
+                if idx < len(node.keys) and node.keys[idx] == key:
+                    raise Exception(f"Cannot insert {key}, it's already been inserted into the tree")
+                if node.leaf:
+                    break
+                node = node.children[idx]
+                node.latch.acquire()
+
+            self.insert_into_path(path, key, idx, root_latched)
+        finally:
+            for node in path:
+                node.latch.release()
+            if root_latched:
+                self.root_latch.release()
+
+    def insert_into_path(self, path: List[LatchedNode], key: int, idx: int, root_latched: bool) -> None:
+        """Inserts the key into the leaf at the end of the path and splits upwards, all of the path is latched"""
+        node = path[-1]
+        node.begin_write()
+        node.keys.insert(idx, key)
+
+        level = len(path) - 1
+        while len(node.keys) >= self.arity:
+            # 'node' keeps the left half, the right half moves to a new sibling
+            middle_idx = len(node.keys) // 2
+            middle_key = node.keys[middle_idx]
+
+            right = LatchedNode(node.leaf)
+            right.keys = node.keys[middle_idx + 1:]
+            if not node.leaf:
+                right.children = node.children[middle_idx + 1:]
+
+            if level == 0:
+                assert root_latched and node is self.root
+                new_root = LatchedNode(leaf=False)
+                new_root.keys = [middle_key]
+                new_root.children = [node, right]
+                self.root = new_root
+                parent = None
+            else:
+                parent = path[level - 1]
+                parent.begin_write()
+                key_p_idx = bisect_left(parent.keys, middle_key)
+                parent.keys.insert(key_p_idx, middle_key)
+                parent.children.insert(key_p_idx + 1, right)
+
+            del node.keys[middle_idx:]
+            if not node.leaf:
+                del node.children[middle_idx + 1:]
+            node.end_write()
+
+            if parent is None:
+                return
+            level -= 1
+            node = parent
+
+        node.end_write()
+
+    def height(self) -> int:
+        height = 1
+        node = self.root
+        while not node.leaf:
+            node = node.children[0]
+            height += 1
+        return height
+
+
+if __name__ == "__main__":
+    import random
+    from concurrent.futures import ThreadPoolExecutor
+
+    tree = ConcurrentBTree(arity=8)
+    keys = random.sample(range(10**9), 100_000)
+
+    def insert_part(part: List[int]) -> None:
+        for k in part:
+            tree.insert(k)
+
+    def find_all(part: List[int]) -> int:
+        return sum(1 for k in part if k in tree)
+
+    print("4 writers inserting and 4 readers searching at the same time...")
+    with ThreadPoolExecutor(8) as pool:
+        writers = [pool.submit(insert_part, keys[i::4]) for i in range(4)]
+        readers = [pool.submit(find_all, keys) for _ in range(4)]
+        for w in writers:
+            w.result()
+        print(f"readers found {[r.result() for r in readers]} keys while inserts were in progress")
+
+    assert all(k in tree for k in keys)
+    print(f"all {len(keys)} keys found afterwards, height={tree.height()}, {tree.restarts} searches restarted")
@@ -0,0 +1,102 @@
+"""Reader throughput of B-trees under concurrent inserts.
+
+Usage: python -m db_intro_hw.hw3.concurrent_benchmark [preloaded_keys] [seconds]
+
+A tree is preloaded with keys, then one writer thread keeps inserting new keys while 1, 2, 4 and 8 reader threads
+search for the preloaded ones. NonRedundantBTree behind one global lock is compared with ConcurrentBTree.
+With the global lock readers queue behind each other and behind the writer, with optimistic lock coupling they take
+no latches and only restart, when the writer modified a node they have just read.
+
+Note that on a CPython build with the GIL, threads don't run Python code in parallel, so the absolute throughput
+can't grow with the number of readers there - the benchmark then shows how much of it is lost to lock waiting.
+"""
+import random
+import sys
+import threading
+import time
+from typing import Callable, List, Tuple, Union
+
+from db_intro_hw.hw3.b_tree import Node, NonRedundantBTree
+from db_intro_hw.hw3.concurrent_b_tree import ConcurrentBTree
+
+
+ARITY = 16
+READER_COUNTS = [1, 2, 4, 8]
+
+
+class GlobalLockBTree:
+    """NonRedundantBTree, whose every operation takes one lock"""
+
+    def __init__(self, arity: int):
+        self.tree = NonRedundantBTree(Node(arity))
+        self.lock = threading.Lock()
+
+    def insert(self, key: int) -> None:
+        with self.lock:
+            self.tree.insert(key)
+
+    def find(self, key: int) -> bool:
+        with self.lock:
+            return key in self.tree.find(key).keys
+
+
+def run_threads(find: Callable[[int], bool], insert: Callable[[int], None], present: List[int],
+                new_keys: List[int], n_readers: int, seconds: float) -> Tuple[float, float]:
+    """Returns finds per second over all readers and inserts per second of the writer"""
+    stop = threading.Event()
+    finds = [0] * n_readers
+    inserts = [0]
+
+    def reader(idx: int) -> None:
+        rnd = random.Random(idx)
+        n = 0
+        while not stop.is_set():
+            for _ in range(100):
+                assert find(present[rnd.randrange(len(present))])
+            n += 100
+        finds[idx] = n
+
+    def writer() -> None:
+        for key in new_keys:
+            if stop.is_set():
+                break
+            insert(key)
+            inserts[0] += 1
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(n_readers)]
+    threads.append(threading.Thread(target=writer))
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    return sum(finds) / elapsed, inserts[0] / elapsed
+
+
+def run(preloaded: int = 100_000, seconds: float = 2.0, seed: int = 0) -> None:
+    rnd = random.Random(seed)
+    keys = rnd.sample(range(10**12), preloaded + 2_000_000)
+    present, new_keys = keys[:preloaded], keys[preloaded:]
+
+    print(f"{'tree':<22}{'readers':>8}{'finds/s':>12}{'inserts/s':>12}")
+    trees: List[Tuple[str, Callable[[], Union[GlobalLockBTree, ConcurrentBTree]]]] = [
+        ("global lock", lambda: GlobalLockBTree(ARITY)),
+        ("optimistic coupling", lambda: ConcurrentBTree(ARITY)),
+    ]
+    for name, make in trees:
+        for n_readers in READER_COUNTS:
+            tree = make()
+            for k in present:
+                tree.insert(k)
+            finds, inserts = run_threads(tree.find, tree.insert, present, new_keys, n_readers, seconds)
+            print(f"{name:<22}{n_readers:>8}{finds:>12.0f}{inserts:>12.0f}")
+
+
+if __name__ == "__main__":
+    preloaded = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+    run(preloaded, seconds)
@@ -0,0 +1,317 @@
+from __future__ import annotations
+import mmap
+import os
+import struct
+from bisect import bisect_left
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Set, Tuple
+
+
+# block size as in HW1
+PAGE_SIZE = 4096
+
+# page 0 holds the file header, so page id 0 also serves as the null pointer
+NULL_PAGE = 0
+
+# magic, page size, arity, root page id, number of allocated pages
+HEADER = struct.Struct("<4sIIQQ")
+MAGIC = b"BTRE"
+
+# leaf flag, number of keys
+NODE_HEADER = struct.Struct("<BH")
+KEY_SIZE = 8
+CHILD_SIZE = 8
+
+
+def max_arity(page_size: int = PAGE_SIZE) -> int:
+    """Largest arity, whose node (arity - 1 keys and arity children) still fits into one page"""
+    return (page_size - NODE_HEADER.size + KEY_SIZE) // (KEY_SIZE + CHILD_SIZE)
+
+
+class PagedNode:
+    """In-memory image of one page. Children are page ids instead of Python references, leaves have no children."""
+
+    def __init__(self, leaf: bool = True):
+        self.leaf = leaf
+        self.keys: List[int] = []
+        self.children: List[int] = []
+
+    def serialize(self, buf: mmap.mmap, offset: int) -> None:
+        n = len(self.keys)
+        NODE_HEADER.pack_into(buf, offset, self.leaf, n)
+        offset += NODE_HEADER.size
+        struct.pack_into(f"<{n}q", buf, offset, *self.keys)
+        if not self.leaf:
+            struct.pack_into(f"<{n + 1}Q", buf, offset + n * KEY_SIZE, *self.children)
+
+    @staticmethod
+    def deserialize(buf: mmap.mmap, offset: int) -> PagedNode:
+        leaf, n = NODE_HEADER.unpack_from(buf, offset)
+        offset += NODE_HEADER.size
+
+        node = PagedNode(bool(leaf))
+        node.keys = list(struct.unpack_from(f"<{n}q", buf, offset))
+        if not node.leaf:
+            node.children = list(struct.unpack_from(f"<{n + 1}Q", buf, offset + n * KEY_SIZE))
+        return node
+
+    def __repr__(self):
+        return f"PagedNode - keys: {self.keys}, is_leaf_node={self.leaf}"
+
+
+class PageFile:
+    """Single file of fixed-size pages accessed through mmap. The file grows by doubling."""
+
+    def __init__(self, path: str, page_size: int = PAGE_SIZE):
+        self.page_size = page_size
+
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        self.file = open(path, "r+b" if exists else "w+b")
+        if not exists:
+            self.file.truncate(page_size)
+
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+
+    @property
+    def capacity(self) -> int:
+        """Number of pages the file can hold without growing"""
+        return len(self.mm) // self.page_size
+
+    def ensure_capacity(self, n_pages: int) -> None:
+        if n_pages <= self.capacity:
+            return
+
+        new_size = max(n_pages, 2 * self.capacity) * self.page_size
+        self.mm.close()
+        self.file.truncate(new_size)
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+
+    def read(self, page_id: int) -> PagedNode:
+        return PagedNode.deserialize(self.mm, page_id * self.page_size)
+
+    def write(self, page_id: int, node: PagedNode) -> None:
+        node.serialize(self.mm, page_id * self.page_size)
+
+    def close(self) -> None:
+        self.mm.flush()
+        self.mm.close()
+        self.file.close()
+
+
+@dataclass
+class BufferPoolStats:
+    hits: int = 0
+    # page reads from the file
+    misses: int = 0
+    # dirty pages written back to the file
+    writes: int = 0
+
+
+class BufferPool:
+    """Bounded cache of deserialized pages with LRU eviction and write-back of dirty pages.
+
+    A node obtained by get() is only guaranteed to be persisted, when it's handed back by put() after modification."""
+
+    def __init__(self, page_file: PageFile, capacity: int = 256):
+        assert capacity > 0
+        self.page_file = page_file
+        self.capacity = capacity
+
+        # page id -> node, ordered from least to most recently used
+        self.pages: OrderedDict[int, PagedNode] = OrderedDict()
+        # ids of pages, which were modified since they were read or last written
+        self.dirty: Set[int] = set()
+        self.stats = BufferPoolStats()
+
+    def get(self, page_id: int) -> PagedNode:
+        node = self.pages.get(page_id)
+        if node is not None:
+            self.stats.hits += 1
+            self.pages.move_to_end(page_id)
+            return node
+
+        self.stats.misses += 1
+        node = self.page_file.read(page_id)
+        self.cache(page_id, node)
+        return node
+
+    def put(self, page_id: int, node: PagedNode) -> None:
+        """Marks the page as modified, it's written back on eviction or flush"""
+        self.cache(page_id, node)
+        self.dirty.add(page_id)
+
+    def cache(self, page_id: int, node: PagedNode) -> None:
+        self.pages[page_id] = node
+        self.pages.move_to_end(page_id)
+
+        while len(self.pages) > self.capacity:
+            victim_id, victim = self.pages.popitem(last=False)
+            if victim_id in self.dirty:
+                self.write_back(victim_id, victim)
+
+    def write_back(self, page_id: int, node: PagedNode) -> None:
+        self.page_file.write(page_id, node)
+        self.dirty.discard(page_id)
+        self.stats.writes += 1
+
+    def flush(self) -> None:
+        for page_id in list(self.dirty):
+            self.write_back(page_id, self.pages[page_id])
+
+
+class PagedBTree:
+    """Non-redundant B-tree stored in a page file, nodes reference each other by page ids.
+
+    Opening an existing file reads only the header, every other page is read on first access through the buffer pool.
+    Nodes don't keep parent pointers, insert remembers the path from the root instead."""
+
+    def __init__(self, path: str, arity: Optional[int] = None, buffer_pages: int = 256, page_size: int = PAGE_SIZE):
+        self.page_file = PageFile(path, page_size)
+        self.pool = BufferPool(self.page_file, buffer_pages)
+
+        magic, stored_page_size, stored_arity, root, n_pages = HEADER.unpack_from(self.page_file.mm, 0)
+        if magic == MAGIC:
+            assert stored_page_size == page_size, f"File was created with page size {stored_page_size}"
+            assert arity is None or arity == stored_arity, f"File was created with arity {stored_arity}"
+            self.arity = stored_arity
+            self.root = root
+            self.n_pages = n_pages
+        else:
+            # fresh file, start with an empty root leaf in page 1
+            self.arity = arity if arity is not None else max_arity(page_size)
+            assert 3 <= self.arity <= max_arity(page_size), f"Node of arity {self.arity} doesn't fit into a page"
+            self.n_pages = 1
+            self.root = self.allocate(PagedNode(leaf=True))
+            self.write_header()
+
+    def write_header(self) -> None:
+        HEADER.pack_into(self.page_file.mm, 0, MAGIC, self.page_file.page_size, self.arity, self.root, self.n_pages)
+
+    def allocate(self, node: PagedNode) -> int:
+        page_id = self.n_pages
+        self.n_pages += 1
+        self.page_file.ensure_capacity(self.n_pages)
+        self.pool.put(page_id, node)
+        return page_id
+
+    def find(self, key: int) -> bool:
+        """Returns True if the tree contains the key, reading one page per level"""
+        page_id = self.root
+        while True:
+            node = self.pool.get(page_id)
+            idx = bisect_left(node.keys, key)
+            if idx < len(node.keys) and node.keys[idx] == key:
+                return True
+            if node.leaf:
+                return False
+            page_id = node.children[idx]
+
+    def __contains__(self, key: int) -> bool:
+        return self.find(key)
+
+    def insert(self, key: int) -> None:
+        # descend to the leaf, remembering the path for splits
+        path: List[Tuple[int, PagedNode]] = []
+        page_id = self.root
+        while True:
+            node = self.pool.get(page_id)
+            idx = bisect_left(node.keys, key)
+            assert idx == len(node.keys) or node.keys[idx] != key, f"Cannot insert {key}, it's already been inserted into the tree"
+            path.append((page_id, node))
+            if node.leaf:
+                break
+            page_id = node.children[idx]
+
+        page_id, node = path.pop()
+        node.keys.insert(idx, key)
+
+        while len(node.keys) >= self.arity:
+            # we've got to split, 'node' keeps the left half
+            middle_idx = len(node.keys) // 2
+            middle_key = node.keys[middle_idx]
+
+            right = PagedNode(node.leaf)
+            right.keys = node.keys[middle_idx + 1:]
+            del node.keys[middle_idx:]
+            if not node.leaf:
+                right.children = node.children[middle_idx + 1:]
+                del node.children[middle_idx + 1:]
+
+            right_id = self.allocate(right)
+            self.pool.put(page_id, node)
+
+            if not path:
+                # we are splitting a root
+                new_root = PagedNode(leaf=False)
+                new_root.keys = [middle_key]
+                new_root.children = [page_id, right_id]
+                self.root = self.allocate(new_root)
+                return
+
+            page_id, node = path.pop()
+            key_p_idx = bisect_left(node.keys, middle_key)
+            node.keys.insert(key_p_idx, middle_key)
+            node.children.insert(key_p_idx + 1, right_id)
+
+        self.pool.put(page_id, node)
+
+    def height(self) -> int:
+        height = 1
+        node = self.pool.get(self.root)
+        while not node.leaf:
+            node = self.pool.get(node.children[0])
+            height += 1
+        return height
+
+    def flush(self) -> None:
+        """Writes all dirty pages and the header back to the file"""
+        self.pool.flush()
+        self.write_header()
+        self.page_file.mm.flush()
+
+    def close(self) -> None:
+        self.flush()
+        self.page_file.close()
+
+    def __enter__(self) -> PagedBTree:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+if __name__ == "__main__":
+    import random
+    import tempfile
+    import time
+
+    from db_intro_hw.hw1 import DATA_RECORDS
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "ages.btree")
+
+        print("Inserting data records with arity=4...")
+        with PagedBTree(path, arity=4) as tree:
+            for rec in DATA_RECORDS:
+                tree.insert(rec.age)
+
+        with PagedBTree(path) as tree:
+            for rec in DATA_RECORDS:
+                assert rec.age in tree
+            print(f"all keys found after reopening, height={tree.height()}, pages={tree.n_pages}")
+
+        path = os.path.join(tmp, "big.btree")
+        keys = random.sample(range(10**9), 200_000)
+        print(f"\nInserting {len(keys)} random keys with page-sized nodes (arity={max_arity()})...")
+        with PagedBTree(path, buffer_pages=64) as tree:
+            for k in keys:
+                tree.insert(k)
+            print(f"height={tree.height()}, pages={tree.n_pages}, {tree.pool.stats}")
+
+        start = time.perf_counter()
+        with PagedBTree(path, buffer_pages=64) as tree:
+            opened = time.perf_counter()
+            for k in keys[:1000]:
+                assert k in tree
+            print(f"reopened in {(opened - start) * 1000:.2f} ms, 1000 lookups: {tree.pool.stats}")
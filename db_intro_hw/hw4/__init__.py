@@ -0,0 +1,64 @@
+from __future__ import annotations
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class Rect:
+    """Axis-aligned rectangle [x1, x2] x [y1, y2], a point is a rectangle of zero area"""
+    x1: float
+    y1: float
+    x2: float
+    y2: float
+
+    @staticmethod
+    def point(x: float, y: float) -> Rect:
+        return Rect(x, y, x, y)
+
+    @property
+    def area(self) -> float:
+        return (self.x2 - self.x1) * (self.y2 - self.y1)
+
+    @property
+    def margin(self) -> float:
+        """Half of the perimeter"""
+        return (self.x2 - self.x1) + (self.y2 - self.y1)
+
+    @property
+    def center(self):
+        return (self.x1 + self.x2) / 2, (self.y1 + self.y2) / 2
+
+    def union(self, other: Rect) -> Rect:
+        return Rect(min(self.x1, other.x1), min(self.y1, other.y1), max(self.x2, other.x2), max(self.y2, other.y2))
+
+    def enlargement(self, other: Rect) -> float:
+        """Area, which has to be added to this rectangle, so that it covers the other one"""
+        return self.union(other).area - self.area
+
+    def intersects(self, other: Rect) -> bool:
+        return self.x1 <= other.x2 and other.x1 <= self.x2 and self.y1 <= other.y2 and other.y1 <= self.y2
+
+    def overlap(self, other: Rect) -> float:
+        """Area of the intersection"""
+        dx = min(self.x2, other.x2) - max(self.x1, other.x1)
+        dy = min(self.y2, other.y2) - max(self.y1, other.y1)
+        return dx * dy if dx > 0 and dy > 0 else 0.0
+
+    def contains(self, other: Rect) -> bool:
+        return self.x1 <= other.x1 and other.x2 <= self.x2 and self.y1 <= other.y1 and other.y2 <= self.y2
+
+    def contains_point(self, x: float, y: float) -> bool:
+        return self.x1 <= x <= self.x2 and self.y1 <= y <= self.y2
+
+    def low(self, axis: int) -> float:
+        return self.x1 if axis == 0 else self.y1
+
+    def high(self, axis: int) -> float:
+        return self.x2 if axis == 0 else self.y2
+
+
+@dataclass
+class QueryStats:
+    """Counters of node accesses of the queries"""
+    node_accesses: int = 0
+    leaf_accesses: int = 0
+    queries: int = 0
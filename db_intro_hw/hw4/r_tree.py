@@ -0,0 +1,494 @@
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from array import array
+from functools import reduce
+from heapq import heappop, heappush
+from itertools import count
+from math import ceil, sqrt
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Type
+
+from db_intro_hw.hw4 import QueryStats, Rect
+
+
+class Entry:
+    """Rectangle of a data object in a leaf, or the bounding rectangle of a child node in an inner node"""
+    __slots__ = ("rect", "child", "data")
+
+    def __init__(self, rect: Rect, child: Optional[Node] = None, data: Any = None):
+        self.rect = rect
+        self.child = child
+        self.data = data
+
+    def __repr__(self):
+        return f"Entry({self.rect})"
+
+
+class Node:
+    def __init__(self, level: int = 0):
+        # leaves are at level 0
+        self.level = level
+        self.entries: List[Entry] = []
+        self.parent: Optional[Node] = None
+
+    @property
+    def is_leaf(self) -> bool:
+        return self.level == 0
+
+    def mbr(self) -> Rect:
+        return bounding_rect(self.entries)
+
+    def add(self, entry: Entry) -> None:
+        self.entries.append(entry)
+        if entry.child is not None:
+            entry.child.parent = self
+
+    def entry_of(self, child: Node) -> Entry:
+        return next(e for e in self.entries if e.child is child)
+
+    def __repr__(self):
+        return f"Node - level={self.level}, entries={len(self.entries)}"
+
+
+def bounding_rect(entries: List[Entry]) -> Rect:
+    return reduce(Rect.union, (e.rect for e in entries))
+
+
+def min_dist(rect: Rect, x: float, y: float) -> float:
+    """Squared MINDIST - the squared distance of the point to the nearest point of the rectangle"""
+    dx = rect.x1 - x if x < rect.x1 else (x - rect.x2 if x > rect.x2 else 0.0)
+    dy = rect.y1 - y if y < rect.y1 else (y - rect.y2 if y > rect.y2 else 0.0)
+    return dx * dx + dy * dy
+
+
+class SplitStrategy(ABC):
+    """Node split algorithm, it also decides where new entries go (ChooseLeaf / ChooseSubtree)"""
+    # forced reinsert of R*-tree on the first overflow of every level during one insert
+    forced_reinsert = False
+
+    @abstractmethod
+    def split(self, entries: List[Entry], min_entries: int) -> Tuple[List[Entry], List[Entry]]:
+        """Divides the M + 1 entries of an overflowing node into two groups of at least min_entries"""
+
+    def choose_subtree(self, node: Node, rect: Rect) -> Entry:
+        """Guttman's ChooseLeaf step - least enlargement, ties resolved by the smaller area"""
+        return min(node.entries, key=lambda e: (e.rect.enlargement(rect), e.rect.area))
+
+    def __repr__(self):
+        return type(self).__name__
+
+
+def distribute(entries: List[Entry], seeds: Tuple[int, int], min_entries: int, pick_next) -> Tuple[List[Entry], List[Entry]]:
+    """Guttman's assignment of the remaining entries to the two groups started by the seeds"""
+    group1, group2 = [entries[seeds[0]]], [entries[seeds[1]]]
+    rect1, rect2 = group1[0].rect, group2[0].rect
+    remaining = [e for i, e in enumerate(entries) if i not in seeds]
+
+    while remaining:
+        # one group has to take all the rest to reach the minimum
+        if len(group1) + len(remaining) == min_entries:
+            group1 += remaining
+            break
+        if len(group2) + len(remaining) == min_entries:
+            group2 += remaining
+            break
+
+        entry = remaining.pop(pick_next(remaining, rect1, rect2))
+        d1, d2 = rect1.enlargement(entry.rect), rect2.enlargement(entry.rect)
+        if (d1, rect1.area, len(group1)) <= (d2, rect2.area, len(group2)):
+            group1.append(entry)
+            rect1 = rect1.union(entry.rect)
+        else:
+            group2.append(entry)
+            rect2 = rect2.union(entry.rect)
+
+    return group1, group2
+
+
+def quadratic_seeds(entries: List[Entry]) -> Tuple[int, int]:
+    """The pair, which would waste the most area, if put into the same node"""
+    best, seeds = -1.0, (0, 1)
+    for i in range(len(entries)):
+        for j in range(i + 1, len(entries)):
+            a, b = entries[i].rect, entries[j].rect
+            waste = a.union(b).area - a.area - b.area
+            if waste > best:
+                best, seeds = waste, (i, j)
+    return seeds
+
+
+class QuadraticSplit(SplitStrategy):
+    """Guttman's quadratic split"""
+
+    def split(self, entries: List[Entry], min_entries: int) -> Tuple[List[Entry], List[Entry]]:
+        def pick_next(remaining: List[Entry], rect1: Rect, rect2: Rect) -> int:
+            # the entry with the greatest preference for one of the groups
+            return max(range(len(remaining)),
+                       key=lambda i: abs(rect1.enlargement(remaining[i].rect) - rect2.enlargement(remaining[i].rect)))
+
+        return distribute(entries, quadratic_seeds(entries), min_entries, pick_next)
+
+
+class LinearSplit(SplitStrategy):
+    """Guttman's linear split"""
+
+    def split(self, entries: List[Entry], min_entries: int) -> Tuple[List[Entry], List[Entry]]:
+        best, seeds = -1.0, (0, 1)
+        for axis in (0, 1):
+            # entry with the highest low side and the one with the lowest high side
+            highest_low = max(range(len(entries)), key=lambda i: entries[i].rect.low(axis))
+            lowest_high = min(range(len(entries)), key=lambda i: entries[i].rect.high(axis))
+            if highest_low == lowest_high:
+                continue
+
+            width = max(e.rect.high(axis) for e in entries) - min(e.rect.low(axis) for e in entries)
+            separation = entries[highest_low].rect.low(axis) - entries[lowest_high].rect.high(axis)
+            separation = separation / width if width > 0 else 0.0
+            if separation > best:
+                best, seeds = separation, (lowest_high, highest_low)
+
+        # remaining entries are taken in any order
+        return distribute(entries, seeds, min_entries, lambda remaining, rect1, rect2: 0)
+
+
+class GreeneSplit(SplitStrategy):
+    """Greene's split - the axis is chosen by the normalized separation of the quadratic seeds,
+    the entries sorted along it are cut in half"""
+
+    def split(self, entries: List[Entry], min_entries: int) -> Tuple[List[Entry], List[Entry]]:
+        i, j = quadratic_seeds(entries)
+        a, b = entries[i].rect, entries[j].rect
+
+        def separation(axis: int) -> float:
+            width = max(e.rect.high(axis) for e in entries) - min(e.rect.low(axis) for e in entries)
+            sep = max(a.low(axis), b.low(axis)) - min(a.high(axis), b.high(axis))
+            return sep / width if width > 0 else 0.0
+
+        axis = max((0, 1), key=separation)
+        ordered = sorted(entries, key=lambda e: e.rect.low(axis))
+
+        half = len(ordered) // 2
+        group1, group2 = ordered[:half], ordered[len(ordered) - half:]
+        if len(ordered) % 2:
+            # the middle entry goes where it enlarges less
+            middle = ordered[half]
+            if bounding_rect(group1).enlargement(middle.rect) <= bounding_rect(group2).enlargement(middle.rect):
+                group1.append(middle)
+            else:
+                group2.insert(0, middle)
+        return group1, group2
+
+
+class RStarSplit(SplitStrategy):
+    """R*-tree split (minimal margin axis, then minimal overlap distribution) with forced reinsert"""
+    forced_reinsert = True
+
+    @staticmethod
+    def distributions(ordered: List[Entry], min_entries: int) -> Iterator[Tuple[List[Entry], List[Entry]]]:
+        for k in range(min_entries, len(ordered) - min_entries + 1):
+            yield ordered[:k], ordered[k:]
+
+    def split(self, entries: List[Entry], min_entries: int) -> Tuple[List[Entry], List[Entry]]:
+        def sortings(axis: int) -> List[List[Entry]]:
+            return [sorted(entries, key=lambda e: (e.rect.low(axis), e.rect.high(axis))),
+                    sorted(entries, key=lambda e: (e.rect.high(axis), e.rect.low(axis)))]
+
+        # ChooseSplitAxis - the axis with the smallest sum of margins over all distributions
+        def margin_sum(axis: int) -> float:
+            return sum(bounding_rect(g1).margin + bounding_rect(g2).margin
+                       for ordered in sortings(axis) for g1, g2 in self.distributions(ordered, min_entries))
+
+        axis = min((0, 1), key=margin_sum)
+
+        # ChooseSplitIndex - minimal overlap, ties resolved by the smaller area
+        def quality(groups: Tuple[List[Entry], List[Entry]]) -> Tuple[float, float]:
+            r1, r2 = bounding_rect(groups[0]), bounding_rect(groups[1])
+            return r1.overlap(r2), r1.area + r2.area
+
+        return min((d for ordered in sortings(axis) for d in self.distributions(ordered, min_entries)), key=quality)
+
+    def choose_subtree(self, node: Node, rect: Rect) -> Entry:
+        if node.level != 1:
+            return super().choose_subtree(node, rect)
+
+        # the children are leaves - least overlap enlargement, then least area enlargement, then the smaller area
+        def overlap_enlargement(entry: Entry) -> float:
+            enlarged = entry.rect.union(rect)
+            return sum(enlarged.overlap(e.rect) - entry.rect.overlap(e.rect) for e in node.entries if e is not entry)
+
+        return min(node.entries, key=lambda e: (overlap_enlargement(e), e.rect.enlargement(rect), e.rect.area))
+
+
+@dataclass
+class RTreeStats:
+    nodes: int
+    height: int
+    entries: int
+    # sum of the areas of all node rectangles
+    coverage: float
+    # sum of the pairwise intersection areas of sibling nodes
+    overlap: float
+
+
+class RTree:
+    """R-tree over 2-D rectangles, points are stored as rectangles of zero area"""
+
+    # fraction of entries, which are reinserted on an R* overflow
+    REINSERT_FRACTION = 0.3
+
+    def __init__(self, max_entries: int = 8, min_entries: Optional[int] = None,
+                 strategy: Optional[SplitStrategy] = None, stats: Optional[QueryStats] = None):
+        # 40% minimal fill is the recommended value for R*-trees, and works well for the other splits too
+        self.min_entries = min_entries if min_entries is not None else max(1, int(0.4 * max_entries))
+        assert max_entries >= 2 and 1 <= self.min_entries <= max_entries // 2
+
+        self.max_entries = max_entries
+        self.strategy = strategy if strategy is not None else QuadraticSplit()
+        self.root = Node(0)
+        self.size = 0
+
+        # opt-in instrumentation of the queries
+        self.stats = stats
+
+    def __len__(self) -> int:
+        return self.size
+
+    @classmethod
+    def bulk_load(cls, items: Iterable[Tuple[Rect, Any]], max_entries: int = 8, fill_factor: float = 1.0,
+                  strategy: Optional[SplitStrategy] = None, stats: Optional[QueryStats] = None) -> RTree:
+        """Sort-Tile-Recursive packing of (rectangle, data) pairs, built bottom-up without any splits.
+
+        Entries of a level are sorted by the x coordinate of their centers and cut into sqrt(P) vertical slices
+        (P is the number of nodes of the level), every slice is sorted by y and packed into nodes
+        of fill_factor * max_entries entries. Only the last node of a slice may be evened out with its left sibling.
+        The tree accepts inserts afterwards as usual."""
+        assert 0 < fill_factor <= 1
+        tree = cls(max_entries, strategy=strategy, stats=stats)
+        node_entries = min(max_entries, max(tree.min_entries, round(fill_factor * max_entries)))
+
+        entries = [Entry(rect, data=data) for rect, data in items]
+        tree.size = len(entries)
+        if not entries:
+            return tree
+
+        nodes = tree._pack_level(entries, 0, node_entries)
+        while len(nodes) > 1:
+            nodes = tree._pack_level([Entry(n.mbr(), child=n) for n in nodes], nodes[0].level + 1, node_entries)
+        tree.root = nodes[0]
+        return tree
+
+    def _pack_level(self, entries: List[Entry], level: int, node_entries: int) -> List[Node]:
+        # the sorts only touch two coordinate arrays, the entries are reordered once at the end
+        cx = array("d", ((e.rect.x1 + e.rect.x2) / 2 for e in entries))
+        cy = array("d", ((e.rect.y1 + e.rect.y2) / 2 for e in entries))
+
+        n_nodes = ceil(len(entries) / node_entries)
+        slice_size = ceil(sqrt(n_nodes)) * node_entries
+        by_x = sorted(range(len(entries)), key=cx.__getitem__)
+
+        groups: List[List[int]] = []
+        for start in range(0, len(by_x), slice_size):
+            in_slice = sorted(by_x[start:start + slice_size], key=cy.__getitem__)
+            for i in range(0, len(in_slice), node_entries):
+                group = in_slice[i:i + node_entries]
+
+                # the last node of a slice may be under-filled, so we even it out with the previous node
+                if groups and len(group) < self.min_entries:
+                    combined = groups.pop() + group
+                    if len(combined) <= self.max_entries:
+                        groups.append(combined)
+                    else:
+                        middle_idx = len(combined) // 2
+                        groups += [combined[:middle_idx], combined[middle_idx:]]
+                else:
+                    groups.append(group)
+
+        nodes = []
+        for group in groups:
+            node = Node(level)
+            for i in group:
+                node.add(entries[i])
+            nodes.append(node)
+        return nodes
+
+    def insert(self, rect: Rect, data: Any = None) -> None:
+        self.insert_entry(Entry(rect, data=data), 0, set())
+        self.size += 1
+
+    def insert_entry(self, entry: Entry, level: int, reinserted: Set[int]) -> None:
+        """Inserts the entry into a node of the given level, 'reinserted' are the levels,
+        which have already been through a forced reinsert during the current insert"""
+        node = self.root
+        while node.level > level:
+            chosen = self.strategy.choose_subtree(node, entry.rect)
+            chosen.rect = chosen.rect.union(entry.rect)
+            assert chosen.child is not None, "inner node entries point to children"
+            node = chosen.child
+
+        node.add(entry)
+        self.overflow(node, reinserted)
+
+    def overflow(self, node: Node, reinserted: Set[int]) -> None:
+        while len(node.entries) > self.max_entries:
+            if self.strategy.forced_reinsert and node is not self.root and node.level not in reinserted:
+                reinserted.add(node.level)
+                self.reinsert(node, reinserted)
+                return
+
+            group1, group2 = self.strategy.split(node.entries, self.min_entries)
+            sibling = Node(node.level)
+            node.entries = []
+            for e in group1:
+                node.add(e)
+            for e in group2:
+                sibling.add(e)
+
+            if node is self.root:
+                self.root = Node(node.level + 1)
+                self.root.add(Entry(node.mbr(), child=node))
+                self.root.add(Entry(sibling.mbr(), child=sibling))
+                return
+
+            parent = node.parent
+            assert parent is not None, "only the root has no parent"
+            parent.entry_of(node).rect = node.mbr()
+            parent.add(Entry(sibling.mbr(), child=sibling))
+            node = parent
+
+    def reinsert(self, node: Node, reinserted: Set[int]) -> None:
+        """R* forced reinsert - the entries farthest from the center of the node are inserted again from the root"""
+        cx, cy = node.mbr().center
+
+        def distance(e: Entry) -> float:
+            ex, ey = e.rect.center
+            return (ex - cx) ** 2 + (ey - cy) ** 2
+
+        ordered = sorted(node.entries, key=distance)
+        n_reinsert = max(1, int(self.REINSERT_FRACTION * self.max_entries))
+        node.entries = ordered[:-n_reinsert]
+        self.shrink_path(node)
+
+        # close reinsert - the nearest of the removed entries go first
+        for e in ordered[-n_reinsert:]:
+            self.insert_entry(e, node.level, reinserted)
+
+    def shrink_path(self, node: Node) -> None:
+        """Recomputes the rectangles on the path from the node to the root, after entries were removed"""
+        while node.parent is not None:
+            node.parent.entry_of(node).rect = node.mbr()
+            node = node.parent
+
+    def visit(self, node: Node) -> None:
+        if self.stats is not None:
+            self.stats.node_accesses += 1
+            if node.is_leaf:
+                self.stats.leaf_accesses += 1
+
+    def search(self, window: Rect) -> List[Any]:
+        """Data of all rectangles intersecting the window"""
+        if self.stats is not None:
+            self.stats.queries += 1
+
+        result = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            self.visit(node)
+            for e in node.entries:
+                if e.rect.intersects(window):
+                    if node.is_leaf:
+                        result.append(e.data)
+                    else:
+                        assert e.child is not None
+                        stack.append(e.child)
+        return result
+
+    def point_query(self, x: float, y: float) -> List[Any]:
+        """Data of all rectangles containing the point"""
+        return self.search(Rect.point(x, y))
+
+    def nearest(self, x: float, y: float, k: int = 1) -> List[Tuple[float, Any]]:
+        """(distance, data) of the k rectangles nearest to the point, the nearest first.
+
+        Best-first search - nodes and data rectangles share one priority queue ordered by MINDIST,
+        so a node is only opened, when nothing found so far is nearer than it."""
+        if self.stats is not None:
+            self.stats.queries += 1
+
+        result: List[Tuple[float, Any]] = []
+        # (squared distance, tie breaker, node or None, data), the tie breaker keeps nodes out of comparisons
+        tie = count()
+        queue: List[Tuple[float, int, Optional[Node], Any]] = [(0.0, next(tie), self.root, None)]
+        while queue and len(result) < k:
+            dist, _, node, data = heappop(queue)
+            if node is None:
+                result.append((sqrt(dist), data))
+                continue
+
+            self.visit(node)
+            for e in node.entries:
+                heappush(queue, (min_dist(e.rect, x, y), next(tie), e.child, e.data))
+        return result
+
+    def tree_stats(self) -> RTreeStats:
+        nodes, entries, coverage, overlap = 0, 0, 0.0, 0.0
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            nodes += 1
+            if node.is_leaf:
+                entries += len(node.entries)
+                continue
+
+            for i, a in enumerate(node.entries):
+                coverage += a.rect.area
+                for b in node.entries[i + 1:]:
+                    overlap += a.rect.overlap(b.rect)
+                assert a.child is not None
+                stack.append(a.child)
+
+        return RTreeStats(nodes, self.root.level + 1, entries, coverage, overlap)
+
+
+STRATEGIES: Dict[str, Type[SplitStrategy]] = {
+    "quadratic": QuadraticSplit,
+    "linear": LinearSplit,
+    "greene": GreeneSplit,
+    "rstar": RStarSplit,
+}
+
+
+if __name__ == "__main__":
+    import random
+
+    rnd = random.Random(0)
+
+    # clustered small rectangles, as location-tagged records usually are
+    centers = [(rnd.uniform(0, 1000), rnd.uniform(0, 1000)) for _ in range(20)]
+    rects = []
+    for _ in range(20_000):
+        cx, cy = rnd.choice(centers)
+        x, y = rnd.gauss(cx, 40), rnd.gauss(cy, 40)
+        w, h = rnd.expovariate(1 / 2), rnd.expovariate(1 / 2)
+        rects.append(Rect(x, y, x + w, y + h))
+    windows = []
+    for _ in range(500):
+        x, y = rnd.uniform(0, 1000), rnd.uniform(0, 1000)
+        windows.append(Rect(x, y, x + 20, y + 20))
+
+    expected = [sum(1 for r in rects if r.intersects(window)) for window in windows]
+
+    print(f"{'strategy':<12}{'nodes':>8}{'height':>8}{'coverage':>14}{'overlap':>14}{'accesses/query':>16}")
+    for name, strategy in STRATEGIES.items():
+        stats = QueryStats()
+        tree = RTree(max_entries=16, strategy=strategy(), stats=stats)
+        for i, r in enumerate(rects):
+            tree.insert(r, i)
+
+        for window, n in zip(windows, expected):
+            assert len(tree.search(window)) == n
+        for i in range(0, len(rects), 1000):
+            assert i in tree.point_query(*rects[i].center)
+        s = tree.tree_stats()
+        print(f"{name:<12}{s.nodes:>8}{s.height:>8}{s.coverage:>14.0f}{s.overlap:>14.0f}"
+              f"{stats.node_accesses / stats.queries:>16.1f}")
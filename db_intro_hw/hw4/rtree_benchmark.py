@@ -0,0 +1,87 @@
+"""Compares R-trees built by STR packing with R-trees built by repeated insert.
+
+Usage: python -m db_intro_hw.hw4.rtree_benchmark [n_rects] [max_entries]
+
+For every split strategy a tree is built by inserting the rectangles one by one, then one more tree is packed by STR
+from the same rectangles. Reported are the build time, tree shape and the average number of nodes visited
+by window queries and by 10-nearest-neighbour queries.
+"""
+import random
+import sys
+import time
+from typing import Callable, List, Tuple, Type
+
+from db_intro_hw.hw4 import QueryStats, Rect
+from db_intro_hw.hw4.r_tree import STRATEGIES, RTree, SplitStrategy
+
+
+N_QUERIES = 500
+KNN = 10
+
+
+def clustered_rects(n: int, rnd: random.Random) -> List[Rect]:
+    centers = [(rnd.uniform(0, 1000), rnd.uniform(0, 1000)) for _ in range(20)]
+    rects = []
+    for _ in range(n):
+        cx, cy = rnd.choice(centers)
+        x, y = rnd.gauss(cx, 40), rnd.gauss(cy, 40)
+        rects.append(Rect(x, y, x + rnd.expovariate(1 / 2), y + rnd.expovariate(1 / 2)))
+    return rects
+
+
+def measure(tree: RTree, stats: QueryStats, windows: List[Rect], points: List[Tuple[float, float]]) -> Tuple[float, float]:
+    """Average node accesses per window query and per kNN query"""
+    stats.node_accesses = stats.queries = 0
+    for w in windows:
+        tree.search(w)
+    per_window = stats.node_accesses / stats.queries
+
+    stats.node_accesses = stats.queries = 0
+    for x, y in points:
+        tree.nearest(x, y, KNN)
+    return per_window, stats.node_accesses / stats.queries
+
+
+def run(n: int = 100_000, max_entries: int = 16, seed: int = 0) -> None:
+    rnd = random.Random(seed)
+    rects = clustered_rects(n, rnd)
+    windows = []
+    for _ in range(N_QUERIES):
+        x, y = rnd.uniform(0, 1000), rnd.uniform(0, 1000)
+        windows.append(Rect(x, y, x + 20, y + 20))
+    # kNN queries around the data, queries in empty space would just measure the distance to the nearest cluster
+    points = [rects[rnd.randrange(n)].center for _ in range(N_QUERIES)]
+
+    print(f"{'build':<12}{'seconds':>9}{'nodes':>8}{'height':>8}{'overlap':>12}{'window acc.':>13}{f'{KNN}-NN acc.':>12}")
+    def by_insert(strategy: Type[SplitStrategy]) -> Callable[[QueryStats], RTree]:
+        return lambda s: build_by_insert(rects, max_entries, strategy(), s)
+
+    def by_str(s: QueryStats) -> RTree:
+        return RTree.bulk_load(((r, i) for i, r in enumerate(rects)), max_entries, stats=s)
+
+    builds = [(name, by_insert(strategy)) for name, strategy in STRATEGIES.items()]
+    builds.append(("STR", by_str))
+
+    for name, build in builds:
+        stats = QueryStats()
+        start = time.perf_counter()
+        tree = build(stats)
+        elapsed = time.perf_counter() - start
+
+        shape = tree.tree_stats()
+        per_window, per_knn = measure(tree, stats, windows, points)
+        print(f"{name:<12}{elapsed:>9.2f}{shape.nodes:>8}{shape.height:>8}{shape.overlap:>12.0f}"
+              f"{per_window:>13.1f}{per_knn:>12.1f}")
+
+
+def build_by_insert(rects: List[Rect], max_entries: int, strategy, stats: QueryStats) -> RTree:
+    tree = RTree(max_entries, strategy=strategy, stats=stats)
+    for i, r in enumerate(rects):
+        tree.insert(r, i)
+    return tree
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    max_entries = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    run(n, max_entries)
@@ -0,0 +1,55 @@
+import unittest
+
+from db_intro_hw.hw2 import Record
+from db_intro_hw.hw2.cormack import Cormack
+
+
+class CormackDuplicateInsertTest(unittest.TestCase):
+    def test_duplicate_insert_keeps_bucket(self):
+        # 3, 10 and 17 share bucket 3 of the 7-entry directory
+        cormack = Cormack()
+        for key in [3, 10, 17]:
+            cormack.insert(Record(key, key))
+
+        with self.assertRaises(Exception):
+            cormack.insert(Record(10, "again"))
+
+        for key in [3, 10, 17]:
+            found = cormack.lookup(key)
+            self.assertIsNotNone(found)
+            self.assertEqual(found.data, key)
+        self.assertEqual(cormack.n_records, 3)
+
+    def test_equal_hashes_keep_bucket(self):
+        # distinct keys with the same hash can't be perfect-hashed apart
+        cormack = Cormack(hash_fn=lambda key: key % 1000)
+        for key in [1, 8]:
+            cormack.insert(Record(key, key))
+
+        with self.assertRaises(Exception):
+            cormack.insert(Record(1001, 1001))
+
+        for key in [1, 8]:
+            self.assertEqual(cormack.lookup(key).data, key)
+
+    def test_resize_keeps_records(self):
+        cormack = Cormack(directory_size=1, max_bucket_load=2.0)
+        keys = list(range(0, 3000, 7))
+        for key in keys:
+            cormack.insert(Record(key, key))
+        self.assertGreater(cormack.directory_size, 1)
+        for key in keys:
+            self.assertEqual(cormack.lookup(key).data, key)
+
+
+    def test_lookup_missing_key(self):
+        cormack = Cormack()
+        for key in [3, 10, 17]:
+            cormack.insert(Record(key, key))
+        # 24 hashes into the same bucket, 5 into an empty one
+        self.assertIsNone(cormack.lookup(24))
+        self.assertIsNone(cormack.lookup(5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+
+from db_intro_hw.hw2 import Record
+from db_intro_hw.hw2.fagin import Fagin
+
+
+class FaginInseparableKeysTest(unittest.TestCase):
+    def test_rejects_before_doubling(self):
+        # the hashes first differ at bit 40, a directory of 2**41 slots would be needed
+        fagin = Fagin()
+        keys = [i << 40 for i in range(4)]
+        for key in keys[:3]:
+            fagin.insert(Record(key, key))
+
+        with self.assertRaises(Exception):
+            fagin.insert(Record(keys[3], keys[3]))
+        self.assertEqual(fagin.global_depth, 0)
+        for key in keys[:3]:
+            self.assertEqual(fagin.find(key).data, key)
+
+    def test_separates_within_limit(self):
+        # the hashes first differ at bit 16, well within MAX_GLOBAL_DEPTH
+        keys = [i << 16 for i in range(4)]
+        fagin = Fagin()
+        for key in keys:
+            fagin.insert(Record(key, key))
+        self.assertEqual(fagin.global_depth, 17)
+        for key in keys:
+            self.assertEqual(fagin.find(key).data, key)
+
+
+if __name__ == "__main__":
+    unittest.main()
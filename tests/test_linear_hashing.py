@@ -0,0 +1,45 @@
+import unittest
+
+from db_intro_hw.hw2 import Record
+from db_intro_hw.hw2.linear_hashing import LinearHashing
+
+
+class StaleLocks(list):
+    """Lock list, whose first read of 'idx' returns the lock and then merges and splits the last bucket,
+    as if another thread did so right after this thread read the lock"""
+
+    def __init__(self, table: LinearHashing, idx: int):
+        assert table.locks is not None
+        super().__init__(table.locks)
+        self.table, self.idx, self.fired = table, idx, False
+
+    def __getitem__(self, i):
+        lock = super().__getitem__(i)
+        if i == self.idx and not self.fired:
+            self.fired = True
+            self.table.merge()
+            self.table.split()
+        return lock
+
+
+class LinearHashingLockTest(unittest.TestCase):
+    def test_lock_dropped_by_merge_is_not_used(self):
+        table = LinearHashing(thread_safe=True)
+        for key in range(20):
+            table.insert(Record(key, key))
+        last = len(table.buckets) - 1
+        key = next(k for k in range(20) if table.h(k) == last)
+        assert table.locks is not None
+        stale = table.locks[last]
+        table.locks = StaleLocks(table, last)
+
+        with table.lock_bucket(key) as idx:
+            self.assertEqual(idx, last)
+            self.assertIsNot(table.locks[idx], stale)
+            self.assertTrue(table.locks[idx].locked())
+        self.assertFalse(stale.locked())
+        self.assertEqual(table.find(key).data, key)
+
+
+if __name__ == "__main__":
+    unittest.main()